@@ -0,0 +1,324 @@
+# Single-pass dataset analysis: node distribution, ontology coverage and per-row path coverage
+#
+# Rows are streamed once and folded into DatasetStats, whose size grows with the number of distinct
+# nodes, never with the number of rows. Several files (e.g. the segment outputs) are analysed as
+# shards in a process pool and their stats merged. The result is a JSON report; the distribution,
+# node coverage and path coverage scripts in this directory print sections of it.
+#
+# As with read_dataset(), a parsed_output that fails ParsedOutput validation makes its row invalid:
+# it is counted in invalid_rows and left out of every analysis.
+
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from constants.ontology_index import ontology_index
+from utils.dataset_reader import _validate_parsed_output, iter_records
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ('attributes', 'exposures', 'tickers', 'asset_types', 'sebi', 'vehicles', 'objectives')
+# Ontology root of each category; tickers name securities rather than ontology paths
+ONTOLOGY_ROOTS = {
+    'attributes': 'attribute',
+    'exposures': 'exposure',
+    'asset_types': 'asset_type',
+    'sebi': 'sebi_classification',
+    'vehicles': 'vehicle',
+    'objectives': 'objective'
+}
+# original_path keys -> category
+ORIGINAL_PATH_CATEGORIES = {**{root: category for category, root in ONTOLOGY_ROOTS.items()}, 'ticker': 'tickers'}
+
+ANALYSIS_PROCESSES = int(os.getenv('ANALYSIS_PROCESSES', str(os.cpu_count() or 1)))
+ANALYSIS_REPORT = os.getenv('ANALYSIS_REPORT', 'analysis_report.json')
+# Error messages kept in a report; the rest are only counted
+MAX_ERROR_SAMPLES = 20
+
+PATH_COVERAGE_FIELDNAMES = ['row_number', 'original_path', 'matched_paths', 'parsed_output', 'analysis_results']
+
+
+def _add_nodes(nodes: Dict[str, Set[str]], parsed: Dict[str, Any]):
+    for category in CATEGORIES:
+        key = 'name' if category == 'tickers' else 'node'
+        for item in parsed.get(category) or ():
+            if isinstance(item, dict) and item.get(key):
+                nodes[category].add(item[key])
+
+
+def nodes_by_category(parsed: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """Nodes of a parsed output per category (tickers by name)"""
+    nodes = {category: set() for category in CATEGORIES}
+    _add_nodes(nodes, parsed)
+    return nodes
+
+
+def validated_nodes(parsed: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """nodes_by_category() of a parsed output that passes ParsedOutput validation; raises otherwise"""
+    return nodes_by_category(_validate_parsed_output(parsed))
+
+
+def original_path_nodes(original_path: Dict[str, List[str]]) -> Dict[str, Set[str]]:
+    nodes = {category: set() for category in CATEGORIES}
+    for key, paths in original_path.items():
+        if key in ORIGINAL_PATH_CATEGORIES:
+            nodes[ORIGINAL_PATH_CATEGORIES[key]].update(paths)
+    return nodes
+
+
+def matched_path_nodes(matched_paths: Dict[str, Any]) -> Dict[str, Set[str]]:
+    nodes = {category: set() for category in CATEGORIES}
+    for combination in matched_paths['combinations']:
+        _add_nodes(nodes, combination)
+    return nodes
+
+
+def format_coverage_analysis(row_idx: int, original_nodes: Dict[str, Set[str]],
+                             matched_nodes: Dict[str, Set[str]],
+                             parsed_nodes: Dict[str, Set[str]]) -> str:
+    """Format the coverage analysis of one row as readable text"""
+    lines = [f"Analysis for Row {row_idx}:"]
+    lines.append("=" * 50)
+
+    for category in CATEGORIES:
+        orig_paths = original_nodes[category]
+        matched_paths = matched_nodes[category]
+        parsed_paths = parsed_nodes[category]
+
+        if orig_paths or matched_paths:  # Only analyze categories that have paths
+            lines.append(f"\n{category.upper()}:")
+            lines.append("-" * 30)
+
+            missing_from_parsed = orig_paths - parsed_paths
+            if missing_from_parsed:
+                lines.append("\nOriginal paths missing from parsed output:")
+                for path in sorted(missing_from_parsed):
+                    lines.append(f"  - {path}")
+
+            missing_from_parsed = matched_paths - parsed_paths
+            if missing_from_parsed:
+                lines.append("\nMatched paths missing from parsed output:")
+                for path in sorted(missing_from_parsed):
+                    lines.append(f"  - {path}")
+
+    return "\n".join(lines)
+
+
+class _CellNodes:
+    """Nodes of a cell per column, reusing the previous row's result when the cell repeats (the rows
+    of a path share its original_path and matched_paths); Parquet cells arrive decoded already"""
+
+    def __init__(self):
+        self._last: Dict[str, Tuple[Any, Dict[str, Set[str]]]] = {}
+
+    def __call__(self, name: str, value: Any, extract: Callable[[Any], Dict[str, Set[str]]]) -> Dict[str, Set[str]]:
+        last = self._last.get(name)
+        if last is not None and last[0] == value:
+            return last[1]
+        nodes = extract(json.loads(value) if isinstance(value, str) else value)
+        self._last[name] = (value, nodes)
+        return nodes
+
+
+class DatasetStats:
+    """Counters from one pass over one or more files; merge() combines the stats of shards"""
+
+    def __init__(self):
+        self.files: List[str] = []
+        self.rows = 0
+        self.invalid_rows = 0
+        self.errors: List[str] = []
+        self.distribution = {category: Counter() for category in CATEGORIES}
+        # Rows whose original and matched paths were checked against their parsed output
+        self.rows_checked = 0
+        self.rows_covered = 0
+        self.missing_original = {category: Counter() for category in CATEGORIES}
+        self.missing_matched = {category: Counter() for category in CATEGORIES}
+
+    def add_error(self, message: str):
+        self.invalid_rows += 1
+        if len(self.errors) < MAX_ERROR_SAMPLES:
+            self.errors.append(message)
+
+    def add_parsed_nodes(self, parsed_nodes: Dict[str, Set[str]]):
+        self.rows += 1
+        for category, nodes in parsed_nodes.items():
+            self.distribution[category].update(nodes)
+
+    def add_coverage(
+        self,
+        original_nodes: Dict[str, Set[str]],
+        matched_nodes: Dict[str, Set[str]],
+        parsed_nodes: Dict[str, Set[str]]
+    ):
+        self.rows_checked += 1
+        covered = True
+        for category in CATEGORIES:
+            missing_original = original_nodes[category] - parsed_nodes[category]
+            missing_matched = matched_nodes[category] - parsed_nodes[category]
+            self.missing_original[category].update(missing_original)
+            self.missing_matched[category].update(missing_matched)
+            covered = covered and not missing_original and not missing_matched
+        self.rows_covered += covered
+
+    def merge(self, other: 'DatasetStats'):
+        self.files.extend(other.files)
+        self.rows += other.rows
+        self.invalid_rows += other.invalid_rows
+        self.errors.extend(other.errors[:max(0, MAX_ERROR_SAMPLES - len(self.errors))])
+        self.rows_checked += other.rows_checked
+        self.rows_covered += other.rows_covered
+        for category in CATEGORIES:
+            self.distribution[category].update(other.distribution[category])
+            self.missing_original[category].update(other.missing_original[category])
+            self.missing_matched[category].update(other.missing_matched[category])
+
+    def ontology_coverage(self) -> Dict[str, Dict[str, Any]]:
+        """Per category: how many of the ontology's listed paths the dataset uses, which it misses,
+        and which nodes it uses that the ontology does not list"""
+        coverage = {}
+        for category, root in ONTOLOGY_ROOTS.items():
+            found = self.distribution[category]
+            listed = ontology_index.listed_paths(root)
+            covered = sum(1 for node in listed if node in found)
+            coverage[category] = {
+                'total': len(listed),
+                'covered': covered,
+                'coverage': round(covered / len(listed) * 100, 2) if listed else 0,
+                'missing': sorted(node for node in listed if node not in found),
+                'unknown': sorted(node for node in found if node not in ontology_index)
+            }
+        return coverage
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'files': self.files,
+            # Valid rows, which every section below counts; invalid rows are left out of them
+            'rows': self.rows,
+            'invalid_rows': self.invalid_rows,
+            'errors': self.errors,
+            # Rows mentioning each node, most frequent first
+            'distribution': {
+                category: dict(counts.most_common()) for category, counts in self.distribution.items()
+            },
+            'ontology_coverage': self.ontology_coverage(),
+            'path_coverage': {
+                'rows_checked': self.rows_checked,
+                'rows_covered': self.rows_covered,
+                # Rows whose parsed output misses each node of their original / matched paths
+                'missing_original': {
+                    category: dict(counts.most_common()) for category, counts in self.missing_original.items() if counts
+                },
+                'missing_matched': {
+                    category: dict(counts.most_common()) for category, counts in self.missing_matched.items() if counts
+                }
+            }
+        }
+
+
+def _cell_text(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def analyze_file(file_path: str, rows_output: Optional[str] = None, validate: bool = True) -> DatasetStats:
+    """Stream one file (CSV or Parquet, either layout) through the analysis.
+
+    With rows_output, the coverage analysis of every row is written there as CSV. validate=False
+    skips ParsedOutput validation and counts any parsed_output that decodes.
+    """
+    extract_parsed = validated_nodes if validate else nodes_by_category
+    stats = DatasetStats()
+    stats.files.append(file_path)
+    cell_nodes = _CellNodes()
+    output = open(rows_output, 'w', newline='', encoding='utf-8') if rows_output else None
+    try:
+        writer = csv.writer(output) if output else None
+        if writer:
+            writer.writerow(PATH_COVERAGE_FIELDNAMES)
+        for row_idx, record in enumerate(iter_records(file_path), start=1):
+            try:
+                parsed_nodes = cell_nodes('parsed_output', record['parsed_output'], extract_parsed)
+            except ImportError:
+                # A missing pydantic is an environment problem, not a bad row
+                raise
+            except Exception as e:
+                stats.add_error(f"{file_path} row {row_idx}: {type(e).__name__}: {str(e)}")
+                continue
+            stats.add_parsed_nodes(parsed_nodes)
+            # Evaluation datasets have no original or matched paths, only the distribution applies
+            if not record.get('original_path') or not record.get('matched_paths'):
+                continue
+            try:
+                original_nodes = cell_nodes('original_path', record['original_path'], original_path_nodes)
+                matched_nodes = cell_nodes('matched_paths', record['matched_paths'], matched_path_nodes)
+            except Exception as e:
+                stats.add_error(f"{file_path} row {row_idx}: {type(e).__name__}: {str(e)}")
+                continue
+            stats.add_coverage(original_nodes, matched_nodes, parsed_nodes)
+            if writer:
+                writer.writerow([
+                    row_idx,
+                    _cell_text(record['original_path']),
+                    _cell_text(record['matched_paths']),
+                    _cell_text(record['parsed_output']),
+                    format_coverage_analysis(row_idx, original_nodes, matched_nodes, parsed_nodes)
+                ])
+    finally:
+        if output:
+            output.close()
+    return stats
+
+
+def rows_output_path(file_path: str, rows_dir: str) -> str:
+    name = os.path.splitext(os.path.basename(file_path.rstrip(os.sep)))[0]
+    return os.path.join(rows_dir, f"{name}_path_coverage.csv")
+
+
+def _analyze_shard(task: Tuple[str, Optional[str]]) -> DatasetStats:
+    return analyze_file(*task)
+
+
+def analyze_files(
+    file_paths: Iterable[str],
+    processes: int = ANALYSIS_PROCESSES,
+    rows_dir: Optional[str] = None
+) -> DatasetStats:
+    """Analyse each file as a shard, in a pool of `processes` workers, and merge the stats in file
+    order. Files rather than byte ranges are the shards, as quoted CSV cells can span lines.
+
+    With rows_dir, each file's per-row coverage goes to <rows_dir>/<name>_path_coverage.csv.
+    """
+    if rows_dir:
+        os.makedirs(rows_dir, exist_ok=True)
+    tasks = [(file_path, rows_output_path(file_path, rows_dir) if rows_dir else None) for file_path in file_paths]
+    stats = DatasetStats()
+    if processes <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            stats.merge(_analyze_shard(task))
+        return stats
+    with Pool(min(processes, len(tasks))) as pool:
+        for shard_stats in pool.imap(_analyze_shard, tasks):
+            stats.merge(shard_stats)
+    return stats
+
+
+def write_report(report: Dict[str, Any], output_path: str = ANALYSIS_REPORT):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    # python -m analysis.dataset_analyzer datasets/parser_dataset_segment_*.csv
+    # ANALYSIS_REPORT names the JSON report; ANALYSIS_ROWS_DIR also writes per-row path coverage
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    stats = analyze_files(sys.argv[1:], rows_dir=os.getenv('ANALYSIS_ROWS_DIR'))
+    write_report(stats.report(), ANALYSIS_REPORT)
+    logger.info(f"Analysed {stats.rows} rows ({stats.invalid_rows} invalid) from {len(stats.files)} files "
+                f"in {time.perf_counter() - start:.2f}s; report saved to {ANALYSIS_REPORT}")
@@ -1,122 +1,43 @@
-import json
-import csv
-from constants.constants import (
-    exposure,
-    attribute,
-    vehicle,
-    asset_type,
-    sebi_classification as sebi,
-    objective
-)
+import logging
 
-def analyze_node_coverage(dataset):
-    # Initialize sets to track unique nodes found in dataset
-    found_nodes = {
-        'attributes': set(),
-        'exposures': set(),
-        'tickers': set(),
-        'asset_types': set(),
-        'sebi': set(),
-        'vehicles': set(),
-        'objectives': set()
-    }
-    
-    # Process each row in dataset
-    for i, row in enumerate(dataset):
-        try:
-            if len(row) < 2:
-                print(f"Warning: Row {i} does not have enough columns: {row}")
-                continue
-                
-            try:
-                data = json.loads(row[4])
-            except json.JSONDecodeError as e:
-                print(f"Warning: Invalid JSON in row {i}: {row[4]}")
-                continue
-            
-            # Collect unique nodes from each category
-            for attr in data.get('attributes', []):
-                node = attr.get('node')
-                if node:
-                    found_nodes['attributes'].add(node)
-                
-            for exp in data.get('exposures', []):
-                node = exp.get('node')
-                if node:
-                    found_nodes['exposures'].add(node)
-
-            for ticker in data.get('tickers', []):
-                node = ticker.get('name')
-                if node:
-                    found_nodes['tickers'].add(node)
-
-            for asset_type_item in data.get('asset_types', []):
-                node = asset_type_item.get('node')
-                if node:
-                    found_nodes['asset_types'].add(node)
-
-            for sebi_item in data.get('sebi', []):
-                node = sebi_item.get('node')
-                if node:
-                    found_nodes['sebi'].add(node)
+from analysis.dataset_analyzer import analyze_file
 
-            for vehicle_item in data.get('vehicles', []):
-                node = vehicle_item.get('node')
-                if node:
-                    found_nodes['vehicles'].add(node)
+logger = logging.getLogger(__name__)
 
-            for objective_item in data.get('objectives', []):
-                node = objective_item.get('node')
-                if node:
-                    found_nodes['objectives'].add(node)
-                    
-        except Exception as e:
-            print(f"Error processing row {i}: {str(e)}")
-            continue
-
-    # Compare with constants and print coverage
+def print_node_coverage(report):
+    # Compare with the ontology and print coverage
     print("\nNode Coverage Analysis")
     print("=" * 50)
     
-    # Map of category names to their constant lists
-    constant_maps = {
-        'attributes': attribute,
-        'exposures': exposure,
-        'asset_types': asset_type,
-        'sebi': sebi,
-        'vehicles': vehicle,
-        'objectives': objective
-    }
-    
-    # Analyze coverage for each category
-    for category, constant_list in constant_maps.items():
-        found = found_nodes[category]
-        total_nodes = len(constant_list)
-        covered_nodes = len([node for node in constant_list if node in found])
-        coverage_percent = (covered_nodes / total_nodes * 100) if total_nodes > 0 else 0
-        
+    for category, coverage in report['ontology_coverage'].items():
         print(f"\n{category.upper()}")
         print("-" * 30)
-        print(f"Total nodes in constants: {total_nodes}")
-        print(f"Nodes found in dataset: {covered_nodes}")
-        print(f"Coverage: {coverage_percent:.1f}%")
+        print(f"Total nodes in constants: {coverage['total']}")
+        print(f"Nodes found in dataset: {coverage['covered']}")
+        print(f"Coverage: {coverage['coverage']:.1f}%")
         
         # Print missing nodes
-        missing_nodes = set(constant_list) - found
-        if missing_nodes:
+        if coverage['missing']:
             print("\nMissing nodes:")
-            for node in sorted(missing_nodes):
+            for node in coverage['missing']:
                 print(f"  - {node}")
 
-    return found_nodes
+        # Print nodes the dataset uses that the ontology does not list
+        if coverage['unknown']:
+            print("\nNodes not in ontology:")
+            for node in coverage['unknown']:
+                print(f"  - {node}")
 
 def process_parser_dataset(input_file):
-    with open(input_file, 'r') as f:
-        reader = csv.reader(f)
-        dataset = list(reader)
+    # One streaming pass; see analysis/dataset_analyzer.py for the full report
+    report = analyze_file(input_file).report()
+    for error in report['errors']:
+        logger.warning(error)
     
-    found_nodes = analyze_node_coverage(dataset)
-    return found_nodes
+    print_node_coverage(report)
+    return report['ontology_coverage']
 
-# Run analysis
-process_parser_dataset('datasets/855_parser_dataset.csv')
+if __name__ == "__main__":
+    # Run analysis (from the repo root: python -m analysis.node_analysis)
+    logging.basicConfig(level=logging.INFO)
+    process_parser_dataset('datasets/855_parser_dataset.csv')
@@ -1,4 +1,5 @@
 import csv
+import os
 
 exposure = [
     "exposure/factor",
@@ -430,9 +431,38 @@ objective = [
     "objective/custom"
 ]
 
-with open('constants/security_universe_india.csv', 'r') as csvfile:
-    reader = csv.reader(csvfile)
-    securities_names = [row[1] for row in reader][1:]
+# Node lists by ontology category, in the order prompts present them
+ONTOLOGY = {
+    'attribute': attribute,
+    'exposure': exposure,
+    'asset_type': asset_type,
+    'sebi_classification': sebi_classification,
+    'vehicle': vehicle,
+    'objective': objective,
+}
+
+SECURITIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'security_universe_india.csv')
+_securities_names = None
+
+def load_securities_names():
+    """Security names from the universe CSV, read on first use (from the startup bundle when one is fresh)"""
+    global _securities_names
+    if _securities_names is None:
+        from utils.bundle import load_bundle
+        bundle = load_bundle()
+        if bundle is not None:
+            _securities_names = bundle['securities_names']
+        else:
+            with open(SECURITIES_FILE, 'r') as csvfile:
+                reader = csv.reader(csvfile)
+                _securities_names = [row[1] for row in reader][1:]
+    return _securities_names
+
+def __getattr__(name):
+    # Keeps `from constants.constants import securities_names` working without reading the CSV at import
+    if name == 'securities_names':
+        return load_securities_names()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def count_paths_with_depth():
     total = 0
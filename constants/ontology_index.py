@@ -0,0 +1,295 @@
+# Immutable trie over the ontology lists in constants.py, with integer node ids
+#
+# Build the binary index with `python -m constants.ontology_index` (utils/bundle.py also embeds it in
+# the startup bundle). Importing this module only reads those files; without them it builds the trie
+# in memory and writes nothing.
+
+import hashlib
+import json
+import logging
+import os
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from constants.constants import ONTOLOGY
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ontology_index.bin')
+_MAGIC = b'ONTX'
+_VERSION = 2
+_HEADER = '<4sII32sIII'
+
+
+def ontology_fingerprint(ontology: Dict[str, List[str]] = ONTOLOGY) -> bytes:
+    """Hash of the ontology lists, stored in the binary file to detect stale indexes"""
+    return hashlib.sha256(json.dumps(ontology, sort_keys=True).encode('utf-8')).digest()
+
+
+class OntologyIndex:
+    """Trie of every ontology path and its implicit ancestors, numbered in depth-first preorder.
+
+    Preorder numbering makes each subtree the contiguous id range [id, subtree_end[id]), so
+    descendant checks are two comparisons. Lowest common ancestors use an Euler tour with a
+    sparse table, so every query here is O(1).
+    """
+
+    def __init__(self, paths: List[str], parent: array, depth: array, subtree_end: array, listed: bytearray,
+                 derived: Optional[Tuple[array, array, array, List[array]]] = None):
+        self.paths = paths
+        self.parent_ids = parent
+        self.depths = depth
+        self.subtree_end = subtree_end
+        self.listed = listed
+        self.ids: Dict[str, int] = {path: node_id for node_id, path in enumerate(paths)}
+
+        # from_bytes() passes the child arrays and LCA tables it read, so loading computes nothing
+        if derived is not None:
+            self.child_start, self.child_ids, self._first, self._sparse = derived
+            self._euler = self._sparse[0]
+            return
+
+        # Children in CSR form: children of n are child_ids[child_start[n]:child_start[n + 1]]
+        counts = [0] * (len(paths) + 1)
+        for node_id in range(len(paths)):
+            if parent[node_id] >= 0:
+                counts[parent[node_id] + 1] += 1
+        for node_id in range(len(paths)):
+            counts[node_id + 1] += counts[node_id]
+        self.child_start = array('i', counts)
+        fill = list(counts[:-1])
+        self.child_ids = array('i', [0] * len(paths))
+        for node_id in range(len(paths)):
+            if parent[node_id] >= 0:
+                self.child_ids[fill[parent[node_id]]] = node_id
+                fill[parent[node_id]] += 1
+
+        self._build_lca()
+
+    @classmethod
+    def from_lists(cls, ontology: Dict[str, List[str]] = ONTOLOGY) -> 'OntologyIndex':
+        """Build the trie; children keep the order in which the lists first mention them"""
+        tree: Dict[str, dict] = {}
+        listed_paths = set()
+        for category, category_paths in ontology.items():
+            node = tree.setdefault(category, {})
+            for path in category_paths:
+                listed_paths.add(path)
+                node = tree
+                for segment in path.split('/'):
+                    node = node.setdefault(segment, {})
+
+        paths: List[str] = []
+        parent = array('i')
+        depth = array('i')
+        subtree_end = array('i')
+        stack = [(name, child, -1, 0, name) for name, child in reversed(list(tree.items()))]
+        pending_ends = []
+        while stack:
+            name, children, parent_id, node_depth, path = stack.pop()
+            # Close subtrees that ended before this node
+            while pending_ends and depth[pending_ends[-1]] >= node_depth:
+                subtree_end[pending_ends.pop()] = len(paths)
+            node_id = len(paths)
+            paths.append(path)
+            parent.append(parent_id)
+            depth.append(node_depth)
+            subtree_end.append(0)
+            pending_ends.append(node_id)
+            for child_name, grandchildren in reversed(list(children.items())):
+                stack.append((child_name, grandchildren, node_id, node_depth + 1, f"{path}/{child_name}"))
+        while pending_ends:
+            subtree_end[pending_ends.pop()] = len(paths)
+
+        listed = bytearray(1 if path in listed_paths else 0 for path in paths)
+        return cls(paths, parent, depth, subtree_end, listed)
+
+    def _build_lca(self):
+        # Euler tour of a forest: a virtual root (-1) joins the category tries
+        euler = array('i')
+        first = array('i', [0] * len(self.paths))
+        stack = [(-1, iter(self.roots()))]
+        euler.append(-1)
+        while stack:
+            node_id, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                if stack:
+                    euler.append(stack[-1][0])
+                continue
+            first[child] = len(euler)
+            euler.append(child)
+            stack.append((child, iter(self.children(child))))
+        self._euler = euler
+        self._first = first
+        # sparse[k][i] = shallowest node in euler[i:i + 2**k]
+        self._sparse = [euler]
+        span = 1
+        while span * 2 <= len(euler):
+            previous = self._sparse[-1]
+            self._sparse.append(array('i', (
+                min(previous[i], previous[i + span], key=self._euler_depth)
+                for i in range(len(euler) - span * 2 + 1)
+            )))
+            span *= 2
+
+    def _euler_depth(self, node_id: int) -> int:
+        return -1 if node_id < 0 else self.depths[node_id]
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, path: str) -> bool:
+        """True for paths listed in constants.py (not implicit ancestors such as category roots)"""
+        node_id = self.ids.get(path)
+        return node_id is not None and bool(self.listed[node_id])
+
+    def id_of(self, path: str) -> Optional[int]:
+        return self.ids.get(path)
+
+    def path_of(self, node_id: int) -> str:
+        return self.paths[node_id]
+
+    def is_listed(self, node_id: int) -> bool:
+        return bool(self.listed[node_id])
+
+    def parent(self, node_id: int) -> Optional[int]:
+        parent_id = self.parent_ids[node_id]
+        return None if parent_id < 0 else parent_id
+
+    def children(self, node_id: int) -> array:
+        return self.child_ids[self.child_start[node_id]:self.child_start[node_id + 1]]
+
+    def depth(self, node_id: int) -> int:
+        """0 for category roots such as 'exposure'"""
+        return self.depths[node_id]
+
+    def subtree(self, node_id: int) -> range:
+        """Ids of the node and all of its descendants"""
+        return range(node_id, self.subtree_end[node_id])
+
+    def is_ancestor(self, ancestor_id: int, node_id: int) -> bool:
+        """True if ancestor_id is node_id or one of its ancestors"""
+        return ancestor_id <= node_id < self.subtree_end[ancestor_id]
+
+    def ancestors(self, node_id: int) -> Iterator[int]:
+        """Proper ancestors, nearest first"""
+        parent_id = self.parent_ids[node_id]
+        while parent_id >= 0:
+            yield parent_id
+            parent_id = self.parent_ids[parent_id]
+
+    def category(self, node_id: int) -> str:
+        return self.paths[node_id].split('/', 1)[0]
+
+    def roots(self) -> List[int]:
+        return [node_id for node_id in range(len(self.paths)) if self.parent_ids[node_id] < 0]
+
+    def lca(self, a: int, b: int) -> Optional[int]:
+        """Lowest common ancestor, or None for nodes in different categories"""
+        left, right = sorted((self._first[a], self._first[b]))
+        level = (right - left + 1).bit_length() - 1
+        table = self._sparse[level]
+        node_id = min(table[left], table[right - (1 << level) + 1], key=self._euler_depth)
+        return None if node_id < 0 else node_id
+
+    def listed_paths(self, category: str) -> List[str]:
+        """Listed paths of a category in trie (preorder) order"""
+        root = self.ids[category]
+        return [self.paths[node_id] for node_id in self.subtree(root) if self.listed[node_id]]
+
+    def to_bytes(self, fingerprint: bytes = b'') -> bytes:
+        """Compact binary form: header, int32 arrays (including the child arrays and the LCA sparse
+        table), flags, then the newline-joined names"""
+        names = "\n".join(self.paths).encode('utf-8')
+        header = struct.pack(
+            _HEADER, _MAGIC, _VERSION, len(self.paths), fingerprint.ljust(32, b'\0')[:32], len(names),
+            len(self._euler), len(self._sparse)
+        )
+        arrays = b''.join(array('i', values).tobytes() for values in (
+            self.parent_ids, self.depths, self.subtree_end, self.child_start, self.child_ids, self._first,
+            *self._sparse
+        ))
+        return header + arrays + bytes(self.listed) + names
+
+    @classmethod
+    def from_bytes(cls, data: bytes, fingerprint: Optional[bytes] = None) -> Optional['OntologyIndex']:
+        """Read an index written by to_bytes(); None if malformed or built from other lists"""
+        try:
+            magic, version, count, stored_fingerprint, names_size, euler_size, levels = struct.unpack_from(_HEADER, data)
+            if magic != _MAGIC or version != _VERSION:
+                return None
+            if fingerprint is not None and stored_fingerprint != fingerprint.ljust(32, b'\0')[:32]:
+                return None
+            # parent, depth, subtree_end, child_start, child_ids, first, then sparse level k (level 0 is
+            # the Euler tour itself) holding one entry per window of 2**k tour positions
+            sizes = [count, count, count, count + 1, count, count]
+            sizes += [euler_size - (1 << level) + 1 for level in range(levels)]
+            offset = struct.calcsize(_HEADER)
+            # A truncated file (a crash mid-write) would leave the arrays short
+            if min(sizes) < 0 or len(data) != offset + 4 * sum(sizes) + count + names_size:
+                return None
+            arrays = []
+            for size in sizes:
+                values = array('i')
+                values.frombytes(data[offset:offset + 4 * size])
+                arrays.append(values)
+                offset += 4 * size
+            listed = bytearray(data[offset:offset + count])
+            offset += count
+            paths = data[offset:offset + names_size].decode('utf-8').split("\n")
+        except (struct.error, ValueError, UnicodeDecodeError):
+            return None
+        return cls(paths, arrays[0], arrays[1], arrays[2], listed, (arrays[3], arrays[4], arrays[5], arrays[6:]))
+
+    def save(self, file_path: str = INDEX_FILE, fingerprint: bytes = b''):
+        # Write then rename so concurrently starting workers never read a partial file
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(self.to_bytes(fingerprint))
+        os.replace(temp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path: str = INDEX_FILE, fingerprint: Optional[bytes] = None) -> Optional['OntologyIndex']:
+        """Read an index written by save(); None if missing, malformed or built from other lists"""
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        return cls.from_bytes(data, fingerprint)
+
+
+def load_ontology_index(file_path: str = INDEX_FILE) -> OntologyIndex:
+    """Load the index from the startup bundle or its binary file, rebuilding it in memory when stale
+    or missing (build_ontology_index() writes the file)"""
+    from utils.bundle import load_bundle
+    fingerprint = ontology_fingerprint()
+    bundle = load_bundle()
+    index = None
+    if bundle is not None:
+        index = OntologyIndex.from_bytes(bundle['ontology_index'], fingerprint)
+    if index is None:
+        index = OntologyIndex.load(file_path, fingerprint)
+    if index is None:
+        logger.info(f"No current ontology index at {file_path}; run `python -m constants.ontology_index` to build it")
+        index = OntologyIndex.from_lists()
+    return index
+
+
+def build_ontology_index(file_path: str = INDEX_FILE) -> OntologyIndex:
+    """Rebuild the index from the ontology lists and write it to `file_path`"""
+    index = OntologyIndex.from_lists()
+    index.save(file_path, ontology_fingerprint())
+    logger.info(f"Wrote ontology index to {file_path}")
+    return index
+
+
+ontology_index = load_ontology_index()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_ontology_index()
@@ -1,28 +1,35 @@
 import json
-import pandas as pd
-from typing import Dict, List, Set
+from typing import Any, Dict, List, Optional, Set
 
-def extract_nodes_from_json(json_str: str) -> Set[str]:
+from utils.dataset_reader import read_dataset
+
+def load_parsed_output(json_str: str) -> Any:
+    """
+    Decode a response cell: strip a leading '###' marker and unwrap the parsed_output field if present
+    """
+    # Remove '###\n' if present at the start
+    if json_str.startswith('###'):
+        json_str = json_str.split('###\n', 1)[1]
+    data = json.loads(json_str)
+    
+    # If the data has parsed_output field, use that
+    if isinstance(data, dict) and 'parsed_output' in data:
+        return data['parsed_output']
+    return data
+
+EVAL_PARSERS = {
+    'generated_response': load_parsed_output,
+    'original_parsed_output': load_parsed_output
+}
+
+def extract_nodes_from_json(parsed_output: Optional[Any]) -> Set[str]:
     """
-    Extract all unique nodes from the parsed JSON output.
+    Extract all unique nodes from a decoded parsed output (None, for a cell that failed to decode, has none).
     Returns a set of node strings using just the node value
     """
+    if parsed_output is None:
+        return set()
     try:
-        # Clean up the input string if it's a string
-        if isinstance(json_str, str):
-            # Remove '###\n' if present at the start
-            if json_str.startswith('###'):
-                json_str = json_str.split('###\n', 1)[1]
-            data = json.loads(json_str)
-        else:
-            data = json_str
-            
-        # If the data has parsed_output field, use that
-        if isinstance(data, dict) and 'parsed_output' in data:
-            parsed_output = data['parsed_output']
-        else:
-            parsed_output = data
-        
         nodes = set()
         # Categories to check
         categories = ['attributes', 'exposures', 'tickers', 'asset_types', 'sebi', 'vehicles', 'objectives']
@@ -46,13 +53,9 @@ def extract_nodes_from_json(json_str: str) -> Set[str]:
         
         return nodes
         
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {e}")
-        print(f"Problematic string: {json_str}")
-        return set()
     except Exception as e:
         print(f"Error processing JSON: {e}")
-        print(f"Problematic data: {json_str}")
+        print(f"Problematic data: {parsed_output}")
         return set()
 
 def compare_nodes(generated: Set[str], original: Set[str]) -> Dict[str, Set[str]]:
@@ -69,8 +72,15 @@ def process_csv(input_file: str, output_file: str):
     """
     Process the CSV file and create an evaluation report with scoring
     """
-    # Read the CSV file
-    df = pd.read_csv(input_file)
+    # Read the CSV file; nodes are compared leniently, so cells are only decoded, not validated,
+    # and the raw cells are kept for the printout and the report
+    dataset = read_dataset(
+        input_file,
+        parsers=EVAL_PARSERS,
+        validate=(),
+        keep_raw=('generated_response', 'original_parsed_output')
+    )
+    df = dataset.to_frame(raw=True)
     
     # Create lists to store results
     matching_nodes = []
@@ -87,10 +97,12 @@ def process_csv(input_file: str, output_file: str):
     total_incorrect = 0
     
     # Process each row
-    for idx, row in df.iterrows():
+    for idx, row in enumerate(dataset.rows()):
         print(f"\n=== Row {idx} ===")
-        print("Generated Response (raw):", repr(row['generated_response']))
-        print("Original Output (raw):", repr(row['original_parsed_output']))
+        print("Generated Response (raw):", repr(dataset.raw['generated_response'][idx]))
+        print("Original Output (raw):", repr(dataset.raw['original_parsed_output'][idx]))
+        for column, error in dataset.errors.get(idx, {}).items():
+            print(f"Error decoding {column}: {error}")
         
         # Extract nodes from both outputs
         generated_nodes = extract_nodes_from_json(row['generated_response'])
@@ -1,6 +1,3 @@
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
 import json
 import logging
 from pydantic_models import (
@@ -10,17 +7,24 @@ from pydantic_models import (
     UserQueries,
     Reasoning,
     ParsedOutputCombinations,
-    ReasoningCombinations
+    ReasoningCombinations,
+    ParsedOutputReasonedCombinations
 )
 from structured_output import get_structured_openai_response
+import prompt
 from prompt import (
     PARSED_OUTPUT_SYSTEM_PROMPT_1,
     PARSED_OUTPUT_SYSTEM_PROMPT_2,
-    PARSED_OUTPUT_SYSTEM_PROMPT_3,
-    ONTOLOGY_MATCHING_PROMPT,
     NATURAL_QUERY_GENERATION_PROMPT,
-    REASONING_GENERATION_PROMPT
+    REASONING_GENERATION_PROMPT,
+    REASONING_BATCH_GENERATION_PROMPT,
+    PARSED_OUTPUT_BATCH_INSTRUCTIONS,
+    build_parsed_output_system_prompt,
+    build_ontology_matching_prompt
 )
+from constants.constants import load_securities_names
+from utils.security_index import TICKER_CANDIDATES, SecurityIndex
+from utils.ontology_retrieval import ontology_retriever
 from few_shot_examples import (
     parsed_output_combination,
     query_combination,
@@ -28,7 +32,6 @@ from few_shot_examples import (
     generated_reasoning
 )
 import asyncio
-from utils import rate_limiter
 
 # Configure logging
 logging.basicConfig(
@@ -37,16 +40,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+_security_index = None
 
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-)
+def get_security_index() -> SecurityIndex:
+    """Index over the securities universe, built on first use so importing this module stays cheap"""
+    global _security_index
+    if _security_index is None:
+        _security_index = SecurityIndex(load_securities_names())
+    return _security_index
+
+def _ontology_matching_prompt(path: str) -> str:
+    """Ontology matching prompt listing only the securities that look relevant to the path"""
+    security_index = get_security_index()
+    # Securities matching the path's segments below its category root (a sector or theme), topped up
+    # with a sample of the universe: the few-shot combinations carry tickers, so the model must
+    # always have real names to pick from
+    candidates = security_index.candidates([path.split('/', 1)[-1]], minimum=TICKER_CANDIDATES)
+    if candidates is security_index.names:
+        return prompt.ONTOLOGY_MATCHING_PROMPT
+    return build_ontology_matching_prompt(candidates)
+
+def _parse_system_prompt(items: list[tuple[str, str]]) -> str:
+    """Parse prompt listing only the securities and ontology branches relevant to the (query, reasoning) items"""
+    texts = [f"{query} {reasoning}" for query, reasoning in items]
+    security_index = get_security_index()
+    candidates = security_index.candidates(texts)
+    ontology = ontology_retriever.select(texts)
+    if candidates is security_index.names and ontology is ontology_retriever.ontology:
+        return prompt.PARSED_OUTPUT_SYSTEM_PROMPT_3
+    return build_parsed_output_system_prompt(candidates, ontology)
 
 async def get_matching_ontologies(path: str) -> ParsedOutputCombinations:
     logger.info(f"Getting matching ontologies for path: {path}")
     
-    system_prompt = ONTOLOGY_MATCHING_PROMPT
+    system_prompt = _ontology_matching_prompt(path)
     
     messages = [
         {"role": "system", "content": system_prompt},
@@ -56,7 +83,6 @@ async def get_matching_ontologies(path: str) -> ParsedOutputCombinations:
     ]
     
     return await get_structured_openai_response(
-        client=client,
         messages=messages,
         response_model=ParsedOutputCombinations,
         max_tokens=1500,
@@ -77,7 +103,6 @@ async def generate_natural_query(ontology_paths: ParsedOutputCombinations) -> Us
         ]
 
         return await get_structured_openai_response(
-            client=client,
             messages=messages,
             response_model=UserQueries,
             max_tokens=1500,
@@ -103,7 +128,6 @@ async def generate_reasoning(query: str) -> str:
     ]
 
     reasoning_response = await get_structured_openai_response(
-        client=client,
         messages=messages,
         response_model=Reasoning,
         max_tokens=1500,
@@ -111,10 +135,50 @@ async def generate_reasoning(query: str) -> str:
     )
     return reasoning_response.reasoning
 
+def _numbered_queries(queries: list[str]) -> str:
+    return "\n".join(f"{i + 1}. {query}" for i, query in enumerate(queries))
+
+async def generate_reasoning_batch(queries: list[str]) -> list[str]:
+    """Generate reasoning for several queries in one request.
+
+    The system prompt and few-shot turns are sent once for the whole batch. If the model
+    returns the wrong number of reasonings, the batch is split in half and retried.
+    """
+    if len(queries) == 1:
+        return [await generate_reasoning(queries[0])]
+
+    example_queries = [query.query for query in query_combination.queries]
+    messages = [
+        {"role": "system", "content": REASONING_BATCH_GENERATION_PROMPT},
+        {"role": "user", "content": f"Generate reasoning for each of these investment queries:\n{_numbered_queries(example_queries)}"},
+        {"role": "assistant", "content": json.dumps(generated_reasoning.model_dump())},
+        {"role": "user", "content": f"Generate reasoning for each of these investment queries:\n{_numbered_queries(queries)}"},
+    ]
+
+    reasoning_response = await get_structured_openai_response(
+        messages=messages,
+        response_model=ReasoningCombinations,
+        max_tokens=max(1500, 400 * len(queries)),
+        temperature=0.5
+    )
+
+    if len(reasoning_response.combinations) != len(queries):
+        logger.warning(
+            f"Reasoning batch returned {len(reasoning_response.combinations)} results for {len(queries)} queries, splitting batch"
+        )
+        middle = len(queries) // 2
+        first, second = await asyncio.gather(
+            generate_reasoning_batch(queries[:middle]),
+            generate_reasoning_batch(queries[middle:])
+        )
+        return first + second
+
+    return [combination.reasoning for combination in reasoning_response.combinations]
+
 async def generate_parsed_output_with_reasoning(query: str, reasoning: str) -> ParsedOutputReasoned:
     logger.info(f"Parsing query and reasoning into structured output")
     try:
-        system_prompt = PARSED_OUTPUT_SYSTEM_PROMPT_3
+        system_prompt = _parse_system_prompt([(query, reasoning)])
 
         messages = [
             {"role": "system", "content": system_prompt},
@@ -126,7 +190,6 @@ async def generate_parsed_output_with_reasoning(query: str, reasoning: str) -> P
         ]
 
         return await get_structured_openai_response(
-            client=client,
             messages=messages,
             response_model=ParsedOutputReasoned,
             max_tokens=1500,
@@ -140,6 +203,62 @@ async def generate_parsed_output_with_reasoning(query: str, reasoning: str) -> P
         raise
 
 
+async def generate_parsed_outputs_batch(items: list[tuple[str, str]]) -> list:
+    """Parse several (query, reasoning) pairs with one request.
+
+    The parse system prompt is paid once per batch. Outputs are aligned to items by their
+    index; items that are missing, duplicated or fail in the batch are retried as
+    single-item calls. Returns one entry per item, in order: a ParsedOutputReasoned, or the
+    exception if the single-item retry also failed.
+    """
+    results = [None] * len(items)
+
+    if len(items) > 1:
+        logger.info(f"Parsing {len(items)} queries in one batch")
+        numbered_items = "\n".join(
+            f"{i + 1}. Query: {query}\n   Reasoning: {reasoning}" for i, (query, reasoning) in enumerate(items)
+        )
+        messages = [
+            {"role": "system", "content": _parse_system_prompt(items) + PARSED_OUTPUT_BATCH_INSTRUCTIONS},
+            {"role": "user", "content": numbered_items}
+        ]
+        try:
+            batch_response = await get_structured_openai_response(
+                messages=messages,
+                response_model=ParsedOutputReasonedCombinations,
+                max_tokens=max(1500, 800 * len(items)),
+                temperature=0.6
+            )
+            seen = set()
+            for combination in batch_response.combinations:
+                position = combination.index - 1
+                if 0 <= position < len(items) and position not in seen:
+                    seen.add(position)
+                    results[position] = ParsedOutputReasoned(
+                        reasoning=combination.reasoning,
+                        parsed_output=combination.parsed_output
+                    )
+                else:
+                    # An index we cannot place means the batch alignment cannot be trusted
+                    logger.warning(f"Parse batch returned unexpected index {combination.index}, discarding batch")
+                    results = [None] * len(items)
+                    break
+        except Exception as e:
+            logger.error(f"Batched parse of {len(items)} queries failed, falling back to single calls: {str(e)}")
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing and len(items) > 1:
+        logger.warning(f"Retrying {len(missing)}/{len(items)} batch items as single parse calls")
+    retried = await asyncio.gather(
+        *(generate_parsed_output_with_reasoning(query=items[i][0], reasoning=items[i][1]) for i in missing),
+        return_exceptions=True
+    )
+    for i, result in zip(missing, retried):
+        results[i] = result
+
+    return results
+
+
 
 # asyncio.run(get_matching_ontologies("exposure/region/international"))
-# asyncio.run(generate_natural_query(parsed_output_combination))
\ No newline at end of file
+# asyncio.run(generate_natural_query(parsed_output_combination))
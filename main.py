@@ -1,10 +1,19 @@
 from generator import (
     generate_natural_query,
     generate_reasoning,
+    generate_reasoning_batch,
     get_matching_ontologies,
-    generate_parsed_output_with_reasoning
+    generate_parsed_output_with_reasoning,
+    generate_parsed_outputs_batch
 )
-from utils import rate_limiter
+from pydantic_models import ParsedOutputCombinations, ParsedOutputReasoned
+from structured_output import close_async_client, log_structured_output_stats
+from utils.llm_cache import llm_cache
+from utils.concurrency import concurrency_controller
+from pipeline import Stage, StagePipeline
+from utils.job_queue import JobQueue
+from utils.dataset_layout import close_sinks, dataset_sink
+from utils.resume import ResumeState, path_key, row_key
 
 from constants.constants import (
     exposure,
@@ -15,164 +24,383 @@ from constants.constants import (
     objective
 )
 
-import json
-import csv
 import os
 import logging
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import List, Tuple
-import time
+from typing import List, Tuple, Optional
+from dataclasses import dataclass
 import gc
+import sys
+from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
 
-def append_to_csv(file_path: str, data: dict):
-    """Append a row of data to CSV file"""
-    file_exists = os.path.isfile(file_path)
-    
-    # Clean the data and ensure proper JSON formatting
-    cleaned_data = {}
-    for k, v in data.items():
-        if isinstance(v, (dict, list)):
-            # First ensure all keys in nested structures are properly quoted
-            json_str = json.dumps(v, ensure_ascii=False)
-            # Parse and re-dump to ensure proper formatting
-            parsed_json = json.loads(json_str)
-            cleaned_data[k] = json.dumps(parsed_json, ensure_ascii=False)
-        else:
-            cleaned_data[k] = v
-    
-    with open(file_path, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['original_path', 'matched_paths', 'query', 'reasoning', 'parsed_output']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow(cleaned_data)
+load_dotenv()
 
-async def process_single_path(category: str, path: str, file_path: str):
-    """Process a single ontology path through the entire pipeline"""
+# Paths processed at once. Each path runs up to QUERY_CONCURRENCY queries at a time, so this can ask for
+# more requests than MAX_CONCURRENCY; the concurrency controller queues the excess
+PATH_CONCURRENCY = int(os.getenv('PATH_CONCURRENCY', str(concurrency_controller.max_limit)))
+PATH_TIMEOUT = int(os.getenv('PATH_TIMEOUT', '180'))
+MAX_PATH_ERRORS = 3  # Circuit breaker threshold
+# Queries of one path whose reasoning -> parse chains run at the same time
+QUERY_CONCURRENCY = int(os.getenv('QUERY_CONCURRENCY', '3'))
+# Queries sent per reasoning request; 1 keeps one request per query
+REASONING_BATCH_SIZE = int(os.getenv('REASONING_BATCH_SIZE', '1'))
+# (query, reasoning) pairs sent per parse request; 1 keeps one request per query
+PARSE_BATCH_SIZE = int(os.getenv('PARSE_BATCH_SIZE', '1'))
+
+# Claim paths from this shared SQLite job queue instead of taking a static SEGMENT_START/SEGMENT_SIZE slice
+JOB_QUEUE_DB = os.getenv('JOB_QUEUE_DB')
+
+# 'csv', or 'parquet' for typed nested columns (needs pyarrow; see utils/parquet_writer.py)
+OUTPUT_FORMAT = os.getenv('OUTPUT_FORMAT', 'csv')
+
+# 'paths' runs each path end to end in a worker pool, 'pipeline' overlaps the four LLM stages
+GENERATION_MODE = os.getenv('GENERATION_MODE', 'paths')
+# Per-stage worker counts for pipeline mode, e.g. "match=2,query=2,reasoning=6,parse=8"
+STAGE_WORKERS = dict(
+    (name, int(count)) for name, count in
+    (entry.split('=') for entry in os.getenv('STAGE_WORKERS', '').split(',') if entry)
+)
+
+# A unit of generation work: (category, path, output file)
+WorkItem = Tuple[str, str, str]
+
+async def _matched_ontology(state: ResumeState, category: str, path: str) -> Optional[ParsedOutputCombinations]:
+    """Matched ontology combinations for a path, from the resume sidecar when an earlier run saved them"""
+    saved = state.get('match', path_key(category, path))
+    if saved is not None:
+        return ParsedOutputCombinations.model_validate(saved)
+    logger.info(f"Getting matching ontologies for: {path}")
+    matched_ontology = await get_matching_ontologies(path)
+    if matched_ontology:
+        state.record('match', path_key(category, path), matched_ontology.model_dump())
+    return matched_ontology
+
+async def _query_texts(state: ResumeState, category: str, path: str, matched_ontology) -> List[str]:
+    saved = state.get('queries', path_key(category, path))
+    if saved is not None:
+        return saved
+    queries = await generate_natural_query(matched_ontology)
+    query_texts = [query.query for query in queries.queries]
+    state.record('queries', path_key(category, path), query_texts)
+    return query_texts
+
+async def process_single_path(category: str, path: str, file_path: str) -> Optional[int]:
+    """Process a single ontology path through the entire pipeline; returns the number of rows written,
+    or None if the path failed or any of its queries did (its written rows are kept, so a retry only
+    redoes the rest)"""
     error_count = 0
-    max_errors = 3  # Circuit breaker threshold
+    rows_written = 0
+    max_errors = MAX_PATH_ERRORS
+    sink = dataset_sink(file_path)
+    state = sink.state
     
     logger.info(f"Starting to process path: {category}/{path}")
     
     try:
-        base_dict = {category: [path]}
-        logger.info(f"Getting matching ontologies for: {path}")
-        matched_ontology = await get_matching_ontologies(path)
+        matched_ontology = await _matched_ontology(state, category, path)
         
         if not matched_ontology:
             logger.warning(f"No matching ontologies found for path: {path}")
-            return
+            return None
             
-        queries = await generate_natural_query(matched_ontology)
-        
-        for query in queries.queries:
+        query_texts = await _query_texts(state, category, path, matched_ontology)
+        keys = [row_key(category, path, index) for index in range(len(query_texts))]
+        # Rows already written by an earlier run are skipped, so only missing work is re-paid
+        pending = [index for index, key in enumerate(keys) if not state.row_done(key)]
+        if not pending:
+            logger.info(f"All rows for path {category}/{path} already written, skipping")
+            return 0
+        semaphore = asyncio.Semaphore(QUERY_CONCURRENCY)
+
+        batched_reasoning = {}
+        unreasoned = [index for index in pending if state.get('reasoning', keys[index]) is None]
+        if REASONING_BATCH_SIZE > 1 and unreasoned:
             try:
+                batches = await asyncio.gather(*(
+                    generate_reasoning_batch([query_texts[index] for index in unreasoned[i:i + REASONING_BATCH_SIZE]])
+                    for i in range(0, len(unreasoned), REASONING_BATCH_SIZE)
+                ))
+                batched_reasoning = dict(zip(unreasoned, (reasoning for batch in batches for reasoning in batch)))
+            except Exception as e:
+                logger.error(f"Batched reasoning failed for path {path}, falling back to per-query calls: {str(e)}")
+
+        def record_error(query: str, error: Exception):
+            nonlocal error_count
+            error_count += 1
+            logger.error(f"Error processing query '{query}': {str(error)}")
+            if error_count == max_errors:
+                logger.error(f"Circuit breaker triggered for path {path} after {max_errors} errors")
+
+        async def write_row(index: int, reasoning: str, parsed_output):
+            nonlocal rows_written
+            rows_written += 1
+            await sink.write(
+                category,
+                path,
+                matched_ontology.model_dump(),
+                query_texts[index],
+                reasoning,
+                parsed_output.parsed_output.model_dump(),
+                keys[index]
+            )
+
+        async def reason(index: int):
+            query = query_texts[index]
+            async with semaphore:
+                # The breaker is shared, so a sibling chain may have tripped it while we waited
                 if error_count >= max_errors:
-                    logger.error(f"Circuit breaker triggered for path {path} after {max_errors} errors")
                     return None
-                    
-                reasoning = await generate_reasoning(query.query)
-                parsed_output = await generate_parsed_output_with_reasoning(
-                    query=query.query,
-                    reasoning=reasoning
-                )
-                
-                row_data = {
-                    'original_path': json.dumps(base_dict),
-                    'matched_paths': matched_ontology.model_dump(),
-                    'query': query.query,
-                    'reasoning': reasoning,
-                    'parsed_output': parsed_output.parsed_output.model_dump()
-                }
-                append_to_csv(file_path, row_data)
-                
-                await asyncio.sleep(0.1)
-                
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Error processing query '{query.query}': {str(e)}")
-                continue
+                saved = state.get('reasoning', keys[index])
+                if saved is not None:
+                    return saved
+                try:
+                    reasoning = batched_reasoning.get(index) or await generate_reasoning(query)
+                except Exception as e:
+                    record_error(query, e)
+                    return None
+                state.record('reasoning', keys[index], reasoning)
+                return reasoning
+
+        async def process_query(index: int):
+            reasoning = await reason(index)
+            if reasoning is None or error_count >= max_errors:
+                return
+            async with semaphore:
+                try:
+                    parsed_output = await generate_parsed_output_with_reasoning(
+                        query=query_texts[index],
+                        reasoning=reasoning
+                    )
+                    await write_row(index, reasoning, parsed_output)
+                except Exception as e:
+                    record_error(query_texts[index], e)
+
+        if PARSE_BATCH_SIZE > 1:
+            # Reason about every query first, then parse them in batches sharing one system prompt
+            reasonings = await asyncio.gather(*(reason(index) for index in pending))
+            reasoned = [(index, reasoning) for index, reasoning in zip(pending, reasonings) if reasoning]
+            batches = [reasoned[i:i + PARSE_BATCH_SIZE] for i in range(0, len(reasoned), PARSE_BATCH_SIZE)]
+            batch_results = await asyncio.gather(*(
+                generate_parsed_outputs_batch([(query_texts[index], reasoning) for index, reasoning in batch])
+                for batch in batches
+            ))
+            for batch, results in zip(batches, batch_results):
+                for (index, reasoning), result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        record_error(query_texts[index], result)
+                    else:
+                        await write_row(index, reasoning, result)
+        else:
+            # Reasoning -> parse chains for the path's queries run concurrently
+            await asyncio.gather(*(process_query(index) for index in pending))
+        if rows_written:
+            # The path counts as done (for the job queue too) only once its rows are on disk: CSV rows
+            # are synced, Parquet rows of an open part are synced in the resume sidecar
+            await sink.checkpoint()
+        if error_count:
+            logger.error(f"Path {category}/{path} wrote {rows_written} of {len(pending)} rows, {error_count} queries failed")
+            return None
+        return rows_written
                 
     except Exception as e:
         logger.error(f"Error processing path '{path}': {str(e)}")
         return None
 
-async def process_paths_batch(paths_batch: List[Tuple[str, str]], file_path: str):
-    """Process a batch of paths with controlled concurrency"""
-    results = []
-    
-    # Process in chunks
-    chunk_size = 4  # Process 4 paths concurrently
-    for i in range(0, len(paths_batch), chunk_size):
-        chunk = paths_batch[i:i + chunk_size]
-        chunk_tasks = []
-        
-        # Create tasks for each path in the chunk
-        for var_name, path in chunk:
-            task = asyncio.create_task(
-                process_single_path(var_name, path, file_path)
-            )
-            chunk_tasks.append(task)
-        
+async def process_work_items(items: List[WorkItem], concurrency: int = None):
+    """Process paths through a bounded worker pool; a new path starts as soon as any worker frees up"""
+    concurrency = min(concurrency or PATH_CONCURRENCY, len(items)) or 1
+    results = [None] * len(items)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    completed = 0
+
+    async def worker():
+        nonlocal completed
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            index, (var_name, path, file_path) = item
+            try:
+                # Each path gets its own deadline, so a slow path never discards its neighbours
+                async with asyncio.timeout(PATH_TIMEOUT):
+                    results[index] = await process_single_path(var_name, path, file_path)
+            except asyncio.TimeoutError:
+                logger.error(f"Timeout processing path {var_name}/{path} after {PATH_TIMEOUT}s")
+            except Exception as e:
+                logger.error(f"Error processing path {var_name}/{path}: {str(e)}")
+            finally:
+                completed += 1
+                if completed % concurrency == 0 or completed == len(items):
+                    logger.info(f"Processed {completed}/{len(items)} paths")
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for item in enumerate(items):
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+
+    return results
+
+async def process_paths_batch(paths_batch: List[Tuple[str, str]], file_path: str, concurrency: int = None):
+    """Process (category, path) pairs that all write to `file_path`"""
+    return await process_work_items([(category, path, file_path) for category, path in paths_batch], concurrency)
+
+@dataclass
+class PathJob:
+    category: str
+    path: str
+    file_path: str
+    matched_ontology: Optional[ParsedOutputCombinations] = None
+    error_count: int = 0
+
+@dataclass
+class QueryJob:
+    path_job: PathJob
+    query: str
+    key: str
+    reasoning: Optional[str] = None
+    parsed_output: Optional[ParsedOutputReasoned] = None
+
+def _path_failed(job: PathJob, error: Exception, query: str):
+    job.error_count += 1
+    logger.error(f"Error processing query '{query}': {str(error)}")
+    if job.error_count == MAX_PATH_ERRORS:
+        logger.error(f"Circuit breaker triggered for path {job.path} after {MAX_PATH_ERRORS} errors")
+
+async def _match_stage(job: PathJob):
+    job.matched_ontology = await _matched_ontology(dataset_sink(job.file_path).state, job.category, job.path)
+    if not job.matched_ontology:
+        logger.warning(f"No matching ontologies found for path: {job.path}")
+        return []
+    return [job]
+
+async def _query_stage(job: PathJob):
+    state = dataset_sink(job.file_path).state
+    query_texts = await _query_texts(state, job.category, job.path, job.matched_ontology)
+    jobs = [
+        QueryJob(job, query, row_key(job.category, job.path, index)) for index, query in enumerate(query_texts)
+    ]
+    # Rows already written by an earlier run are skipped, so only missing work is re-paid
+    return [query_job for query_job in jobs if not state.row_done(query_job.key)]
+
+async def _reasoning_stage(job: QueryJob):
+    if job.path_job.error_count >= MAX_PATH_ERRORS:
+        return []
+    state = dataset_sink(job.path_job.file_path).state
+    job.reasoning = state.get('reasoning', job.key)
+    if job.reasoning is None:
         try:
-            # Process chunk concurrently with longer timeout
-            chunk_results = await asyncio.wait_for(
-                asyncio.gather(*chunk_tasks, return_exceptions=True),
-                timeout=180  # 3 minutes timeout
-            )
-            
-            # Clear completed tasks
-            for task in chunk_tasks:
-                task.cancel()
-            
-            # Handle each result individually
-            for result in chunk_results:
-                if isinstance(result, Exception):
-                    logger.error(f"Error in chunk result: {str(result)}")
-                    results.append(None)
-                else:
-                    results.append(result)
-            
-            # Clear memory
-            del chunk_tasks
-            del chunk_results
-            gc.collect()
-            
-            # Delay between chunks
-            await asyncio.sleep(0.5)
-            
-        except asyncio.TimeoutError:
-            logger.error(f"Timeout processing chunk")
-            results.extend([None] * len(chunk_tasks))
-            await asyncio.sleep(1.0)
-            
+            job.reasoning = await generate_reasoning(job.query)
         except Exception as e:
-            logger.error(f"Error processing chunk: {str(e)}")
-            results.extend([None] * len(chunk_tasks))
-            await asyncio.sleep(1.0)
-        
-        finally:
-            gc.collect()
-    
-    return results
+            _path_failed(job.path_job, e, job.query)
+            return []
+        state.record('reasoning', job.key, job.reasoning)
+    return [job]
 
-async def main():
-    # Get segment information from environment
-    segment_start = int(os.getenv('SEGMENT_START', '0'))
-    segment_size = int(os.getenv('SEGMENT_SIZE', '50'))
-    
-    # Configure logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+async def _reasoning_batch_stage(jobs: List[QueryJob]):
+    jobs = [job for job in jobs if job.path_job.error_count < MAX_PATH_ERRORS]
+    for job in jobs:
+        job.reasoning = dataset_sink(job.path_job.file_path).state.get('reasoning', job.key)
+    unreasoned = [job for job in jobs if job.reasoning is None]
+    if not unreasoned:
+        return jobs
+    try:
+        reasonings = await generate_reasoning_batch([job.query for job in unreasoned])
+    except Exception as e:
+        logger.error(f"Batched reasoning failed for {len(unreasoned)} queries, falling back to per-query calls: {str(e)}")
+        semaphore = asyncio.Semaphore(QUERY_CONCURRENCY)
+
+        async def reason(job: QueryJob):
+            async with semaphore:
+                return await _reasoning_stage(job)
+
+        results = await asyncio.gather(*(reason(job) for job in jobs))
+        return [output for outputs in results for output in outputs]
+    for job, reasoning in zip(unreasoned, reasonings):
+        job.reasoning = reasoning
+        dataset_sink(job.path_job.file_path).state.record('reasoning', job.key, reasoning)
+    return jobs
+
+async def _parse_stage(job: QueryJob):
+    if job.path_job.error_count >= MAX_PATH_ERRORS:
+        return []
+    try:
+        job.parsed_output = await generate_parsed_output_with_reasoning(
+            query=job.query,
+            reasoning=job.reasoning
+        )
+    except Exception as e:
+        _path_failed(job.path_job, e, job.query)
+        return []
+    return [job]
+
+async def _parse_batch_stage(jobs: List[QueryJob]):
+    jobs = [job for job in jobs if job.path_job.error_count < MAX_PATH_ERRORS]
+    if not jobs:
+        return []
+    results = await generate_parsed_outputs_batch([(job.query, job.reasoning) for job in jobs])
+    parsed = []
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            _path_failed(job.path_job, result, job.query)
+        else:
+            job.parsed_output = result
+            parsed.append(job)
+    return parsed
+
+async def _write_stage(job: QueryJob):
+    path_job = job.path_job
+    await dataset_sink(path_job.file_path).write(
+        path_job.category,
+        path_job.path,
+        path_job.matched_ontology.model_dump(),
+        job.query,
+        job.reasoning,
+        job.parsed_output.parsed_output.model_dump(),
+        job.key
     )
-    logger = logging.getLogger(__name__)
-    
+    return []
+
+async def process_work_items_pipelined(items: List[WorkItem]):
+    """Process paths with the LLM stages overlapped across paths, each stage with its own worker pool"""
+    path_workers = max(1, PATH_CONCURRENCY // 4)
+    query_workers = max(1, PATH_CONCURRENCY // 2)
+    stages = [
+        Stage('match', _match_stage, STAGE_WORKERS.get('match', path_workers)),
+        Stage('query', _query_stage, STAGE_WORKERS.get('query', path_workers)),
+        Stage(
+            'reasoning',
+            _reasoning_batch_stage if REASONING_BATCH_SIZE > 1 else _reasoning_stage,
+            STAGE_WORKERS.get('reasoning', query_workers),
+            batch_size=REASONING_BATCH_SIZE
+        ),
+        Stage(
+            'parse',
+            _parse_batch_stage if PARSE_BATCH_SIZE > 1 else _parse_stage,
+            STAGE_WORKERS.get('parse', query_workers),
+            batch_size=PARSE_BATCH_SIZE
+        ),
+        Stage('write', _write_stage, 1),
+    ]
+    for stage in stages:
+        stage.queue_size = stage.workers * stage.batch_size * 2
+    pipeline = StagePipeline(stages)
+    await pipeline.run(PathJob(category, path, file_path) for category, path, file_path in items)
+    return pipeline
+
+async def process_paths_pipelined(paths_batch: List[Tuple[str, str]], file_path: str):
+    """Pipelined processing of (category, path) pairs that all write to `file_path`"""
+    return await process_work_items_pipelined([(category, path, file_path) for category, path in paths_batch])
+
+def all_generation_paths() -> List[Tuple[str, str]]:
+    """Every (category, path) to generate for, in the order segments slice it"""
     # Variables from constants.py
     variables = [
         ('exposure', exposure),
@@ -183,53 +411,140 @@ async def main():
         ('objective', objective)
     ]
     
-    # Prepare all paths
     all_paths = []
     for var_name, var_list in variables:
         valid_paths = [(var_name, path) for path in var_list if not path.startswith('#')]  # Only skip commented paths
-        paths_count = len(valid_paths)
         all_paths.extend(valid_paths)
-        logger.info(f"Added {paths_count} valid paths from {var_name}")
-    
+        logger.info(f"Added {len(valid_paths)} valid paths from {var_name}")
+    return all_paths
+
+def segment_file_path(segment_start: int) -> str:
+    return f"datasets/parser_dataset_segment_{segment_start}.{OUTPUT_FORMAT}"
+
+def plan_work(segment_size: int, start: int = 0, stop: Optional[int] = None) -> List[WorkItem]:
+    """Work items for all_generation_paths()[start:stop], each writing to the file of its segment"""
+    all_paths = all_generation_paths()
     logger.info(f"Total valid paths collected: {len(all_paths)}")
-    logger.info(f"Segment range: {segment_start} to {segment_start + segment_size}")
+    stop = len(all_paths) if stop is None else min(stop, len(all_paths))
+    return [
+        (category, path, segment_file_path(start + (index - start) // segment_size * segment_size))
+        for index, (category, path) in enumerate(all_paths[start:stop], start=start)
+    ]
 
-    # Get paths for this segment only
-    segment_paths = all_paths[segment_start:segment_start + segment_size]
-    file_path = f"datasets/parser_dataset_segment_{segment_start}.csv"
+async def generate(items: List[WorkItem]):
+    """Run the work items in the configured generation mode"""
+    # Create output directories if they don't exist
+    for directory in {os.path.dirname(file_path) for _, _, file_path in items}:
+        os.makedirs(directory, exist_ok=True)
+    if GENERATION_MODE == 'pipeline':
+        return await process_work_items_pipelined(items)
+    return await process_work_items(items)
+
+async def process_job_queue(queue: JobQueue, file_path: str, concurrency: int = None):
+    """Claim paths from the job queue until none are left, renewing leases while they run"""
+    concurrency = concurrency or PATH_CONCURRENCY
+    held = set()
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(queue.lease_seconds / 3)
+            if held:
+                await asyncio.to_thread(queue.heartbeat, list(held))
+
+    async def worker():
+        while True:
+            jobs = await asyncio.to_thread(queue.claim, 1)
+            if not jobs:
+                counts = await asyncio.to_thread(queue.counts)
+                if counts['pending'] == 0 and counts['leased'] == 0:
+                    return
+                # Other workers hold the rest; wait in case one of them dies and its lease expires
+                await asyncio.sleep(min(30.0, queue.lease_seconds / 3))
+                continue
+            job = jobs[0]
+            held.add(job.id)
+            try:
+                async with asyncio.timeout(PATH_TIMEOUT):
+                    rows = await process_single_path(job.category, job.path, file_path)
+                if rows is None:
+                    await asyncio.to_thread(queue.fail, job.id, "path or some of its queries failed")
+                else:
+                    await asyncio.to_thread(queue.complete, job.id)
+            except asyncio.TimeoutError:
+                logger.error(f"Timeout processing path {job.category}/{job.path} after {PATH_TIMEOUT}s")
+                await asyncio.to_thread(queue.fail, job.id, f"timeout after {PATH_TIMEOUT}s")
+            except Exception as e:
+                logger.error(f"Error processing path {job.category}/{job.path}: {str(e)}")
+                await asyncio.to_thread(queue.fail, job.id, str(e))
+            finally:
+                held.discard(job.id)
 
-    # Create output directory if it doesn't exist
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        heartbeat_task.cancel()
+
+async def run_job_queue_worker():
+    """Seed the shared job queue with every path (a no-op once seeded) and work it until it drains"""
+    queue = JobQueue(JOB_QUEUE_DB)
+    added = await asyncio.to_thread(queue.enqueue, all_generation_paths())
+    # Each worker writes its own file, so workers on different hosts never append to the same CSV.
+    # A restarted worker gets a new file unless JOB_WORKER_ID names it stably; paths re-leased to it
+    # are then written twice, and merge_segments keeps one copy of each row_key.
+    # Always CSV: a job is completed after a checkpoint, and until its part closes a Parquet row lives
+    # only in this worker's sidecar, which only a restart under the same JOB_WORKER_ID restores from
+    file_path = f"datasets/parser_dataset_worker_{queue.worker_id}.csv"
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    counts = await asyncio.to_thread(queue.counts)
+    logger.info(f"Worker {queue.worker_id} joined job queue {JOB_QUEUE_DB} ({added} new jobs): {counts}")
+    try:
+        await process_job_queue(queue, file_path)
+    finally:
+        counts = await asyncio.to_thread(queue.counts)
+        logger.info(f"Worker {queue.worker_id} finished: {counts}")
+        queue.close()
+        await close_resources()
+
+async def close_resources():
+    """Release the shared client and cache, and log the request counters"""
+    gc.collect()
+    await close_sinks()
+    await close_async_client()
+    llm_cache.close()
+    log_structured_output_stats()
+
+async def main():
+    # Get segment information from environment
+    segment_start = int(os.getenv('SEGMENT_START', '0'))
+    segment_size = int(os.getenv('SEGMENT_SIZE', '50'))
+    
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    logger = logging.getLogger(__name__)
+    
+    if JOB_QUEUE_DB:
+        await run_job_queue_worker()
+        return
+
+    logger.info(f"Segment range: {segment_start} to {segment_start + segment_size}")
+
+    # Get paths for this segment only
+    segment_paths = plan_work(segment_size, segment_start, segment_start + segment_size)
+    file_path = segment_file_path(segment_start)
 
-    # Process in optimized batch sizes
-    batch_size = 20
     total_paths = len(segment_paths)
     processed = 0
     
     try:
-        for i in range(0, total_paths, batch_size):
-            batch = segment_paths[i:i + batch_size]
-            logger.info(f"Processing batch {i//batch_size + 1}, paths {i+1} to {min(i+batch_size, total_paths)}")
-            
-            try:
-                results = await process_paths_batch(batch, file_path)
-                
-                processed += len(batch)
-                logger.info(f"Processed {processed}/{total_paths} paths in segment {segment_start}")
-                
-                # Clean up after each batch
-                del results
-                gc.collect()
-                
-                # Delay between batches
-                if i + batch_size < total_paths:
-                    await asyncio.sleep(0.5)
-                    
-            except Exception as e:
-                logger.error(f"Error processing batch {i//batch_size + 1}: {str(e)}")
-                gc.collect()
-                continue
-                
+        results = await generate(segment_paths)
+        processed = total_paths
+        logger.info(f"Processed {processed}/{total_paths} paths in segment {segment_start}")
+        del results
+
     except KeyboardInterrupt:
         logger.info("\nProcess interrupted by user")
         logger.info(f"Progress: Processed {processed}/{total_paths} paths in segment {segment_start}")
@@ -238,7 +553,7 @@ async def main():
         logger.error(f"Fatal error in main process: {str(e)}")
         
     finally:
-        gc.collect()
+        await close_resources()
         logger.info(f"Segment {segment_start} completed")
         logger.info(f"Final progress: Processed {processed}/{total_paths} paths in segment {segment_start}")
 
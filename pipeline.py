@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """One step of the pipeline: `handler` turns an item into zero or more items for the next stage.
+
+    With batch_size > 1 the handler receives a list of up to batch_size queued items instead.
+    """
+    name: str
+    handler: Callable[[Any], Awaitable[Optional[List[Any]]]]
+    workers: int = 1
+    queue_size: int = 16
+    batch_size: int = 1
+
+
+class StagePipeline:
+    def __init__(self, stages: List[Stage], report_interval: float = 10.0):
+        self.stages = stages
+        self.report_interval = report_interval
+        # queues[i] feeds stages[i]; the last stage has no outbox, so its outputs are dropped
+        self.queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.busy: Dict[str, int] = {stage.name: 0 for stage in stages}
+        self.processed: Dict[str, int] = {stage.name: 0 for stage in stages}
+        self.failed: Dict[str, int] = {stage.name: 0 for stage in stages}
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {stage.name: queue.qsize() for stage, queue in zip(self.stages, self.queues)}
+
+    def report(self) -> str:
+        return ", ".join(
+            f"{stage.name}: queued={queue.qsize()}/{stage.queue_size} busy={self.busy[stage.name]}/{stage.workers} "
+            f"done={self.processed[stage.name]} failed={self.failed[stage.name]}"
+            for stage, queue in zip(self.stages, self.queues)
+        )
+
+    async def _worker(self, index: int):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        done = False
+        while not done:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            if stage.batch_size > 1:
+                # Take whatever else is already queued, up to the batch size, without waiting
+                batch = [item]
+                while len(batch) < stage.batch_size and not inbox.empty():
+                    item = inbox.get_nowait()
+                    if item is _DONE:
+                        done = True
+                        break
+                    batch.append(item)
+                item = batch
+            self.busy[stage.name] += 1
+            try:
+                outputs = await stage.handler(item) or []
+                self.processed[stage.name] += len(item) if stage.batch_size > 1 else 1
+            except Exception as e:
+                self.failed[stage.name] += len(item) if stage.batch_size > 1 else 1
+                logger.error(f"Stage {stage.name} failed: {str(e)}")
+                outputs = []
+            finally:
+                self.busy[stage.name] -= 1
+            # A full outbox blocks this worker, which is what keeps memory flat
+            if outbox is not None:
+                for output in outputs:
+                    await outbox.put(output)
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            logger.info(f"Pipeline: {self.report()}")
+
+    async def run(self, items: Iterable[Any]):
+        """Push items through every stage; returns once the last stage has drained"""
+        reporter = asyncio.create_task(self._reporter())
+        workers = [
+            [asyncio.create_task(self._worker(index)) for _ in range(stage.workers)]
+            for index, stage in enumerate(self.stages)
+        ]
+        try:
+            for item in items:
+                await self.queues[0].put(item)
+            # Shut stages down in order so each one drains before the next sees its sentinels
+            for index, stage_workers in enumerate(workers):
+                for _ in stage_workers:
+                    await self.queues[index].put(_DONE)
+                await asyncio.gather(*stage_workers)
+        finally:
+            reporter.cancel()
+            for stage_workers in workers:
+                for task in stage_workers:
+                    task.cancel()
+        logger.info(f"Pipeline finished: {self.report()}")
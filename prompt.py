@@ -5,8 +5,13 @@ from constants.constants import (
     asset_type,
     sebi_classification,
     objective,
-    securities_names
+    load_securities_names,
+    ONTOLOGY
 )
+from utils.bundle import load_bundle
+
+# Bump when a prompt change should invalidate rows and stage outputs saved for resuming (see utils/resume.py)
+PROMPT_VERSION = 1
 
 PARSED_OUTPUT_SYSTEM_PROMPT_1 = """ 
         You are a query parser for an investment advisory system. Extract structured information from queries into these categories using Pydantic models.
@@ -61,7 +66,20 @@ PARSED_OUTPUT_SYSTEM_PROMPT_2 = """
         - objectives
 """
 
-PARSED_OUTPUT_SYSTEM_PROMPT_3 = f"""
+def _tickers_line(securities: list, indent: str = "") -> str:
+    # With no relevant securities the item is left out rather than offering an empty list
+    return f"\n{indent}7. Tickers: Acceptable values are {securities}" if securities else ""
+
+def build_parsed_output_system_prompt(securities: list = None, ontology: dict = None) -> str:
+    """Parse system prompt offering `securities` as ticker values and `ontology` as node values.
+
+    Both default to the full lists; callers pass retrieved subsets to keep the prompt small.
+    """
+    if securities is None:
+        securities = load_securities_names()
+    if ontology is None:
+        ontology = ONTOLOGY
+    return f"""
 You are MyFi, a conversational assistant specialized in Indian market investment advisory. 
 Given a query and reasoning, parse the query into structured components using the ontology paths.
 
@@ -80,13 +98,12 @@ ParsedOutputReasoned(
 )
 
 For parsing the query, use the reasoning provided and the available ontology nodes:
-1. Attributes: Acceptable values are {attribute}
-2. Exposures: Acceptable values are {exposure}
-3. Asset Types: Acceptable values are {asset_type}
-4. SEBI Classifications: Acceptable values are {sebi_classification}
-5. Vehicles: Acceptable values are {vehicle}
-6. Objectives: Acceptable values are {objective}
-7. Tickers: Acceptable values are {securities_names}
+1. Attributes: Acceptable values are {ontology['attribute']}
+2. Exposures: Acceptable values are {ontology['exposure']}
+3. Asset Types: Acceptable values are {ontology['asset_type']}
+4. SEBI Classifications: Acceptable values are {ontology['sebi_classification']}
+5. Vehicles: Acceptable values are {ontology['vehicle']}
+6. Objectives: Acceptable values are {ontology['objective']}{_tickers_line(securities)}
 
 Rules for parsed_output:
 1. Only use exact paths from the ontology - do not create new ones.
@@ -99,7 +116,11 @@ Rules for reasoning:
 4. NO BULLET POINTS. Just sentences.
 """
 
-ONTOLOGY_MATCHING_PROMPT = f"""
+def build_ontology_matching_prompt(securities: list = None) -> str:
+    """Ontology matching prompt offering `securities` as ticker values (the whole universe by default)"""
+    if securities is None:
+        securities = load_securities_names()
+    return f"""
     You are an expert in Indian market investments and ontology matching. Given a path from our ontology, generate THREE DIFFERENT combinations of ontology paths that would make the most sense together.
     
     Available nodes by category:
@@ -108,8 +129,7 @@ ONTOLOGY_MATCHING_PROMPT = f"""
     3. Asset Types: Acceptable values are {asset_type}
     4. SEBI Classifications: Acceptable values are {sebi_classification}
     5. Vehicles: Acceptable values are {vehicle}
-    6. Objectives: Acceptable values are {objective}
-    7. Tickers: Acceptable values are {securities_names}
+    6. Objectives: Acceptable values are {objective}{_tickers_line(securities, "    ")}
 
     Rules:
     1. MUST generate THREE COMPLETELY DIFFERENT combinations
@@ -173,4 +193,57 @@ Explain:
 - Any relevant market context or relationships
             
 EXAMPLE:
-"""
\ No newline at end of file
+"""
+REASONING_BATCH_GENERATION_PROMPT = """
+You are an investment advisor analyzing user queries. You will receive a numbered list of queries. Generate reasoning for EACH query, returned as:
+
+ReasoningCombinations(
+    combinations=[
+        Reasoning(reasoning="<reasoning for query 1>"),
+        Reasoning(reasoning="<reasoning for query 2>"),
+        ...
+    ]
+)
+
+Rules:
+1. Return EXACTLY one reasoning per query, in the same order as the queries
+2. Each reasoning is at most 3 sentences and 50 words, and covers every element of its query
+3. Follow the format and style of the earlier exchange in this conversation
+4. NO BULLET POINTS. Just sentences.
+
+Explain:
+- What the user is looking for
+- Why they might be interested in these specific criteria
+- Any relevant market context or relationships
+"""
+
+PARSED_OUTPUT_BATCH_INSTRUCTIONS = """
+Batch mode:
+You will receive a numbered list of items, each with a query and its reasoning. Parse EVERY item independently and return
+ParsedOutputReasonedCombinations(
+    combinations=[
+        IndexedParsedOutputReasoned(index=<item number>, reasoning="<reasoning>", parsed_output=ParsedOutput(...)),
+        ...
+    ]
+)
+Return exactly one entry per item, in the same order, with index set to the item's number.
+"""
+
+# Prompts listing the full ontology and securities universe, rendered on first use (or read from
+# the startup bundle) since they are large and most runs only need the retrieved subsets
+FULL_PROMPT_BUILDERS = {
+    'PARSED_OUTPUT_SYSTEM_PROMPT_3': build_parsed_output_system_prompt,
+    'ONTOLOGY_MATCHING_PROMPT': build_ontology_matching_prompt,
+}
+_rendered_prompts = {}
+
+def __getattr__(name):
+    if name in FULL_PROMPT_BUILDERS:
+        if name not in _rendered_prompts:
+            bundle = load_bundle()
+            if bundle is not None:
+                _rendered_prompts[name] = bundle['prompts'][name]
+            else:
+                _rendered_prompts[name] = FULL_PROMPT_BUILDERS[name]()
+        return _rendered_prompts[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
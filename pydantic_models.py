@@ -1,6 +1,8 @@
+import json
+import os
 from typing import List, Optional, Any, Literal, Dict
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, ValidationInfo, field_validator, model_validator
 
 from constants.constants import (
     exposure,
@@ -10,9 +12,62 @@ from constants.constants import (
     sebi_classification,
     objective,
 )
-
-
-class Attributes(BaseModel):
+from utils.ontology_validation import ontology_repairer
+
+# How allowed node values appear in the JSON schema sent with every request: 'full' lists them in
+# each node description; 'compact' (the default) leaves them to the system prompt. Every prompt sent
+# with a node-bearing schema (ontology matching, parse, batch parse) already carries the lists, and
+# the parse prompt carries only the branches retrieval kept, so 'full' costs ~4k extra tokens per
+# call and shows the model nodes pruning removed. A shared $defs enum was tried and dropped: each
+# list appears once either way, so it was no smaller than 'full'.
+SCHEMA_MODES = ('full', 'compact')
+SCHEMA_MODE = os.getenv('SCHEMA_MODE', 'compact')
+
+# $defs entry holding a `node` field -> its description in compact mode
+COMPACT_NODE_DESCRIPTIONS = {
+    'Attributes': "Attribute ontology path mentioned in the query, from the attribute list in the system prompt",
+    'Exposures': "Exposure ontology path mentioned in the query (GICS sectors, factors, indices, regions), from the exposure list in the system prompt",
+    'AssetType': "Asset type ontology path mentioned in the query, from the asset type list in the system prompt",
+    'Sebi': "SEBI classification ontology path mentioned in the query, from the SEBI list in the system prompt",
+    'Vehicle': "Vehicle ontology path mentioned in the query, from the vehicle list in the system prompt",
+    'Objective': "Objective ontology path mentioned in the query, from the objective list in the system prompt",
+}
+
+
+def apply_schema_mode(schema: dict, mode: str = SCHEMA_MODE) -> dict:
+    """Rewrite the `node` fields of a response model schema for the given schema mode"""
+    if mode not in SCHEMA_MODES:
+        raise ValueError(f"Invalid schema mode '{mode}', expected one of {SCHEMA_MODES}")
+    defs = schema.get('$defs', {})
+    if mode == 'full' or not defs:
+        return schema
+    for def_name, description in COMPACT_NODE_DESCRIPTIONS.items():
+        node = defs.get(def_name, {}).get('properties', {}).get('node')
+        if node is not None:
+            node['description'] = description
+    return schema
+
+
+# ParsedOutput list field -> ontology category its nodes must come from
+ONTOLOGY_FIELDS = {
+    'attributes': 'attribute',
+    'exposures': 'exposure',
+    'asset_types': 'asset_type',
+    'sebi': 'sebi_classification',
+    'vehicles': 'vehicle',
+    'objectives': 'objective',
+}
+
+
+class OntologySchemaModel(BaseModel):
+    """Base for the response models; applies SCHEMA_MODE to the schema sent to the API"""
+
+    @classmethod
+    def model_json_schema(cls, *args, schema_mode: str = None, **kwargs) -> dict:
+        return apply_schema_mode(super().model_json_schema(*args, **kwargs), schema_mode or SCHEMA_MODE)
+
+
+class Attributes(OntologySchemaModel):
     node: str = Field(
         ...,
         description=f"Attributes mentioned in the query. Acceptable values are {attribute}",
@@ -31,7 +86,7 @@ class Attributes(BaseModel):
     )
 
 
-class Exposures(BaseModel):
+class Exposures(OntologySchemaModel):
     node: Optional[str] = Field(
         None,
         description=f"Exposures mentioned in the query. Acceptable values fall under - sector exposures. sectors follow the GICS classification - {exposure}.",
@@ -46,42 +101,42 @@ class Exposures(BaseModel):
     )
 
 
-class Ticker(BaseModel):
+class Ticker(OntologySchemaModel):
     name: str = Field(
         ...,
         description="Name of a security mentioned in the user query. Could be referring to a mutual fund , stock , etf or debt instrument.",
     )
 
 
-class AssetType(BaseModel):
+class AssetType(OntologySchemaModel):
     node: str = Field(
         ...,
         description=f"Asset type mentioned in the query. Acceptable values are {asset_type}",
     )
 
 
-class Sebi(BaseModel):
+class Sebi(OntologySchemaModel):
     node: str = Field(
         ...,
         description=f"SEBI classification mentioned in the query. Acceptable values are {sebi_classification}",
     )
 
 
-class Vehicle(BaseModel):
+class Vehicle(OntologySchemaModel):
     node: str = Field(
         ...,
         description=f"Vehicle mentioned in the query. Acceptable values are {vehicle}",
     )
 
 
-class Objective(BaseModel):
+class Objective(OntologySchemaModel):
     node: str = Field(
         ...,
         description=f"Objective mentioned in the query. Acceptable values are {objective}",
     )
 
 
-class ParsedOutput(BaseModel):
+class ParsedOutput(OntologySchemaModel):
     attributes: list[Attributes] = Field(
         default_factory=list, description="Attributes mentioned in the query "
     )
@@ -164,32 +219,92 @@ class ParsedOutput(BaseModel):
     )
     def set_default_lists(cls, v):
         return v or []
+
+    @model_validator(mode="after")
+    def check_ontology_nodes(self, info: ValidationInfo):
+        """Snap near-miss node paths to the ontology when validating with {"ontology_repair": True}.
+
+        Only paths that cannot be repaired fail validation (and so cost a retry).
+        """
+        if not (info.context or {}).get("ontology_repair"):
+            return self
+        invalid = []
+        for field_name, category in ONTOLOGY_FIELDS.items():
+            for item in getattr(self, field_name):
+                if item.node is None:
+                    continue
+                repaired = ontology_repairer.repair(category, item.node)
+                if repaired is None:
+                    invalid.append(f"{field_name}: '{item.node}'")
+                else:
+                    item.node = repaired
+        if invalid:
+            raise ValueError(f"Nodes not in the ontology (use exact paths from the lists): {', '.join(invalid)}")
+        return self
     
 # print(ParsedOutput.model_json_schema())
 
-class ParsedOutputReasoned(BaseModel):
+class ParsedOutputReasoned(OntologySchemaModel):
     reasoning: str = Field(..., description="Reasoning for the parsed output")
     parsed_output: ParsedOutput = Field(..., description="Parsed output")
 
-class ParsedOutputCombinations(BaseModel):
+class ParsedOutputCombinations(OntologySchemaModel):
     combinations: list[ParsedOutput] = Field(..., description="List of parsed outputs")
 
 
-class UserQuery(BaseModel):
+class UserQuery(OntologySchemaModel):
     query: str = Field(..., description="Natural language investment query")
 
 
-class UserQueries(BaseModel):
+class UserQueries(OntologySchemaModel):
     queries: list[UserQuery] = Field(
         ..., description="List of natural language queries"
     )
 
 
-class Reasoning(BaseModel):
+class Reasoning(OntologySchemaModel):
     reasoning: str = Field(..., description="Reasoning for the parsed output")
 
 
-class ReasoningCombinations(BaseModel):
+class ReasoningCombinations(OntologySchemaModel):
     combinations: list[Reasoning] = Field(..., description="List of reasoning outputs")
 
 
+
+
+class IndexedParsedOutputReasoned(ParsedOutputReasoned):
+    index: int = Field(..., description="Number of the query this output belongs to, as given in the request")
+
+
+class ParsedOutputReasonedCombinations(OntologySchemaModel):
+    combinations: list[IndexedParsedOutputReasoned] = Field(
+        ..., description="One parsed output per query, in the same order as the queries"
+    )
+
+
+RESPONSE_MODELS = [
+    ParsedOutputReasoned,
+    ParsedOutputCombinations,
+    ParsedOutputReasonedCombinations,
+    UserQueries,
+    Reasoning,
+    ReasoningCombinations,
+]
+
+
+def schema_token_report(models: list = RESPONSE_MODELS) -> Dict[str, Dict[str, int]]:
+    """Approximate tokens (~4 characters each) of each response model's schema under every schema mode"""
+    report = {}
+    for model in models:
+        report[model.__name__] = {
+            mode: len(json.dumps(model.model_json_schema(schema_mode=mode))) // 4
+            for mode in SCHEMA_MODES
+        }
+    return report
+
+
+if __name__ == "__main__":
+    print(f"{'response_model':<36}" + "".join(f"{mode:>10}" for mode in SCHEMA_MODES))
+    for name, sizes in schema_token_report().items():
+        print(f"{name:<36}" + "".join(f"{sizes[mode]:>10}" for mode in SCHEMA_MODES))
+    print(f"\nActive SCHEMA_MODE: {SCHEMA_MODE}")
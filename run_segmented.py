@@ -5,6 +5,7 @@ import subprocess
 from typing import List
 import logging
 from constants.constants import count_paths_with_depth
+from utils.bundle import build_bundle
 
 # Configure logging
 logging.basicConfig(
@@ -13,6 +14,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+MAX_CONCURRENT_SEGMENTS = 5  # Keep concurrent segments manageable
+TOTAL_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', '20'))
+SEGMENT_SIZE = int(os.getenv('SEGMENT_SIZE', '30'))
+# 'inprocess' runs every path under one event loop with one request budget;
+# 'subprocess' runs a main.py process per segment, MAX_CONCURRENT_SEGMENTS at a time
+SEGMENT_MODE = os.getenv('SEGMENT_MODE', 'inprocess')
+
+async def run_in_process() -> None:
+    """Plan every segment once and run all paths under this event loop, sharing one client,
+    cache, rate limiter and concurrency budget; each segment still writes its own file"""
+    from main import plan_work, generate, close_resources
+
+    work = plan_work(SEGMENT_SIZE)
+    segments = len({file_path for _, _, file_path in work})
+    logger.info(f"Running {len(work)} paths from {segments} segments in process")
+    try:
+        await generate(work)
+    finally:
+        await close_resources()
+
 async def run_segment(start: int, size: int) -> None:
     """Run a single segment asynchronously"""
     segment_num = start // size + 1
@@ -21,6 +42,10 @@ async def run_segment(start: int, size: int) -> None:
     env = os.environ.copy()
     env['SEGMENT_START'] = str(start)
     env['SEGMENT_SIZE'] = str(size)
+    # Split the request budget so concurrent segments together stay under MAX_CONCURRENCY
+    env['MAX_CONCURRENCY'] = str(max(1, TOTAL_CONCURRENCY // MAX_CONCURRENT_SEGMENTS))
+    # Segment processes draw from one machine-wide RPM/TPM budget instead of each owning the whole limit
+    env.setdefault('RATE_LIMITER_BACKEND', 'shared')
     
     try:
         process = await asyncio.create_subprocess_exec(
@@ -57,8 +82,7 @@ async def run_segment(start: int, size: int) -> None:
  
 async def run_segments_concurrently():
     total_paths, _ = count_paths_with_depth()  # Get actual number of valid paths
-    segment_size = 30  # Adjusted for more paths
-    max_concurrent = 5  # Keep concurrent segments manageable
+    segment_size = SEGMENT_SIZE
     
     # Create segments
     start_markers = list(range(0, total_paths, segment_size))
@@ -66,26 +90,30 @@ async def run_segments_concurrently():
     logger.info(f"Total valid paths: {total_paths}")
     logger.info(f"Number of segments: {len(start_markers)}")
     
-    # Process segments in chunks to control concurrency
-    for i in range(0, len(start_markers), max_concurrent):
-        chunk = start_markers[i:i + max_concurrent]
-        tasks = [run_segment(start, segment_size) for start in chunk]
-        
-        logger.info(f"Starting concurrent execution of segments {i//max_concurrent + 1}")
-        await asyncio.gather(*tasks)
-        logger.info(f"Completed batch of segments {i//max_concurrent + 1}")
-        
-        # Optional: Add delay between batches
-        if i + max_concurrent < len(start_markers):
-            await asyncio.sleep(1)
+    # A new segment starts as soon as any running one finishes, so one slow segment holds up nothing
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SEGMENTS)
+
+    async def run_limited(start: int):
+        async with semaphore:
+            await run_segment(start, segment_size)
+
+    await asyncio.gather(*(run_limited(start) for start in start_markers))
+
+async def run():
+    # Render the startup artifacts once so every worker loads them in one read
+    build_bundle()
+    if SEGMENT_MODE == 'subprocess':
+        await run_segments_concurrently()
+    else:
+        await run_in_process()
 
 if __name__ == "__main__":
     try:
         # Create datasets directory if it doesn't exist
         os.makedirs('datasets', exist_ok=True)
         
-        logger.info("Starting concurrent segment processing")
-        asyncio.run(run_segments_concurrently())
+        logger.info(f"Starting segment processing ({SEGMENT_MODE})")
+        asyncio.run(run())
         logger.info("All segments completed")
         
     except KeyboardInterrupt:
@@ -1,7 +1,15 @@
 import asyncio
+import copy
 import logging
+import os
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Literal, Optional
+import httpx
 import instructor
-from typing import Literal
+from dotenv import load_dotenv
+from instructor.exceptions import InstructorRetryException
+from openai import AsyncOpenAI
 from pydantic_models import (
     ParsedOutput,
     ParsedOutputReasoned,
@@ -9,16 +17,28 @@ from pydantic_models import (
     Reasoning,
     UserQueries
 )
-from pydantic import BaseModel, Field
-from utils import rate_limiter
-from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, Field, ValidationError
+from utils.utils import rate_limiter, estimate_tokens
+from utils.llm_cache import llm_cache
+from utils.concurrency import MAX_CONCURRENCY, concurrency_controller
 
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
-import sys
-sys.setrecursionlimit(3000)
+# 'instructor' validates and retries through instructor, 'json_schema' uses native strict
+# response_format decoding and validates locally
+STRUCTURED_OUTPUT_MODES = ('instructor', 'json_schema')
+STRUCTURED_OUTPUT_MODE = os.getenv('STRUCTURED_OUTPUT_MODE', 'instructor')
+# ontology_repair snaps near-miss node paths locally instead of failing (ONTOLOGY_REPAIR=0 disables)
+VALIDATION_CONTEXT = {"strict": True, "ontology_repair": os.getenv('ONTOLOGY_REPAIR', '1') == '1'}
+
+# Per mode: requests sent and re-asks (requests repeated because the response failed validation)
+structured_output_stats: Dict[str, Counter] = defaultdict(Counter)
+
+_async_client: Optional[AsyncOpenAI] = None
+_patched_client = None
+_response_formats: Dict[type, dict] = {}
 
 class NaturalQuery(BaseModel):
     query: str = Field(..., description="Natural language investment query")
@@ -29,53 +49,196 @@ class NaturalQueries(BaseModel):
 class OntologyMatch(BaseModel):
     original_path: dict = Field(..., description="Original ontology path")
     matched_paths: dict = Field(..., description="Matched ontology paths")
-    
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the shared AsyncOpenAI client, creating it with a keep-alive connection pool on first use"""
+    global _async_client
+    if _async_client is None:
+        load_dotenv()
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONCURRENCY,
+                max_keepalive_connections=MAX_CONCURRENCY,
+                keepalive_expiry=60
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+        # Retries are handled by get_structured_openai_response
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            max_retries=0
+        )
+    return _async_client
+
+def get_patched_client():
+    """Return the shared instructor-patched client, patching it only once"""
+    global _patched_client
+    if _patched_client is None:
+        _patched_client = instructor.patch(get_async_client())
+    return _patched_client
+
+async def close_async_client():
+    """Close the shared client and release its pooled connections"""
+    global _async_client, _patched_client
+    if _async_client is not None:
+        await _async_client.close()
+    _async_client = None
+    _patched_client = None
+
+
+def to_strict_schema(schema: dict) -> dict:
+    """Adapt a pydantic JSON schema to OpenAI strict mode.
+
+    Every object gets additionalProperties=false and lists all of its properties as required
+    (optional fields are already nullable), and keywords strict mode rejects are dropped.
+    """
+    schema = copy.deepcopy(schema)
+
+    def visit(node):
+        if isinstance(node, dict):
+            if '$ref' in node:
+                # Strict mode does not allow keywords next to $ref
+                for key in [key for key in node if key != '$ref']:
+                    del node[key]
+                return
+            node.pop('default', None)
+            node.pop('title', None)
+            if node.get('type') == 'object' or 'properties' in node:
+                node['additionalProperties'] = False
+                node['required'] = list(node.get('properties', {}))
+            for key, value in node.items():
+                if key == 'properties':
+                    for property_schema in value.values():
+                        visit(property_schema)
+                else:
+                    visit(value)
+        elif isinstance(node, list):
+            for item in node:
+                visit(item)
+
+    visit(schema)
+    return schema
+
+def strict_response_format(response_model) -> dict:
+    """response_format for native strict JSON-schema decoding, built once per model"""
+    if response_model not in _response_formats:
+        _response_formats[response_model] = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": response_model.__name__,
+                "schema": to_strict_schema(response_model.model_json_schema()),
+                "strict": True
+            }
+        }
+    return _response_formats[response_model]
+
+def _is_validation_error(error: Exception) -> bool:
+    return isinstance(error, (ValidationError, InstructorRetryException))
+
+def log_structured_output_stats():
+    for mode, counts in structured_output_stats.items():
+        logger.info(f"Structured output ({mode}): {counts['requests']} requests, {counts['reasks']} re-asks")
+
+async def _create_with_instructor(client, response_model, **request):
+    patched_client = get_patched_client() if client is None else instructor.patch(client)
+    response = await patched_client.chat.completions.create(
+        response_model=response_model,
+        validation_context=VALIDATION_CONTEXT,
+        **request
+    )
+    return response, getattr(getattr(response, '_raw_response', None), 'usage', None)
+
+async def _create_with_json_schema(client, response_model, **request):
+    completion = await (client or get_async_client()).chat.completions.create(
+        response_format=strict_response_format(response_model),
+        **request
+    )
+    return completion, completion.usage
+
+def _parse_json_schema_completion(completion, response_model):
+    message = completion.choices[0].message
+    if getattr(message, 'refusal', None):
+        raise ValueError(f"Model refused to answer: {message.refusal}")
+    return response_model.model_validate_json(message.content, context=VALIDATION_CONTEXT)
+
 
 async def get_structured_openai_response(
-    client,
     messages: list,
     response_model: Literal[ParsedOutput, ParsedOutputReasoned, ParsedOutputCombinations, Reasoning, UserQueries],
     max_tokens: int = 1500,
     model_name: str = "gpt-4o",
     temperature: float = 1.0,
-    timeout: int = 30
+    timeout: int = 30,
+    client: Optional[AsyncOpenAI] = None
+):
+    """Structured response for the request, served from the on-disk cache when possible"""
+    cache_key = llm_cache.make_key(messages, model_name, temperature, max_tokens, response_model)
+    return await llm_cache.get_or_create(
+        cache_key,
+        model_name,
+        response_model,
+        lambda: _request_with_retries(
+            messages=messages,
+            response_model=response_model,
+            max_tokens=max_tokens,
+            model_name=model_name,
+            temperature=temperature,
+            timeout=timeout,
+            client=client
+        )
+    )
+
+
+async def _request_with_retries(
+    messages: list,
+    response_model,
+    max_tokens: int,
+    model_name: str,
+    temperature: float,
+    timeout: int,
+    client: Optional[AsyncOpenAI]
 ):
     max_retries = 3
     retry_count = 0
     backoff = 1
-    
+
+    if STRUCTURED_OUTPUT_MODE not in STRUCTURED_OUTPUT_MODES:
+        raise ValueError(f"Invalid STRUCTURED_OUTPUT_MODE '{STRUCTURED_OUTPUT_MODE}', expected one of {STRUCTURED_OUTPUT_MODES}")
+    mode = STRUCTURED_OUTPUT_MODE
+    create = _create_with_json_schema if mode == 'json_schema' else _create_with_instructor
+    estimated_tokens = estimate_tokens(messages, max_tokens)
+
     while retry_count < max_retries:
         try:
-            await rate_limiter.acquire()
-            patched_client = instructor.patch(client)
-            
-            def make_request():
+            async with concurrency_controller.slot():
+                reservation = await rate_limiter.acquire(model_name, estimated_tokens)
+                structured_output_stats[mode]['requests'] += 1
+                start = time.monotonic()
                 try:
-                    return patched_client.chat.completions.create(
-                        model=model_name,
-                        messages=messages,
-                        max_tokens=max_tokens,
-                        seed=123,
-                        temperature=temperature,
-                        response_model=response_model,
-                        validation_context={"strict": True},
-                    )
+                    # The request runs on the event loop, so the timeout cancels the in-flight HTTP call
+                    async with asyncio.timeout(timeout):
+                        result, usage = await create(
+                            client,
+                            response_model,
+                            model=model_name,
+                            messages=messages,
+                            max_tokens=max_tokens,
+                            seed=123,
+                            temperature=temperature
+                        )
                 except Exception as e:
-                    return e
-
-            async with asyncio.timeout(timeout):
-                # Use ThreadPoolExecutor explicitly
-                with ThreadPoolExecutor() as executor:
-                    response = await asyncio.get_event_loop().run_in_executor(
-                        executor, 
-                        make_request
-                    )
-                    
-                    if isinstance(response, Exception):
-                        raise response
-                        
-                    return response
-                
+                    concurrency_controller.record_failure(e)
+                    raise
+                concurrency_controller.record_success(time.monotonic() - start)
+
+            if usage is not None:
+                rate_limiter.reconcile(reservation, usage.total_tokens)
+            if mode == 'json_schema':
+                return _parse_json_schema_completion(result, response_model)
+            return result
+
         except asyncio.TimeoutError:
             logger.error(f"Request timed out (attempt {retry_count + 1}/{max_retries})")
             retry_count += 1
@@ -84,9 +247,11 @@ async def get_structured_openai_response(
             await asyncio.sleep(backoff)
             backoff *= 2
         except Exception as e:
+            if _is_validation_error(e):
+                structured_output_stats[mode]['reasks'] += 1
             logger.error(f"Error (attempt {retry_count + 1}/{max_retries}): {str(e)}")
             retry_count += 1
             if retry_count == max_retries:
                 raise
             await asyncio.sleep(backoff)
-            backoff *= 2
\ No newline at end of file
+            backoff *= 2
@@ -0,0 +1,26 @@
+import httpx
+import openai
+
+from utils.concurrency import AdaptiveConcurrencyController
+
+
+def status_error(status: int) -> openai.APIStatusError:
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    return openai.APIStatusError('error', response=httpx.Response(status, request=request), body=None)
+
+
+def test_client_errors_do_not_back_off():
+    controller = AdaptiveConcurrencyController(initial_limit=8, window=4)
+    for status in (400, 401, 404, 422):
+        controller.record_failure(status_error(status))
+    assert controller.current_limit == 8
+    assert len(controller._outcomes) == 0
+    assert controller.paused_until == 0.0
+
+
+def test_capacity_errors_back_off():
+    for error in (status_error(429), status_error(503), openai.APITimeoutError(httpx.Request('POST', 'https://x'))):
+        controller = AdaptiveConcurrencyController(initial_limit=8, window=40)
+        controller.record_failure(error)
+        assert controller.current_limit == 4
+        assert list(controller._outcomes) == [True]
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from utils import dataset_layout, dataset_writer, resume
+
+MATCHED = {'combinations': []}
+PARSED = {'attributes': [], 'exposures': [{'node': 'exposure/sector/it', 'qualifier': None, 'quantifier': None}],
+          'tickers': [], 'asset_types': [], 'sebi': [], 'vehicles': [], 'objectives': []}
+
+
+def _write(file_path, rows):
+    async def run():
+        sink = dataset_layout.DatasetSink(file_path, 'normalized')
+        dataset_layout._sinks[file_path] = sink
+        for path, key in rows:
+            await sink.write('exposure', path, MATCHED, f"query {key}", 'r', PARSED, key)
+        await dataset_layout.close_sinks()
+
+    dataset_writer._writers.clear()
+    resume._states.clear()
+    asyncio.run(run())
+    resume._states.clear()
+
+
+@pytest.mark.parametrize('extension', ['csv', 'parquet'])
+def test_normalized_output_joins_back_to_wide_rows(tmp_path, extension):
+    if extension == 'parquet':
+        pytest.importorskip('pyarrow')
+    file_path = str(tmp_path / f"out.{extension}")
+    _write(file_path, [('exposure/sector/it', 'k1'), ('exposure/sector/it', 'k2'), ('exposure/sector/energy', 'k3')])
+    if extension == 'csv':
+        rows = list(dataset_layout.joined_rows(file_path))
+    else:
+        rows = dataset_layout.joined_table(file_path).to_pylist()
+    assert [row['row_key'] for row in rows] == ['k1', 'k2', 'k3']
+    assert [row['query'] for row in rows] == ['query k1', 'query k2', 'query k3']
+    original_paths = [row['original_path'] for row in rows]
+    if extension == 'parquet':
+        assert original_paths[2] == {'category': 'exposure', 'node': 'exposure/sector/energy'}
+    else:
+        assert original_paths[2] == '{"exposure": ["exposure/sector/energy"]}'
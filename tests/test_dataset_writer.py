@@ -0,0 +1,54 @@
+import asyncio
+import csv
+import os
+
+import pytest
+
+from utils.dataset_writer import AsyncCSVWriter, AsyncDatasetWriter
+
+
+def test_writer_hooks_are_abstract():
+    class Incomplete(AsyncDatasetWriter):
+        def _open(self):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete('unused.csv')
+
+
+def test_rows_are_durable_after_checkpoint(tmp_path):
+    file_path = str(tmp_path / 'out.csv')
+    durable = []
+
+    async def run():
+        writer = AsyncCSVWriter(file_path, ['a', 'b'], fsync_interval=3600)
+        for index in range(3):
+            await writer.write({'a': index, 'b': {'x': index}}, lambda index=index: durable.append(index))
+        await writer.checkpoint()
+        assert durable == [0, 1, 2]
+        await writer.close()
+
+    asyncio.run(run())
+    with open(file_path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['a'] for row in rows] == ['0', '1', '2']
+    assert rows[0]['b'] == '{"x": 0}'
+
+
+def test_failed_write_fails_checkpoint_and_close(tmp_path):
+    file_path = str(tmp_path / 'missing' / 'dir' / 'out.csv')
+    os.makedirs(tmp_path / 'missing')
+    # A file where the writer needs a directory makes _open fail
+    open(tmp_path / 'missing' / 'dir', 'w').close()
+    durable = []
+
+    async def run():
+        writer = AsyncCSVWriter(file_path, ['a'])
+        await writer.write({'a': 1}, lambda: durable.append(1))
+        with pytest.raises(RuntimeError):
+            await writer.checkpoint()
+        with pytest.raises(RuntimeError):
+            await writer.close()
+
+    asyncio.run(run())
+    assert durable == []
@@ -0,0 +1,14 @@
+import pytest
+
+from utils.import_budget import DEFAULT_MODULES, lazy_import_violations
+
+
+@pytest.mark.parametrize('module', DEFAULT_MODULES)
+def test_import_defers_startup_work(module):
+    try:
+        violations = lazy_import_violations(module)
+    except RuntimeError as e:
+        if 'ModuleNotFoundError' in str(e):
+            pytest.skip(str(e))
+        raise
+    assert violations == [], f"import {module} {'; '.join(violations)}"
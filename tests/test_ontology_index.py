@@ -0,0 +1,38 @@
+import os
+
+from constants.ontology_index import OntologyIndex, build_ontology_index, load_ontology_index, ontology_fingerprint
+
+
+def test_round_trip():
+    index = OntologyIndex.from_lists()
+    loaded = OntologyIndex.from_bytes(index.to_bytes(ontology_fingerprint()), ontology_fingerprint())
+    assert loaded is not None
+    assert loaded.paths == index.paths
+    # The child arrays and LCA tables are read back, not recomputed
+    assert loaded.child_start == index.child_start
+    assert loaded.child_ids == index.child_ids
+    assert loaded._sparse == index._sparse
+    ids = range(0, len(index), 7)
+    assert [loaded.lca(a, b) for a in ids for b in ids] == [index.lca(a, b) for a in ids for b in ids]
+
+
+def test_truncated_buffer_is_rejected():
+    data = OntologyIndex.from_lists().to_bytes(ontology_fingerprint())
+    for size in (0, 10, 60, len(data) // 2, len(data) - 1):
+        assert OntologyIndex.from_bytes(data[:size]) is None
+
+
+def test_save_replaces_atomically(tmp_path):
+    file_path = str(tmp_path / 'index.bin')
+    index = OntologyIndex.from_lists()
+    index.save(file_path, ontology_fingerprint())
+    assert os.listdir(tmp_path) == ['index.bin']
+    assert OntologyIndex.load(file_path, ontology_fingerprint()).paths == index.paths
+
+
+def test_import_writes_no_index(tmp_path):
+    file_path = str(tmp_path / 'index.bin')
+    index = load_ontology_index(file_path)
+    assert os.listdir(tmp_path) == []
+    build_ontology_index(file_path)
+    assert OntologyIndex.load(file_path, ontology_fingerprint()).paths == index.paths
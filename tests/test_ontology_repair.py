@@ -0,0 +1,25 @@
+from utils.ontology_validation import OntologyRepairer
+
+
+repairer = OntologyRepairer()
+
+
+def test_valid_path_is_kept():
+    assert repairer.repair('vehicle', 'vehicle/funds/mutual_fund') == 'vehicle/funds/mutual_fund'
+
+
+def test_missing_prefix_and_segment_are_restored():
+    assert repairer.repair('vehicle', 'vehicle/mutual_fund') == 'vehicle/funds/mutual_fund'
+    assert repairer.repair('vehicle', 'Mutual Fund') == 'vehicle/funds/mutual_fund'
+
+
+def test_segment_typo_is_repaired():
+    assert repairer.repair('exposure', 'exposure/sector/informaton_technology') == 'exposure/sector/information_technology'
+
+
+def test_leaf_typo_is_not_collapsed_to_its_parent():
+    assert repairer.repair('attribute', 'attribute/technical/volatilty') == 'attribute/technical/risk/volatility'
+
+
+def test_unknown_leaf_is_not_repaired_to_an_ancestor():
+    assert repairer.repair('attribute', 'attribute/technical/foo') is None
@@ -0,0 +1,15 @@
+from utils.ontology_retrieval import SMALL_CATEGORY_SIZE, OntologyRetriever
+
+
+def test_unmatched_category_keeps_its_full_list():
+    retriever = OntologyRetriever()
+    selected = retriever.select(["IT sector fund"])
+    # The query names an exposure branch only, so exposures are pruned and attributes are not
+    assert len(selected['exposure']) < len(retriever.ontology['exposure'])
+    assert len(retriever.ontology['attribute']) > SMALL_CATEGORY_SIZE
+    assert selected['attribute'] == retriever.ontology['attribute']
+
+
+def test_no_match_returns_the_full_ontology():
+    retriever = OntologyRetriever()
+    assert retriever.select(["zzzz"]) is retriever.ontology
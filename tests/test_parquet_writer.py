@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip('pyarrow')
+pytest.importorskip('pydantic')
+
+from utils import dataset_layout, dataset_writer, resume
+from utils.parquet_writer import AsyncParquetWriter, part_files, read_row_keys
+
+FIELDNAMES = ['query', 'row_key']
+
+
+def test_checkpoint_keeps_the_part_open(tmp_path):
+    file_path = str(tmp_path / 'out.parquet')
+    durable = []
+
+    async def run():
+        writer = AsyncParquetWriter(file_path, FIELDNAMES, fsync_interval=3600)
+        for index in range(3):
+            await writer.write({'query': f"q{index}", 'row_key': f"k{index}"}, lambda: durable.append(1))
+        await writer.checkpoint()
+        # Rows stay in the open part, not yet durable, instead of a part per checkpoint
+        assert part_files(file_path) == []
+        assert durable == []
+        await writer.write({'query': 'q3', 'row_key': 'k3'})
+        await writer.checkpoint()
+        await writer.close()
+
+    asyncio.run(run())
+    assert len(durable) == 3
+    assert len(part_files(file_path)) == 1
+    assert read_row_keys(file_path) == ['k0', 'k1', 'k2', 'k3']
+
+
+def test_sink_restores_rows_of_a_lost_part(tmp_path):
+    file_path = str(tmp_path / 'out.parquet')
+
+    async def crash():
+        sink = dataset_layout.DatasetSink(file_path, 'wide')
+        for index in range(3):
+            await sink.write('exposure', 'exposure/sector/it', {'combinations': []}, f"q{index}", 'r', {}, f"k{index}")
+        await sink.checkpoint()
+        # No close: the part is still .tmp when the process dies
+
+    async def resume_run():
+        sink = dataset_layout.DatasetSink(file_path, 'wide')
+        assert all(sink.state.row_done(f"k{index}") for index in range(3))
+        dataset_layout._sinks[file_path] = sink
+        await dataset_layout.close_sinks()
+
+    _reset()
+    asyncio.run(crash())
+    assert part_files(file_path) == []
+    _reset()
+    asyncio.run(resume_run())
+    _reset()
+    assert sorted(read_row_keys(file_path)) == ['k0', 'k1', 'k2']
+
+
+def _reset():
+    dataset_writer._writers.clear()
+    dataset_layout._sinks.clear()
+    resume._states.clear()
+
+
+def test_open_removes_orphaned_tmp_parts(tmp_path):
+    file_path = str(tmp_path / 'out.parquet')
+    os.makedirs(file_path)
+    orphan = os.path.join(file_path, 'part-00000.parquet.tmp')
+    open(orphan, 'wb').close()
+
+    async def run():
+        writer = AsyncParquetWriter(file_path, FIELDNAMES)
+        await writer.write({'query': 'q', 'row_key': 'k'})
+        await writer.close()
+
+    asyncio.run(run())
+    assert not os.path.exists(orphan)
+    assert read_row_keys(file_path) == ['k']
@@ -0,0 +1,53 @@
+import asyncio
+import csv
+
+from utils import dataset_layout, resume
+from utils.dataset_writer import truncate_torn_row
+from utils.resume import ResumeState
+
+
+def _write_rows(file_path, keys, layout='wide'):
+    async def run():
+        sink = dataset_layout.DatasetSink(file_path, layout)
+        for key in keys:
+            await sink.write('exposure', 'exposure/sector/it', {'combinations': []}, 'q', 'r', {}, key)
+        await sink.checkpoint()
+        await dataset_layout.close_sinks()
+
+    resume._states.clear()
+    asyncio.run(run())
+    resume._states.clear()
+
+
+def test_truncate_torn_row_keeps_complete_rows(tmp_path):
+    file_path = tmp_path / 'out.csv'
+    file_path.write_bytes(b'a,b\r\n1,"multi\nline"\r\n2,"torn\n')
+    assert truncate_torn_row(str(file_path))
+    assert file_path.read_bytes() == b'a,b\r\n1,"multi\nline"\r\n'
+    assert not truncate_torn_row(str(file_path))
+
+
+def test_resume_after_torn_row_appends_a_fresh_row(tmp_path):
+    file_path = str(tmp_path / 'out.csv')
+    _write_rows(file_path, ['k1', 'k2'])
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    with open(file_path, 'wb') as f:
+        f.write(data[:-7])
+    assert ResumeState(file_path).done_rows == {'k1'}
+    _write_rows(file_path, ['k2'])
+    with open(file_path, newline='', encoding='utf-8') as f:
+        assert [row['row_key'] for row in csv.DictReader(f)] == ['k1', 'k2']
+
+
+def test_records_are_buffered_until_checkpoint(tmp_path):
+    file_path = str(tmp_path / 'out.csv')
+    state = ResumeState(file_path)
+
+    async def run():
+        state.record('reasoning', 'k1', 'because')
+        assert not (tmp_path / 'out.csv.stages.jsonl').exists()
+        await state.checkpoint()
+
+    asyncio.run(run())
+    assert ResumeState(file_path).get('reasoning', 'k1') == 'because'
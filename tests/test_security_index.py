@@ -0,0 +1,16 @@
+from utils.security_index import SecurityIndex
+
+NAMES = [f"Alpha Fund {i}" for i in range(50)] + ["Kotak Technology Fund", "HDFC Technology Fund"]
+
+
+def test_candidates_match_the_text():
+    index = SecurityIndex(NAMES)
+    assert set(index.candidates(["technology"], k=5)) == {"Kotak Technology Fund", "HDFC Technology Fund"}
+
+
+def test_minimum_tops_up_with_a_sample():
+    index = SecurityIndex(NAMES)
+    candidates = index.candidates(["technology"], k=5, minimum=10)
+    assert len(candidates) == 10
+    assert candidates[:2] == ["Kotak Technology Fund", "HDFC Technology Fund"]
+    assert len(index.candidates(["zzzz"], minimum=10)) == 10
@@ -0,0 +1,83 @@
+# Precompiled startup bundle: the ontology index, securities universe and full prompts in one pickle
+#
+# Build it once with `python -m utils.bundle` (run_segmented.py does this before starting workers);
+# every later process loads it in one read instead of parsing the CSV and rendering the prompts.
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+from typing import Optional
+
+from constants.constants import ONTOLOGY, SECURITIES_FILE
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FILE = os.getenv(
+    'STARTUP_BUNDLE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'constants', 'startup_bundle.pkl')
+)
+PROMPT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompt.py')
+_BUNDLE_VERSION = 2
+
+_bundle = None
+_bundle_checked = False
+
+
+def bundle_fingerprint() -> str:
+    """Changes whenever the ontology lists, the securities CSV or the prompt templates change"""
+    digest = hashlib.sha256(json.dumps(ONTOLOGY, sort_keys=True).encode('utf-8'))
+    stat = os.stat(SECURITIES_FILE)
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    with open(PROMPT_FILE, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build_bundle(file_path: str = BUNDLE_FILE) -> dict:
+    """Render every startup artifact from the sources and write them to `file_path`"""
+    import csv
+    from constants.ontology_index import OntologyIndex, ontology_fingerprint
+    from prompt import FULL_PROMPT_BUILDERS
+
+    with open(SECURITIES_FILE, 'r') as csvfile:
+        securities_names = [row[1] for row in csv.reader(csvfile)][1:]
+    bundle = {
+        'version': _BUNDLE_VERSION,
+        'fingerprint': bundle_fingerprint(),
+        'securities_names': securities_names,
+        'ontology_index': OntologyIndex.from_lists().to_bytes(ontology_fingerprint()),
+        'prompts': {name: build() for name, build in FULL_PROMPT_BUILDERS.items()},
+    }
+    # Write then rename so concurrently starting workers never read a partial file
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, file_path)
+    logger.info(f"Wrote startup bundle to {file_path}")
+    return bundle
+
+
+def load_bundle(file_path: str = BUNDLE_FILE) -> Optional[dict]:
+    """The startup bundle if it exists and matches the current sources, else None (checked once per process)"""
+    global _bundle, _bundle_checked
+    if not _bundle_checked:
+        _bundle_checked = True
+        try:
+            with open(file_path, 'rb') as f:
+                bundle = pickle.load(f)
+            if bundle.get('version') == _BUNDLE_VERSION and bundle.get('fingerprint') == bundle_fingerprint():
+                _bundle = bundle
+            else:
+                logger.info(f"Ignoring stale startup bundle {file_path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.warning(f"Could not read startup bundle {file_path}: {str(e)}")
+    return _bundle
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build_bundle()
@@ -0,0 +1,160 @@
+# Adaptive (AIMD) concurrency control for API requests
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional, Tuple
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent OpenAI requests; the HTTP connection pool is sized to match
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', '20'))
+
+
+def classify_error(error: BaseException) -> Tuple[Optional[int], Optional[float]]:
+    """Return (status_code, retry_after_seconds) for an API error, following wrapped causes"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError)):
+            return 408, None
+        if isinstance(error, openai.APIConnectionError):
+            return 503, None
+        if isinstance(error, openai.APIStatusError):
+            retry_after = None
+            headers = error.response.headers if error.response is not None else {}
+            if headers.get('retry-after-ms'):
+                retry_after = float(headers['retry-after-ms']) / 1000
+            elif headers.get('retry-after'):
+                try:
+                    retry_after = float(headers['retry-after'])
+                except ValueError:
+                    retry_after = None
+            return error.status_code, retry_after
+        error = error.__cause__ or error.__context__
+    return None, None
+
+
+def is_capacity_error(status: Optional[int]) -> bool:
+    """True for timeouts (408), rate limits (429), server errors and connection errors (reported as 503)"""
+    return status is not None and (status in (408, 429) or status >= 500)
+
+
+class AdaptiveConcurrencyController:
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = MAX_CONCURRENCY,
+        target_latency: float = float(os.getenv('TARGET_LATENCY', '20')),
+        decrease_factor: float = 0.5,
+        window: int = 40,
+        outage_error_rate: float = 0.5,
+        outage_pause: float = 30.0
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.outage_error_rate = outage_error_rate
+        self.outage_pause = outage_pause
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def _paused_for(self) -> float:
+        return self.paused_until - time.monotonic()
+
+    def _wake(self):
+        """Hand free slots to queued waiters in FIFO order"""
+        if self._paused_for() > 0:
+            return
+        while self._waiters and self.in_flight < self.current_limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def _acquire(self):
+        while self._paused_for() > 0:
+            await asyncio.sleep(self._paused_for())
+        if self.in_flight < self.current_limit and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before cancellation
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one in-flight request slot for the duration of the block"""
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def record_success(self, latency: float):
+        self._outcomes.append(False)
+        if latency <= self.target_latency and self.limit < self.max_limit:
+            # Additive increase: roughly +1 slot per `limit` healthy responses
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    def record_failure(self, error: BaseException):
+        status, retry_after = classify_error(error)
+        if not is_capacity_error(status):
+            # Validation errors and client errors such as 400/401/404 say nothing about server capacity
+            return
+        self._outcomes.append(True)
+        now = time.monotonic()
+
+        if retry_after:
+            self._pause(retry_after, f"server asked to retry after {retry_after:.1f}s")
+
+        # Multiplicative decrease, at most once per second so one burst of failures counts once
+        if now - self._last_decrease >= 1.0:
+            self._last_decrease = now
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            logger.warning(f"Concurrency limit reduced to {self.current_limit} after status {status}")
+
+        if len(self._outcomes) >= self._outcomes.maxlen // 2:
+            error_rate = sum(self._outcomes) / len(self._outcomes)
+            if error_rate >= self.outage_error_rate:
+                self.limit = self.min_limit
+                self._outcomes.clear()
+                self._pause(self.outage_pause, f"error rate {error_rate:.0%} looks like an outage")
+
+    def _pause(self, seconds: float, reason: str):
+        until = time.monotonic() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            logger.warning(f"Pausing all requests for {seconds:.1f}s: {reason}")
+            asyncio.get_running_loop().call_later(seconds, self._wake)
+
+
+concurrency_controller = AdaptiveConcurrencyController()
@@ -0,0 +1,292 @@
+# Output layouts: one wide table, or a normalized pair of tables (OUTPUT_LAYOUT=normalized)
+#
+# The wide layout repeats original_path and the large matched_paths cell in every query row. The
+# normalized layout stores them once per path in `<name>.paths.<ext>` and keeps the per-query data in
+# `<name>.rows.<ext>` with a path_id column; joined_rows() rebuilds the wide rows for consumers.
+
+import csv
+import hashlib
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from utils.dataset_writer import close_writers, get_writer, truncate_torn_row
+from utils.resume import ROW_DATA_STAGES, ROW_FIELDNAMES, ResumeState, resume_state
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_LAYOUTS = ('wide', 'normalized')
+OUTPUT_LAYOUT = os.getenv('OUTPUT_LAYOUT', 'wide')
+
+PATH_FIELDNAMES = ['path_id', 'original_path', 'matched_paths']
+NORMALIZED_ROW_FIELDNAMES = ['path_id', 'query', 'reasoning', 'parsed_output', 'row_key']
+
+
+def path_id(category: str, path: str) -> str:
+    return hashlib.sha256(f"{category}:{path}".encode('utf-8')).hexdigest()[:16]
+
+
+def normalized_files(file_path: str) -> Tuple[str, str]:
+    """(paths table, rows table) standing in for the wide output `file_path`"""
+    base, extension = os.path.splitext(file_path)
+    return f"{base}.paths{extension}", f"{base}.rows{extension}"
+
+
+class DatasetSink:
+    """Where one output's rows go, in the configured layout, plus the resume state of that output"""
+
+    def __init__(self, file_path: str, layout: str = OUTPUT_LAYOUT):
+        if layout not in OUTPUT_LAYOUTS:
+            raise ValueError(f"Invalid output layout '{layout}', expected one of {OUTPUT_LAYOUTS}")
+        self.file_path = file_path
+        self.layout = layout
+        if layout == 'normalized':
+            self.paths_file, self.rows_file = normalized_files(file_path)
+            self.state: ResumeState = resume_state(self.rows_file, NORMALIZED_ROW_FIELDNAMES)
+            if not self.paths_file.endswith('.parquet'):
+                # Before path ids are read back; the writer would cut a torn record only on opening
+                truncate_torn_row(self.paths_file)
+            # Rows flushed before their path record are unreadable; regenerate them on resume
+            orphans = _orphan_row_keys(self.paths_file, self.rows_file)
+            if orphans:
+                logger.warning(f"Regenerating {len(orphans)} rows of {self.rows_file} without a path record")
+                self.state.done_rows.difference_update(orphans)
+        else:
+            self.paths_file, self.rows_file = None, file_path
+            self.state = resume_state(self.rows_file, ROW_FIELDNAMES)
+        # Paths whose record this run has written; across runs joined_rows() keeps the last record
+        self._paths_written = set()
+        # A Parquet row is durable only once its part closes, so until then the sidecar keeps it:
+        # 'row_path' once per path and run (the large matched_paths), 'row_data' per row
+        self._keeps_rows = self.rows_file.endswith('.parquet')
+        self._paths_recorded = set()
+        self._unwritten: Dict[str, Dict[str, Any]] = {}
+        self._row_paths: Dict[str, Dict[str, Any]] = {}
+        if self._keeps_rows:
+            self._load_unwritten()
+
+    def _load_unwritten(self):
+        """Rows of the sidecar whose part a crash lost; they count as done and restore() rewrites them"""
+        stages = self.state.stages
+        self._unwritten = {
+            key: row for (stage, key), row in stages.items()
+            if stage == 'row_data' and key not in self.state.done_rows
+        }
+        needed = {path_id(row['category'], row['path']) for row in self._unwritten.values()}
+        self._row_paths = {key: value for (stage, key), value in stages.items() if stage == 'row_path' and key in needed}
+        for stage_key in [stage_key for stage_key in stages if stage_key[0] in ROW_DATA_STAGES]:
+            del stages[stage_key]
+        self.state.done_rows.update(self._unwritten)
+        if self._unwritten:
+            logger.info(f"Restoring {len(self._unwritten)} rows of {self.rows_file} from {self.state.sidecar_path}")
+
+    async def restore(self):
+        """Rewrite the rows a crash lost with their open Parquet part, from the sidecar"""
+        unwritten, self._unwritten = self._unwritten, {}
+        for key, row in unwritten.items():
+            matched_paths = self._row_paths[path_id(row['category'], row['path'])]
+            await self.write(
+                row['category'], row['path'], matched_paths, row['query'], row['reasoning'], row['parsed_output'], key
+            )
+        self._row_paths = {}
+
+    async def write(
+        self,
+        category: str,
+        path: str,
+        matched_paths: Dict[str, Any],
+        query: str,
+        reasoning: str,
+        parsed_output: Dict[str, Any],
+        key: str
+    ):
+        if self._unwritten:
+            await self.restore()
+        original_path = {category: [path]}
+        rows = get_writer(self.rows_file, self.state.fieldnames)
+        if self._keeps_rows:
+            row_path_id = path_id(category, path)
+            if row_path_id not in self._paths_recorded:
+                self._paths_recorded.add(row_path_id)
+                self.state.record('row_path', row_path_id, matched_paths)
+            self.state.record('row_data', key, {
+                'category': category,
+                'path': path,
+                'query': query,
+                'reasoning': reasoning,
+                'parsed_output': parsed_output
+            })
+        # The row counts as done only once it is synced; a crash before that regenerates it on resume
+        on_durable = lambda: self.state.mark_row(key)
+        if self.layout == 'normalized':
+            row_path_id = path_id(category, path)
+            if row_path_id not in self._paths_written:
+                self._paths_written.add(row_path_id)
+                await get_writer(self.paths_file, PATH_FIELDNAMES).write({
+                    'path_id': row_path_id,
+                    'original_path': original_path,
+                    'matched_paths': matched_paths
+                })
+            await rows.write({
+                'path_id': row_path_id,
+                'query': query,
+                'reasoning': reasoning,
+                'parsed_output': parsed_output,
+                'row_key': key
+            }, on_durable)
+        else:
+            await rows.write({
+                'original_path': original_path,
+                'matched_paths': matched_paths,
+                'query': query,
+                'reasoning': reasoning,
+                'parsed_output': parsed_output,
+                'row_key': key
+            }, on_durable)
+
+    async def checkpoint(self):
+        if self._unwritten:
+            await self.restore()
+        if self.paths_file is not None:
+            await get_writer(self.paths_file, PATH_FIELDNAMES).checkpoint()
+        await get_writer(self.rows_file, self.state.fieldnames).checkpoint()
+        # After the rows, so the 'row' records their sync produced are saved too
+        await self.state.checkpoint()
+
+
+_sinks: Dict[str, DatasetSink] = {}
+
+def dataset_sink(file_path: str) -> DatasetSink:
+    if file_path not in _sinks:
+        _sinks[file_path] = DatasetSink(file_path)
+    return _sinks[file_path]
+
+async def close_sinks():
+    """Close every writer, then save the resume records their final syncs produced"""
+    try:
+        for sink in list(_sinks.values()):
+            await sink.restore()
+        await close_writers()
+    finally:
+        for sink in list(_sinks.values()):
+            await sink.state.checkpoint()
+        _sinks.clear()
+
+
+def _orphan_row_keys(paths_file: str, rows_file: str) -> Set[str]:
+    """Keys of the rows in `rows_file` whose path_id has no record in `paths_file`"""
+    if not os.path.exists(rows_file):
+        return set()
+    if rows_file.endswith('.parquet'):
+        paths = (_table(paths_file, PATH_FIELDNAMES, ['path_id']).column('path_id').to_pylist()
+                 if os.path.exists(paths_file) else [])
+        rows = _table(rows_file, NORMALIZED_ROW_FIELDNAMES, ['path_id', 'row_key']).to_pylist()
+    else:
+        paths = []
+        if os.path.isfile(paths_file):
+            with open(paths_file, 'r', newline='', encoding='utf-8') as f:
+                paths = [record['path_id'] for record in csv.DictReader(f)]
+        with open(rows_file, 'r', newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    known = set(paths)
+    return {row['row_key'] for row in rows if row.get('row_key') and row['path_id'] not in known}
+
+
+def is_normalized(file_path: str) -> bool:
+    return os.path.exists(normalized_files(file_path)[1])
+
+
+def _table(file_path: str, fieldnames: List[str], columns: Optional[List[str]] = None):
+    """A Parquet output (a directory of parts, or a single merged file) as a pyarrow Table"""
+    import pyarrow.parquet as pq
+
+    if os.path.isdir(file_path):
+        from utils.parquet_writer import read_parts
+        return read_parts(file_path, fieldnames, columns)
+    return pq.read_table(file_path, columns=columns)
+
+
+def joined_rows(file_path: str) -> Iterator[Dict[str, str]]:
+    """Rows of a CSV output as wide rows (ROW_FIELDNAMES), whichever layout it was written in.
+
+    For the normalized layout only the paths table is held in memory; rows stream from disk. The
+    two tables are flushed separately, so a crash can leave rows whose path record never reached
+    disk; those are skipped (and regenerated by a resumed run, see DatasetSink).
+    """
+    if not is_normalized(file_path):
+        with open(file_path, 'r', newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+        return
+    paths_file, rows_file = normalized_files(file_path)
+    paths: Dict[str, Dict[str, str]] = {}
+    if os.path.isfile(paths_file):
+        with open(paths_file, 'r', newline='', encoding='utf-8') as f:
+            for record in csv.DictReader(f):
+                paths[record['path_id']] = record
+    orphans = 0
+    with open(rows_file, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            record = paths.get(row['path_id'])
+            if record is None:
+                orphans += 1
+                continue
+            yield {
+                'original_path': record['original_path'],
+                'matched_paths': record['matched_paths'],
+                'query': row['query'],
+                'reasoning': row['reasoning'],
+                'parsed_output': row['parsed_output'],
+                'row_key': row['row_key']
+            }
+    if orphans:
+        logger.warning(f"Skipped {orphans} rows of {rows_file} without a path record in {paths_file}")
+
+
+def joined_table(file_path: str):
+    """A Parquet output as one wide pyarrow Table, whichever layout it was written in; rows without
+    a path record are skipped, as in joined_rows()"""
+    if not is_normalized(file_path):
+        return _table(file_path, ROW_FIELDNAMES)
+    paths_file, rows_file = normalized_files(file_path)
+    rows = _table(rows_file, NORMALIZED_ROW_FIELDNAMES)
+    paths = _table(paths_file, PATH_FIELDNAMES) if os.path.exists(paths_file) else _empty_paths()
+    import pyarrow as pa
+
+    # Resumed runs can write a path record again; keep the last one per path_id. Table.join cannot
+    # carry the struct columns, so rows are matched to their path record by index instead
+    last = {row_path_id: index for index, row_path_id in enumerate(paths.column('path_id').to_pylist())}
+    matches = [last.get(row_path_id) for row_path_id in rows.column('path_id').to_pylist()]
+    found = [index is not None for index in matches]
+    if not all(found):
+        rows = rows.filter(pa.array(found))
+    path_rows = paths.take(pa.array([index for index in matches if index is not None], type=pa.int64()))
+    columns = {name: path_rows.column(name) for name in ('original_path', 'matched_paths')}
+    columns.update({name: rows.column(name) for name in ('query', 'reasoning', 'parsed_output', 'row_key')})
+    joined = pa.table({name: columns[name] for name in ROW_FIELDNAMES})
+    if joined.num_rows < len(matches):
+        logger.warning(f"Skipped {len(matches) - joined.num_rows} rows of {rows_file} without a path record in {paths_file}")
+    return joined
+
+
+def _empty_paths():
+    from utils.parquet_writer import dataset_schema
+    return dataset_schema(PATH_FIELDNAMES).empty_table()
+
+
+def export_joined(file_path: str, output_path: str) -> int:
+    """Write the wide CSV for a (possibly normalized) CSV output; returns the number of rows"""
+    count = 0
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=ROW_FIELDNAMES, extrasaction='ignore')
+        writer.writeheader()
+        for row in joined_rows(file_path):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    # python -m utils.dataset_layout datasets/parser_dataset_segment_0.csv wide.csv
+    rows_exported = export_joined(sys.argv[1], sys.argv[2])
+    print(f"Exported {rows_exported} rows from {sys.argv[1]} to {sys.argv[2]}")
@@ -0,0 +1,335 @@
+# One reader for generated datasets and evaluation CSVs, with a cached parsed sidecar
+#
+# Decoding the JSON cells of a dataset and validating them against the pydantic models costs far
+# more than reading the file, and every analysis and evaluation tool used to redo it on each run.
+# read_dataset() does it once and pickles the parsed columns next to the source, keyed by a hash of
+# the source bytes; reading an unchanged file again only loads that sidecar. Generator outputs are
+# read through the join view, so either layout and either format (CSV or Parquet) works.
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from utils.dataset_layout import is_normalized, joined_rows, joined_table, normalized_files
+
+logger = logging.getLogger(__name__)
+
+# Bump when the sidecar contents change shape, so old sidecars are rebuilt
+READER_VERSION = 1
+DATASET_CACHE = os.getenv('DATASET_CACHE', '1') != '0'
+# Distinct cells remembered per column while parsing, to share the parse of repeated cells
+PARSE_MEMO_SIZE = 1024
+
+# JSON cells of the generator's output rows
+DATASET_JSON_COLUMNS = ('original_path', 'matched_paths', 'parsed_output')
+DATASET_PARSERS: Dict[str, Callable[[str], Any]] = {name: json.loads for name in DATASET_JSON_COLUMNS}
+
+
+def source_files(file_path: str) -> List[str]:
+    """The files holding a dataset's rows: the file itself, the paths and rows tables of a normalized
+    output, or the part files of a Parquet output"""
+    files = list(normalized_files(file_path)) if is_normalized(file_path) else [file_path]
+    sources = []
+    for file in files:
+        if os.path.isdir(file):
+            from utils.parquet_writer import part_files
+            sources.extend(part_files(file))
+        else:
+            sources.append(file)
+    return sources
+
+
+def source_fingerprint(file_path: str) -> str:
+    digest = hashlib.sha256()
+    for source in source_files(file_path):
+        digest.update(os.path.basename(source).encode('utf-8') + b"\0")
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _callable_name(function: Callable) -> str:
+    return f"{function.__module__}.{function.__qualname__}"
+
+
+def _code_fingerprint(function: Callable) -> str:
+    """Hash of a parser's bytecode and constants, so editing a parser rebuilds its sidecars (builtins
+    have no code and count by name)"""
+    code = getattr(function, '__code__', None)
+    if code is None:
+        return _callable_name(function)
+    return hashlib.sha256(code.co_code + repr(code.co_consts).encode('utf-8')).hexdigest()[:16]
+
+
+def _schema_fingerprint() -> str:
+    """Hash of the ParsedOutput schema, so changing the model rebuilds validated sidecars"""
+    from pydantic_models import ParsedOutput
+    schema = json.dumps(ParsedOutput.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()[:16]
+
+
+def _validate_parsed_output(value: Any) -> Dict[str, Any]:
+    from pydantic_models import ParsedOutput
+    return ParsedOutput.model_validate(value).model_dump()
+
+
+def _from_parquet(record: Dict[str, Any]) -> Dict[str, Any]:
+    # A typed (category, node) struct goes back to the {category: [node]} form of the CSV outputs
+    original_path = record.get('original_path')
+    if isinstance(original_path, dict) and set(original_path) == {'category', 'node'}:
+        record['original_path'] = {original_path['category']: [original_path['node']]}
+    return record
+
+
+def iter_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Wide rows of a dataset, unparsed, streamed: a CSV row by row and a wide Parquet output batch by
+    batch (a normalized Parquet output is joined in memory first)"""
+    if not file_path.endswith('.parquet'):
+        yield from joined_rows(file_path)
+        return
+    if is_normalized(file_path):
+        batches = joined_table(file_path).to_batches()
+    else:
+        import pyarrow.parquet as pq
+        from utils.parquet_writer import part_files
+
+        parts = part_files(file_path) if os.path.isdir(file_path) else [file_path]
+        batches = (batch for part in parts for batch in pq.ParquetFile(part).iter_batches())
+    for batch in batches:
+        for record in batch.to_pylist():
+            yield _from_parquet(record)
+
+
+class _SidecarColumns(Mapping):
+    """Columns of a sidecar, each unpickled from its own blob on first access, so a tool reading only
+    parsed_output never pays for matched_paths"""
+
+    def __init__(self, data: bytes, blobs: Dict[str, Tuple[int, int]]):
+        self._data = data
+        self._blobs = blobs
+        self._loaded: Dict[str, List[Any]] = {}
+
+    def __getitem__(self, name: str) -> List[Any]:
+        if name not in self._loaded:
+            offset, length = self._blobs[name]
+            self._loaded[name] = pickle.loads(self._data[offset:offset + length])
+        return self._loaded[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._blobs)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+
+class ParsedDataset:
+    """Parsed columns of a dataset file, one list per column.
+
+    Cells that failed to parse or validate are None, with the reason in `errors` (row index ->
+    {column: message}). `raw` keeps the source strings of the columns read with keep_raw. Identical
+    cells (a path's matched_paths on each of its rows) share one parsed object, so treat cells as
+    read-only.
+    """
+
+    def __init__(
+        self,
+        columns: Mapping[str, List[Any]],
+        errors: Dict[int, Dict[str, str]],
+        raw: Mapping[str, List[Any]],
+        num_rows: int
+    ):
+        self.columns = columns
+        self.errors = errors
+        self.raw = raw
+        self.num_rows = num_rows
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def column(self, name: str) -> List[Any]:
+        return self.columns[name]
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        names = list(self.columns)
+        for values in zip(*(self.columns[name] for name in names)):
+            yield dict(zip(names, values))
+
+    def to_frame(self, raw: bool = False):
+        """The columns as a pandas DataFrame; with raw=True, kept source strings replace parsed values"""
+        import pandas as pd
+
+        return pd.DataFrame({
+            name: self.raw[name] if raw and name in self.raw else self.columns[name]
+            for name in self.columns
+        })
+
+
+def _parse_cell(
+    name: str,
+    value: Any,
+    parsers: Dict[str, Callable[[str], Any]],
+    validate: Sequence[str]
+) -> Tuple[Any, Optional[str]]:
+    try:
+        if isinstance(value, str) and name in parsers:
+            value = parsers[name](value)
+        if name in validate and value is not None:
+            value = _validate_parsed_output(value)
+        return value, None
+    except ImportError:
+        # A missing pydantic is an environment problem, not a bad cell
+        raise
+    except Exception as e:
+        return None, f"{type(e).__name__}: {str(e)}"
+
+
+def _parse(
+    file_path: str,
+    parsers: Dict[str, Callable[[str], Any]],
+    validate: Sequence[str],
+    keep_raw: Sequence[str]
+) -> ParsedDataset:
+    columns: Dict[str, List[Any]] = {}
+    raw: Dict[str, List[Any]] = {}
+    errors: Dict[int, Dict[str, str]] = {}
+    # Recently parsed cells per column; the rows of a path arrive together and repeat its cells
+    recent: Dict[str, Dict[str, Tuple[Any, Optional[str]]]] = {}
+    num_rows = 0
+    for index, record in enumerate(iter_records(file_path)):
+        if index == 0:
+            # DictReader files surplus cells of a malformed row under None
+            columns = {name: [] for name in record if name is not None}
+            raw = {name: [] for name in keep_raw if name in columns}
+            recent = {name: {} for name in columns if name in parsers or name in validate}
+        for name, values in columns.items():
+            value = record.get(name)
+            if name in raw:
+                raw[name].append(value)
+            if name in recent:
+                if not isinstance(value, str):
+                    value, error = _parse_cell(name, value, parsers, validate)
+                else:
+                    cells = recent[name]
+                    if value not in cells:
+                        if len(cells) >= PARSE_MEMO_SIZE:
+                            cells.clear()
+                        cells[value] = _parse_cell(name, value, parsers, validate)
+                    value, error = cells[value]
+                if error is not None:
+                    errors.setdefault(index, {})[name] = error
+            values.append(value)
+        num_rows += 1
+    return ParsedDataset(columns, errors, raw, num_rows)
+
+
+def cache_path(file_path: str, options: Sequence[Any]) -> str:
+    """Sidecar of a dataset read with the given options; tools reading the same file differently
+    each keep their own"""
+    digest = hashlib.sha256(repr(options).encode('utf-8')).hexdigest()[:8]
+    return f"{file_path}.parsed-{digest}.pkl"
+
+
+def _write_sidecar(sidecar: str, fingerprint: str, dataset: ParsedDataset):
+    # Layout: pickled fingerprint, pickled header (row count, errors, blob offsets), then one pickled
+    # blob per column; the fingerprint comes first so a stale sidecar is rejected unread
+    blobs = {('columns', name): pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+             for name, values in dataset.columns.items()}
+    blobs.update({('raw', name): pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+                  for name, values in dataset.raw.items()})
+    offsets, position = {}, 0
+    for key, blob in blobs.items():
+        offsets[key] = (position, len(blob))
+        position += len(blob)
+    header = pickle.dumps((dataset.num_rows, dataset.errors, offsets), protocol=pickle.HIGHEST_PROTOCOL)
+    # A temp file of its own, so processes reading the same dataset never write into each other's
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(sidecar) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            pickle.dump(fingerprint, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(header)
+            for blob in blobs.values():
+                f.write(blob)
+        os.replace(temp_path, sidecar)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _read_sidecar(sidecar: str, fingerprint: str) -> Optional[ParsedDataset]:
+    with open(sidecar, 'rb') as f:
+        if pickle.load(f) != fingerprint:
+            return None
+        num_rows, errors, offsets = pickle.load(f)
+        data = f.read()
+    blobs = {kind: {} for kind in ('columns', 'raw')}
+    for (kind, name), blob in offsets.items():
+        blobs[kind][name] = blob
+    return ParsedDataset(
+        _SidecarColumns(data, blobs['columns']),
+        errors,
+        _SidecarColumns(data, blobs['raw']),
+        num_rows
+    )
+
+
+def read_dataset(
+    file_path: str,
+    parsers: Optional[Dict[str, Callable[[str], Any]]] = None,
+    validate: Sequence[str] = ('parsed_output',),
+    keep_raw: Sequence[str] = (),
+    cache: bool = DATASET_CACHE
+) -> ParsedDataset:
+    """Read and parse a dataset, from its sidecar when the source is unchanged.
+
+    Args:
+        file_path: CSV file, or a generator output in either layout and format
+        parsers: column -> function decoding its cells (the generator's JSON columns by default)
+        validate: columns validated against ParsedOutput and stored as its model_dump()
+        keep_raw: columns whose source strings are kept alongside the parsed values
+        cache: read and write the sidecar (DATASET_CACHE=0 turns it off)
+    """
+    parsers = DATASET_PARSERS if parsers is None else parsers
+    options = (
+        READER_VERSION,
+        sorted((name, _callable_name(parser), _code_fingerprint(parser)) for name, parser in parsers.items()),
+        sorted(validate),
+        _schema_fingerprint() if validate else None,
+        sorted(keep_raw)
+    )
+    sidecar = cache_path(file_path, options)
+    fingerprint = source_fingerprint(file_path)
+
+    if cache and os.path.isfile(sidecar):
+        try:
+            dataset = _read_sidecar(sidecar, fingerprint)
+            if dataset is not None:
+                return dataset
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable dataset sidecar {sidecar}: {str(e)}")
+
+    start = time.perf_counter()
+    dataset = _parse(file_path, parsers, validate, keep_raw)
+    logger.info(
+        f"Parsed {len(dataset)} rows of {file_path} in {time.perf_counter() - start:.2f}s "
+        f"({len(dataset.errors)} with errors)"
+    )
+    if cache:
+        _write_sidecar(sidecar, fingerprint, dataset)
+    return dataset
+
+
+if __name__ == "__main__":
+    # Warm the sidecar of a dataset: python -m utils.dataset_reader datasets/parser_dataset_final.csv
+    logging.basicConfig(level=logging.INFO)
+    for file_path in sys.argv[1:]:
+        start = time.perf_counter()
+        dataset = read_dataset(file_path)
+        print(f"{file_path}: {len(dataset)} rows, {len(dataset.errors)} with errors, "
+              f"read in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,271 @@
+# One buffered writer task per output file, fed through a bounded queue
+#
+# Generation tasks hand rows to write() and carry on; the writer task batches them and does the
+# file I/O in a thread, so many concurrent paths never block the event loop on disk writes.
+
+import abc
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WRITER_BATCH_SIZE = int(os.getenv('WRITER_BATCH_SIZE', '64'))
+WRITER_FLUSH_INTERVAL = float(os.getenv('WRITER_FLUSH_INTERVAL', '2.0'))
+# fsync after this many seconds of writes; checkpoint() and close() always fsync
+WRITER_FSYNC_INTERVAL = float(os.getenv('WRITER_FSYNC_INTERVAL', '30'))
+
+
+def serialize_row(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Dump nested values to JSON once, in the caller's task"""
+    return {
+        key: json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+        for key, value in data.items()
+    }
+
+
+def truncate_torn_row(file_path: str) -> bool:
+    """Cut the half-written last row a crash can leave at the end of a CSV output, so the next append
+    starts a fresh row; returns whether anything was cut.
+
+    The csv module ends every row with CRLF while line breaks inside quoted cells are written as they
+    are, so a file not ending in CRLF ends in a torn row, which runs from the last CRLF on.
+    """
+    if not os.path.isfile(file_path):
+        return False
+    with open(file_path, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        f.seek(max(0, end - 2))
+        if end == 0 or f.read() == b"\r\n":
+            return False
+        # Scan back in chunks, overlapping by a byte so a \r\n across chunks is found
+        position = end
+        keep = 0
+        while position > 0:
+            start = max(0, position - (1 << 16))
+            f.seek(start)
+            chunk = f.read(min(end, position + 1) - start)
+            found = chunk.rfind(b"\r\n")
+            if found >= 0:
+                keep = start + found + 2
+                break
+            position = start
+        f.truncate(keep)
+        f.flush()
+        os.fsync(f.fileno())
+    logger.warning(f"Dropped a torn last row ({end - keep} bytes) from {file_path}")
+    return True
+
+
+class AsyncDatasetWriter(abc.ABC):
+    """Batching writer task; subclasses implement the file format in _prepare, _open, _write_rows,
+    _sync and _close, all of which except _prepare run in a worker thread"""
+
+    def __init__(
+        self,
+        file_path: str,
+        batch_size: int = WRITER_BATCH_SIZE,
+        flush_interval: float = WRITER_FLUSH_INTERVAL,
+        fsync_interval: float = WRITER_FSYNC_INTERVAL
+    ):
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        # Bounded, so a stalled disk slows producers down instead of buffering without limit
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=batch_size * 4)
+        self.rows_written = 0
+        self._opened = False
+        self._task: Optional[asyncio.Task] = None
+        self._last_fsync = time.monotonic()
+        # First write error; the writer stops writing and reports it from then on
+        self._error: Optional[Exception] = None
+        # on_durable callbacks of rows written but not yet synced
+        self._unsynced: List[Callable[[], None]] = []
+
+    def _prepare(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return data
+
+    @abc.abstractmethod
+    def _open(self):
+        ...
+
+    @abc.abstractmethod
+    def _write_rows(self, rows: List[Dict[str, Any]]):
+        ...
+
+    @abc.abstractmethod
+    def _sync(self):
+        ...
+
+    @abc.abstractmethod
+    def _close(self):
+        ...
+
+    def _durable(self) -> bool:
+        """Whether rows written and synced are durable; formats that keep rows open past a sync say no"""
+        return True
+
+    def _write_batch(self, rows: List[Dict[str, Any]], sync: bool) -> bool:
+        """Write a batch; returns whether everything written so far is durable on disk"""
+        if not self._opened:
+            self._open()
+            self._opened = True
+        self._write_rows(rows)
+        if sync or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._sync()
+            self._last_fsync = time.monotonic()
+            return self._durable()
+        return False
+
+    async def _run(self):
+        done = False
+        while not done:
+            item = await self.queue.get()
+            rows, callbacks, waiters = [], [], []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    done = True
+                elif isinstance(item, asyncio.Future):
+                    waiters.append(item)
+                else:
+                    row, on_durable = item
+                    rows.append(row)
+                    if on_durable is not None:
+                        callbacks.append(on_durable)
+                if done or waiters or len(rows) >= self.batch_size:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    break
+            # After a failure the queue is still drained, so producers never block on it, but nothing
+            # more is written: the rows are lost and write(), checkpoint() and close() raise the error
+            if self._error is None and (rows or waiters or done):
+                try:
+                    synced = await asyncio.to_thread(self._write_batch, rows, bool(waiters) or done)
+                    self.rows_written += len(rows)
+                    self._unsynced.extend(callbacks)
+                    if synced:
+                        for on_durable in self._unsynced:
+                            on_durable()
+                        self._unsynced = []
+                except Exception as e:
+                    logger.error(f"Failed to write {len(rows)} rows to {self.file_path}: {str(e)}")
+                    self._error = e
+                    self._unsynced = []
+            for waiter in waiters:
+                # A checkpoint() cancelled by its caller's timeout leaves its waiter done already
+                if not waiter.done():
+                    waiter.set_result(None)
+        if self._opened:
+            try:
+                await asyncio.to_thread(self._close)
+            except Exception as e:
+                logger.error(f"Failed to close {self.file_path}: {str(e)}")
+                self._error = self._error or e
+            # Rows a format kept open past their sync (a Parquet part) are durable once closed
+            if self._error is None:
+                for on_durable in self._unsynced:
+                    on_durable()
+            self._unsynced = []
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise RuntimeError(f"Writer for {self.file_path} failed: {str(self._error)}") from self._error
+
+    async def write(self, data: Dict[str, Any], on_durable: Optional[Callable[[], None]] = None):
+        """Queue a row, converted for the format here, once. on_durable runs (in the event loop) once the
+        row is synced to disk, never if the write fails"""
+        self._raise_if_failed()
+        self._ensure_started()
+        await self.queue.put((self._prepare(data), on_durable))
+        self._raise_if_failed()
+
+    async def checkpoint(self):
+        """Wait until every row queued so far is written and synced to disk, as far as the format
+        allows: a Parquet row is durable only once its part closes, and its on_durable runs then"""
+        self._raise_if_failed()
+        self._ensure_started()
+        waiter = asyncio.get_running_loop().create_future()
+        await self.queue.put(waiter)
+        await waiter
+        self._raise_if_failed()
+
+    async def close(self):
+        if self._task is not None:
+            await self.queue.put(None)
+            await self._task
+            self._task = None
+        self._raise_if_failed()
+
+
+class AsyncCSVWriter(AsyncDatasetWriter):
+    def __init__(self, file_path: str, fieldnames: List[str], **kwargs):
+        super().__init__(file_path, **kwargs)
+        self.fieldnames = fieldnames
+        self._file = None
+        self._writer = None
+
+    def _prepare(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return serialize_row(data)
+
+    def _open(self):
+        if os.path.dirname(self.file_path):
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        # Never append onto a row a crash left half written
+        truncate_torn_row(self.file_path)
+        write_header = not os.path.isfile(self.file_path) or os.path.getsize(self.file_path) == 0
+        self._file = open(self.file_path, 'a', newline='', encoding='utf-8')
+        # Columns missing from an older file's header (row_key) are dropped rather than misaligned
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+        if write_header:
+            self._writer.writeheader()
+
+    def _write_rows(self, rows: List[Dict[str, Any]]):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+
+    def _close(self):
+        self._file.close()
+
+
+_writers: Dict[str, AsyncDatasetWriter] = {}
+
+def get_writer(file_path: str, fieldnames: List[str]) -> AsyncDatasetWriter:
+    """The shared writer of an output file, so concurrent tasks never append to it independently.
+
+    A path ending in .parquet gets a Parquet dataset writer (see utils/parquet_writer.py).
+    """
+    if file_path not in _writers:
+        if file_path.endswith('.parquet'):
+            from utils.parquet_writer import AsyncParquetWriter
+            _writers[file_path] = AsyncParquetWriter(file_path, fieldnames)
+        else:
+            _writers[file_path] = AsyncCSVWriter(file_path, fieldnames)
+    return _writers[file_path]
+
+async def close_writers():
+    """Flush, fsync and close every open writer; raises the first writer failure after closing them all"""
+    error = None
+    for writer in list(_writers.values()):
+        try:
+            await writer.close()
+        except Exception as e:
+            logger.error(str(e))
+            error = error or e
+    _writers.clear()
+    if error is not None:
+        raise error
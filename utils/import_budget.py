@@ -0,0 +1,96 @@
+# Check that worker startup stays cheap: import each module in a fresh interpreter
+#
+# Usage: python -m utils.import_budget [module ...]   (tests/test_import_budget.py runs the same checks)
+# Exits non-zero when importing a module does work that is meant to happen on first use: reading the
+# securities CSV, rendering the full-universe prompts, building the security index or creating the
+# OpenAI client. Those checks are deterministic. Import times are printed alongside, with the slowest
+# imports, as a report only: wall-clock time varies too much by machine and load to fail on.
+
+import json
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+DEFAULT_MODULES = ['constants.constants', 'prompt', 'pydantic_models', 'generator', 'main']
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter: import argv[1], then report the deferred work its import did anyway
+_LAZY_CHECK = '''
+import importlib, json, os, sys
+opened = set()
+def audit(event, args):
+    if event == 'open' and isinstance(args[0], str):
+        opened.add(os.path.abspath(args[0]))
+sys.addaudithook(audit)
+importlib.import_module(sys.argv[1])
+violations = []
+constants = sys.modules.get('constants.constants')
+if constants is not None and (constants.SECURITIES_FILE in opened or constants._securities_names is not None):
+    violations.append('loaded the securities universe')
+prompt = sys.modules.get('prompt')
+if prompt is not None and prompt._rendered_prompts:
+    violations.append('rendered the full prompts ' + ', '.join(sorted(prompt._rendered_prompts)))
+generator = sys.modules.get('generator')
+if generator is not None and generator._security_index is not None:
+    violations.append('built the security index')
+structured_output = sys.modules.get('structured_output')
+if structured_output is not None and (structured_output._async_client is not None or structured_output._patched_client is not None):
+    violations.append('created the OpenAI client')
+print(json.dumps(violations))
+'''
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, cwd=REPO_ROOT)
+
+
+def _failure(module: str, result: subprocess.CompletedProcess) -> RuntimeError:
+    return RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+
+
+def lazy_import_violations(module: str) -> List[str]:
+    """Work a fresh `import module` did that should be deferred to first use; empty when none"""
+    result = _run(['-c', _LAZY_CHECK, module])
+    if result.returncode != 0:
+        raise _failure(module, result)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[int, str]]]:
+    """Cumulative import time of `module` in ms, and its slowest imports as (self µs, name)"""
+    result = _run(['-X', 'importtime', '-c', f'import {module}'])
+    if result.returncode != 0:
+        raise _failure(module, result)
+    timings = []
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        timings.append((int(self_us), name))
+        if name == module:
+            total_us = int(cumulative_us)
+    return total_us / 1000, sorted(timings, reverse=True)[:5]
+
+
+def main(modules: List[str]) -> int:
+    failed = False
+    for module in modules:
+        try:
+            violations = lazy_import_violations(module)
+            elapsed_ms, slowest = measure_import(module)
+        except RuntimeError as e:
+            print(f"{module}: {str(e)}")
+            failed = True
+            continue
+        print(f"{module}: {elapsed_ms:.1f} ms {'; '.join(violations) if violations else 'ok'}")
+        failed = failed or bool(violations)
+        for self_us, name in slowest:
+            print(f"    {self_us / 1000:8.1f} ms  {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or DEFAULT_MODULES))
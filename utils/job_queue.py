@@ -0,0 +1,186 @@
+# Durable SQLite queue of generation work, claimed under time-limited leases
+#
+# Any number of main.py workers, on one machine or on several sharing a filesystem, claim paths
+# from the same table. A worker that dies stops heartbeating, its lease expires and another
+# worker picks the path up again.
+#
+# The database uses SQLite's default rollback journal, not WAL: WAL needs memory shared between
+# the processes of one host and breaks on network filesystems. Workers on several machines still
+# rely on the filesystem's POSIX (fcntl) locks, so the database must live on a filesystem whose
+# locking works, such as a local disk or NFSv4 with locking enabled; SMB and NFS mounts without a
+# working lock manager can hand the same path to two workers or corrupt the database.
+#
+# The methods block (for up to the 30s busy timeout while another worker holds the lock); async
+# callers run them in a thread with asyncio.to_thread, which the connection and a lock allow.
+
+import functools
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+JOB_STATUSES = ('pending', 'leased', 'done', 'failed')
+
+
+def default_worker_id() -> str:
+    return os.getenv('JOB_WORKER_ID', f"{socket.gethostname()}-{os.getpid()}")
+
+
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+@dataclass
+class Job:
+    id: int
+    category: str
+    path: str
+    attempts: int
+
+
+class JobQueue:
+    def __init__(
+        self,
+        db_path: str,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS
+    ):
+        self.db_path = db_path
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._conn: Optional[sqlite3.Connection] = None
+        # One operation at a time on the shared connection, whichever thread runs it
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            # Also turns a database created in WAL mode by an older version back to a rollback journal
+            self._conn.execute('PRAGMA journal_mode=DELETE')
+            self._conn.execute(
+                '''CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    category TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at REAL NOT NULL,
+                    UNIQUE (category, path)
+                )'''
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, lease_expires)')
+        return self._conn
+
+    @_locked
+    def enqueue(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Add (category, path) items not already in the queue, in order; returns how many were new.
+
+        Safe to call from every worker on startup: existing rows keep their status.
+        """
+        conn = self._connect()
+        now = time.time()
+        before = conn.total_changes
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT OR IGNORE INTO jobs (category, path, updated_at) VALUES (?, ?, ?)',
+                ((category, path, now) for category, path in items)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return conn.total_changes - before
+
+    @_locked
+    def claim(self, limit: int = 1) -> List[Job]:
+        """Lease up to `limit` pending jobs, or jobs whose lease expired, oldest first"""
+        conn = self._connect()
+        now = time.time()
+        # IMMEDIATE takes the write lock up front, so two workers never lease the same row
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                '''SELECT id, category, path, attempts FROM jobs
+                   WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                     AND attempts < ?
+                   ORDER BY id LIMIT ?''',
+                (now, self.max_attempts, limit)
+            ).fetchall()
+            conn.executemany(
+                '''UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?,
+                   attempts = attempts + 1, updated_at = ? WHERE id = ?''',
+                ((self.worker_id, now + self.lease_seconds, now, row[0]) for row in rows)
+            )
+            # Expired leases that used up their attempts will never be claimed again
+            conn.execute(
+                '''UPDATE jobs SET status = 'failed', updated_at = ?
+                   WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?''',
+                (now, now, self.max_attempts)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [Job(job_id, category, path, attempts + 1) for job_id, category, path, attempts in rows]
+
+    @_locked
+    def heartbeat(self, job_ids: Iterable[int]) -> int:
+        """Extend this worker's leases on `job_ids`; returns how many it still holds"""
+        conn = self._connect()
+        now = time.time()
+        before = conn.total_changes
+        conn.executemany(
+            '''UPDATE jobs SET lease_expires = ?, updated_at = ?
+               WHERE id = ? AND status = 'leased' AND worker = ?''',
+            ((now + self.lease_seconds, now, job_id, self.worker_id) for job_id in job_ids)
+        )
+        return conn.total_changes - before
+
+    @_locked
+    def complete(self, job_id: int):
+        self._connect().execute(
+            '''UPDATE jobs SET status = 'done', lease_expires = NULL, updated_at = ?
+               WHERE id = ? AND worker = ?''',
+            (time.time(), job_id, self.worker_id)
+        )
+
+    @_locked
+    def fail(self, job_id: int, error: str):
+        """Release a job after an error: back to pending while attempts remain, else failed"""
+        self._connect().execute(
+            '''UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END,
+               lease_expires = NULL, last_error = ?, updated_at = ?
+               WHERE id = ? AND worker = ?''',
+            (self.max_attempts, error, time.time(), job_id, self.worker_id)
+        )
+
+    @_locked
+    def counts(self) -> Dict[str, int]:
+        rows = self._connect().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update(rows)
+        return counts
+
+    @_locked
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
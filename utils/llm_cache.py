@@ -0,0 +1,218 @@
+# Persistent, content-addressed cache for LLM responses
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODES = ('readwrite', 'replay', 'off')
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a request is not in the cache"""
+
+
+class _OwnerCancelled(Exception):
+    """Set on an in-flight request whose caller was cancelled; its waiters take the request over"""
+
+
+_schema_hashes: Dict[type, str] = {}
+
+def _schema_hash(response_model: Type[BaseModel]) -> str:
+    """Hash of the response model's JSON schema, computed once per model"""
+    if response_model not in _schema_hashes:
+        schema = json.dumps(response_model.model_json_schema(), sort_keys=True)
+        _schema_hashes[response_model] = hashlib.sha256(schema.encode('utf-8')).hexdigest()
+    return _schema_hashes[response_model]
+
+
+class LLMCache:
+    """get, put and evict block on sqlite; get_or_create runs them in a thread off the event loop"""
+
+    def __init__(
+        self,
+        db_path: str = os.getenv('LLM_CACHE_PATH', 'datasets/llm_cache.sqlite'),
+        mode: str = os.getenv('LLM_CACHE_MODE', 'readwrite'),
+        max_entries: int = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '200000')),
+        max_age_days: float = float(os.getenv('LLM_CACHE_MAX_AGE_DAYS', '30')),
+        evict_every: int = 500
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.db_path = db_path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 86400
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_evict = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # The connection is shared by the threads get_or_create runs queries in
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'off'
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.db_path):
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            # Segments run as separate processes, so rely on WAL and a busy timeout for sharing
+            self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                '''CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )'''
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)')
+            if self.mode == 'readwrite':
+                self.evict()
+        return self._conn
+
+    @staticmethod
+    def make_key(
+        messages: list,
+        model_name: str,
+        temperature: float,
+        max_tokens: int,
+        response_model: Type[BaseModel],
+        seed: int = 123
+    ) -> str:
+        """Content address of a request: everything that can change the response"""
+        payload = json.dumps(
+            {
+                'messages': messages,
+                'model': model_name,
+                'temperature': temperature,
+                'max_tokens': max_tokens,
+                'seed': seed,
+                'response_model': response_model.__name__,
+                'schema': _schema_hash(response_model),
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT response, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            now = time.time()
+            if self.max_age_seconds and now - created_at > self.max_age_seconds:
+                return None
+            if self.mode == 'readwrite':
+                conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            return response
+
+    def put(self, key: str, model_name: str, response: str):
+        if self.mode != 'readwrite':
+            return
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO responses (key, model, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, model_name, response, now, now)
+            )
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.evict_every:
+                self.evict()
+
+    def evict(self):
+        """Drop entries older than max age, then the least recently used beyond max entries"""
+        with self._lock:
+            conn = self._connect()
+            self._writes_since_evict = 0
+            if self.max_age_seconds:
+                conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.max_age_seconds,))
+            if self.max_entries:
+                conn.execute(
+                    '''DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )''',
+                    (self.max_entries,)
+                )
+
+    async def get_or_create(
+        self,
+        key: str,
+        model_name: str,
+        response_model: Type[BaseModel],
+        create: Callable[[], Awaitable[BaseModel]]
+    ) -> BaseModel:
+        """Return a cached response, join an identical in-flight request, or call create()"""
+        if not self.enabled:
+            return await create()
+
+        while True:
+            cached = await asyncio.to_thread(self.get, key)
+            if cached is not None:
+                self.hits += 1
+                return response_model.model_validate_json(cached)
+
+            if key not in self._in_flight:
+                break
+            self.coalesced += 1
+            try:
+                result = await asyncio.shield(self._in_flight[key])
+            except _OwnerCancelled:
+                # The caller that made the request was cancelled; the first waiter back here makes it again
+                continue
+            return result.model_copy(deep=True)
+
+        self.misses += 1
+        if self.mode == 'replay':
+            raise CacheMissError(f"No cached response for {response_model.__name__} request {key[:12]}")
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await create()
+            await asyncio.to_thread(self.put, key, model_name, result.model_dump_json())
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Cancelling the future would cancel every coalesced waiter along with this caller
+            future.set_exception(_OwnerCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark as retrieved so an un-awaited failure is not logged again
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        logger.info(f"LLM cache stats: {self.hits} hits, {self.misses} misses, {self.coalesced} coalesced")
+
+
+llm_cache = LLMCache()
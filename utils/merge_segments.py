@@ -1,48 +1,120 @@
 import pandas as pd
 import os
 import glob
+import re
+import sys
+
+from utils.dataset_layout import is_normalized, joined_rows, joined_table
+
+# Segment outputs, in either layout: parser_dataset_segment_0.csv or parser_dataset_segment_0.rows.csv
+_SEGMENT_RE = re.compile(r'parser_dataset_segment_(\d+)(?:\.rows)?\.(csv|parquet)$')
+_WORKER_RE = re.compile(r'parser_dataset_worker_(.+?)(?:\.rows)?\.(csv|parquet)$')
+
+def output_files(datasets_dir: str, extension: str):
+    """Output paths (as the generator names them, whatever their layout): segments in numeric order,
+    then the files of job queue workers (JOB_QUEUE_DB), one per worker"""
+    segments, workers = {}, {}
+    for file in glob.glob(os.path.join(datasets_dir, f'parser_dataset_*.{extension}')):
+        name = os.path.basename(file)
+        segment = _SEGMENT_RE.match(name)
+        worker = _WORKER_RE.match(name)
+        if segment:
+            segments[int(segment.group(1))] = os.path.join(datasets_dir, f'parser_dataset_segment_{segment.group(1)}.{extension}')
+        elif worker:
+            workers[worker.group(1)] = os.path.join(datasets_dir, f'parser_dataset_worker_{worker.group(1)}.{extension}')
+    return [segments[start] for start in sorted(segments)] + [workers[worker] for worker in sorted(workers)]
 
 def merge_segment_files():
     # Path to the datasets directory
     datasets_dir = 'datasets'
-    
-    # Pattern to match segment files
-    pattern = os.path.join(datasets_dir, 'parser_dataset_segment_*.csv')
-    
+
     # Get all segment files sorted numerically
-    segment_files = sorted(
-        glob.glob(pattern),
-        key=lambda x: int(x.split('_')[-1].replace('.csv', ''))
-    )
-    
+    segment_files = output_files(datasets_dir, 'csv')
+
     print(f"Found {len(segment_files)} segment files")
-    
+
     # Read and combine all segments
     dfs = []
     for file in segment_files:
         print(f"Reading {file}...")
         try:
-            df = pd.read_csv(file)
+            if is_normalized(file):
+                # Normalized outputs are joined back into the wide layout
+                df = pd.DataFrame(list(joined_rows(file)))
+            else:
+                df = pd.read_csv(file)
             dfs.append(df)
             print(f"Added {len(df)} rows from {file}")
         except Exception as e:
             print(f"Error reading {file}: {str(e)}")
-    
+
     if not dfs:
         print("No valid segment files found!")
         return
-    
+
     # Combine all dataframes
     print("\nMerging segments...")
     final_df = pd.concat(dfs, ignore_index=True)
-    
+
+    # A path re-leased to a restarted job queue worker is written again to that worker's new file;
+    # keep the first copy of each row (rows from before row keys existed have none and are all kept)
+    if 'row_key' in final_df.columns:
+        duplicated = final_df['row_key'].notna() & final_df.duplicated(subset='row_key', keep='first')
+        if duplicated.any():
+            print(f"Dropping {int(duplicated.sum())} duplicate rows")
+            final_df = final_df[~duplicated]
+
     # Save merged file
     output_file = os.path.join(datasets_dir, 'parser_dataset_final.csv')
     final_df.to_csv(output_file, index=False)
-    
+
     print(f"\nMerge complete!")
     print(f"Total rows in final dataset: {len(final_df)}")
     print(f"Final file saved as: {output_file}")
 
+def merge_parquet_segments():
+    """Merge Parquet segment outputs (OUTPUT_FORMAT=parquet) into one Parquet file"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    datasets_dir = 'datasets'
+    segment_outputs = output_files(datasets_dir, 'parquet')
+    print(f"Found {len(segment_outputs)} Parquet segments")
+
+    output_file = os.path.join(datasets_dir, 'parser_dataset_final.parquet')
+    total_rows = 0
+    duplicates = 0
+    seen_keys = set()
+    writer = None
+    # Copy segment by segment, so the merge never holds more than one segment in memory (plus the row
+    # keys seen so far, to drop rows a restarted job queue worker wrote again)
+    for segment_output in segment_outputs:
+        table = joined_table(segment_output)
+        keep = []
+        for key in table.column('row_key').to_pylist():
+            keep.append(key is None or key not in seen_keys)
+            seen_keys.add(key)
+        duplicates += keep.count(False)
+        table = table.filter(pa.array(keep))
+        if table.num_rows == 0:
+            continue
+        if writer is None:
+            writer = pq.ParquetWriter(output_file, table.schema, compression='zstd')
+        writer.write_table(table)
+        total_rows += table.num_rows
+        print(f"Added {table.num_rows} rows from {segment_output}")
+    if writer is None:
+        print("No valid Parquet segments found!")
+        return
+    writer.close()
+
+    print("\nMerge complete!")
+    print(f"Total rows in final dataset: {total_rows} ({duplicates} duplicate rows dropped)")
+    print(f"Final file saved as: {output_file}")
+
 if __name__ == "__main__":
-    merge_segment_files()
\ No newline at end of file
+    # Run from the repo root: python -m utils.merge_segments [parquet]
+    if len(sys.argv) > 1 and sys.argv[1] == 'parquet':
+        merge_parquet_segments()
+    else:
+        merge_segment_files()
@@ -0,0 +1,137 @@
+# Query-aware pruning of the ontology lists that go into the parse prompt
+
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+from constants.constants import ONTOLOGY
+from constants.ontology_index import OntologyIndex, ontology_index
+
+# ONTOLOGY_PRUNING=0 always sends the full lists
+ONTOLOGY_PRUNING = os.getenv('ONTOLOGY_PRUNING', '1') == '1'
+# Categories this small are always sent in full; pruning them saves almost nothing
+SMALL_CATEGORY_SIZE = 20
+
+# Segment words too common to say anything about which branch a query is about
+STOP_TOKENS = {'and', 'of', 'or', 'with', 'fund', 'funds', 'schemes', 'services', 'other', 'year'}
+
+# Everyday words mapped to the segment words the ontology uses for them
+ALIASES = {
+    'it': ['information', 'technology', 'software'],
+    'tech': ['technology', 'software'],
+    'pharma': ['pharmaceuticals'],
+    'bank': ['banks', 'banking'],
+    'fmcg': ['staples', 'household', 'food'],
+    'auto': ['automobiles', 'automobile'],
+    'realty': ['real', 'estate', 'reits'],
+    'reit': ['reits'],
+    'largecap': ['large'],
+    'midcap': ['mid'],
+    'smallcap': ['small'],
+    'bluechip': ['large'],
+    'mf': ['mutual'],
+    'gsec': ['government', 'gilt'],
+    'govt': ['government'],
+    'risky': ['volatility', 'risk'],
+    'volatile': ['volatility'],
+    'ter': ['expense'],
+    'cost': ['expense'],
+    'expensive': ['expense'],
+    'elss': ['tax'],
+    'kids': ['childrens'],
+    'child': ['childrens'],
+    'children': ['childrens'],
+    'retire': ['retirement'],
+    'house': ['home'],
+    'travel': ['vacation'],
+    'debt': ['debt', 'bonds'],
+    'global': ['international'],
+    'overseas': ['international', 'overseas'],
+    'foreign': ['international'],
+    'intl': ['international'],
+    'us': ['international'],
+    'crude': ['oil'],
+    'safe': ['liquid', 'overnight', 'volatility'],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _segment_tokens(segment: str) -> Set[str]:
+    return {token for token in segment.split('_') if token and token not in STOP_TOKENS}
+
+
+def _query_tokens(text: str) -> Set[str]:
+    tokens = set()
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.add(token)
+        if len(token) > 3 and token.endswith('s'):
+            tokens.add(token[:-1])
+        tokens.update(ALIASES.get(token, ()))
+    return tokens
+
+
+class OntologyRetriever:
+    def __init__(self, ontology: Dict[str, List[str]] = ONTOLOGY, index: OntologyIndex = ontology_index):
+        self.ontology = ontology
+        self.index = index
+        # token of a path's last segment -> paths, so a query only touches the branches it names
+        self._paths_by_token: Dict[str, Set[str]] = defaultdict(set)
+        self._prefix_tokens: Dict[str, Set[str]] = defaultdict(set)
+        self._category_of: Dict[str, str] = {}
+        for category, paths in ontology.items():
+            for path in paths:
+                self._category_of[path] = category
+                for token in _segment_tokens(path.rsplit('/', 1)[-1]):
+                    self._paths_by_token[token].add(path)
+                    if len(token) >= 5:
+                        self._prefix_tokens[token[:5]].add(token)
+
+    def _matching_paths(self, tokens: Set[str]) -> Set[str]:
+        matched = set()
+        for token in tokens:
+            matched |= self._paths_by_token.get(token, set())
+            if len(token) >= 5:
+                # Prefix match so "technological" finds "technology"
+                for candidate in self._prefix_tokens.get(token[:5], ()):
+                    if candidate.startswith(token) or token.startswith(candidate):
+                        matched |= self._paths_by_token[candidate]
+        return matched
+
+    def select(self, texts: Iterable[str]) -> Dict[str, List[str]]:
+        """Ontology lists restricted to branches relevant to `texts`, in their original order.
+
+        Large categories keep their matched nodes, those nodes' ancestors and children, plus the
+        top-level nodes of the category. Small categories, and any category with no matched node,
+        fall back to their full lists, so a query naming only an exposure still sees every attribute.
+        """
+        if not ONTOLOGY_PRUNING:
+            return self.ontology
+        tokens = set()
+        for text in texts:
+            tokens |= _query_tokens(text)
+        matched = self._matching_paths(tokens)
+        if not matched:
+            return self.ontology
+
+        keep: Set[int] = set()
+        matched_categories = {self._category_of[path] for path in matched}
+        for path in matched:
+            node_id = self.index.id_of(path)
+            keep.add(node_id)
+            keep.update(self.index.children(node_id))
+            keep.update(self.index.ancestors(node_id))
+
+        selected = {}
+        for category, paths in self.ontology.items():
+            if len(paths) <= SMALL_CATEGORY_SIZE or category not in matched_categories:
+                selected[category] = paths
+            else:
+                selected[category] = [
+                    path for path in paths if path.count('/') == 1 or self.index.id_of(path) in keep
+                ]
+        return selected
+
+
+ontology_retriever = OntologyRetriever()
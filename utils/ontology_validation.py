@@ -0,0 +1,133 @@
+# Validation of generated node paths against the ontology, with local repair of near misses
+
+import logging
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from constants.ontology_index import OntologyIndex, ontology_index
+
+logger = logging.getLogger(__name__)
+
+# Total segment edit cost still accepted as a repair: one missing or extra segment, or a few typos.
+# Dropping the trailing segments of a path is never a repair: it would lose what the node names
+MAX_REPAIR_COST = 1.0
+# Segments differing in more than this share of characters count as different words, not typos
+MAX_SEGMENT_TYPO = 0.34
+
+
+def _edit_distance(a, b, substitution_cost=None) -> float:
+    """Levenshtein distance between two sequences, with an optional fractional substitution cost"""
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i, x in enumerate(a, start=1):
+        current = [float(i)]
+        for j, y in enumerate(b, start=1):
+            cost = 0.0 if x == y else (substitution_cost(x, y) if substitution_cost else 1.0)
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost))
+        previous = current
+    return previous[-1]
+
+
+def _segment_cost(a: str, b: str) -> float:
+    """Substitution cost between two path segments: their normalised character edit distance for
+    typos, and more than a deletion plus an insertion for unrelated words"""
+    ratio = _edit_distance(a, b) / max(len(a), len(b))
+    return ratio if ratio <= MAX_SEGMENT_TYPO else 2.0
+
+
+def _normalize(path: str) -> str:
+    path = path.strip().lower().replace('\\', '/')
+    path = re.sub(r"[\s\-]+", "_", path)
+    return "/".join(segment for segment in path.split('/') if segment)
+
+
+class OntologyRepairer:
+    def __init__(self, index: OntologyIndex = ontology_index):
+        self.index = index
+        self.segments: Dict[str, List[Tuple[str, List[str]]]] = {}
+        # (category, trailing segments) -> paths ending with them, for suffix matching
+        self._suffixes: Dict[Tuple[str, Tuple[str, ...]], List[str]] = defaultdict(list)
+        # category -> last segment -> paths ending with it, for matching a misspelt leaf
+        self._leaves: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+        for root in index.roots():
+            category = index.path_of(root)
+            self.segments[category] = []
+            for path in index.listed_paths(category):
+                segments = path.split('/')[1:]
+                self.segments[category].append((path, segments))
+                for start in range(len(segments)):
+                    self._suffixes[(category, tuple(segments[start:]))].append(path)
+                if segments:
+                    self._leaves[category][segments[-1]].append(path)
+        self.repairs: Counter = Counter()
+
+    def is_valid(self, category: str, path: str) -> bool:
+        return path in self.index and path.split('/', 1)[0] == category
+
+    def _closest(self, category: str, segments: List[str], candidates: List[str]) -> Optional[str]:
+        """Candidate with the lowest segment edit cost, or None when the best is tied"""
+        scored = sorted(
+            (_edit_distance(segments, path.split('/')[1:], _segment_cost), path) for path in candidates
+        )
+        if len(scored) > 1 and scored[0][0] == scored[1][0]:
+            return None
+        return scored[0][1]
+
+    def _find(self, category: str, path: str) -> Optional[str]:
+        normalized = _normalize(path)
+        if not normalized.startswith(category + '/'):
+            normalized = f"{category}/{normalized}"
+        if self.is_valid(category, normalized):
+            return normalized
+        segments = normalized.split('/')[1:]
+
+        # Suffix match: "vehicle/mutual_fund" -> "vehicle/funds/mutual_fund"
+        for start in range(len(segments)):
+            candidates = self._suffixes.get((category, tuple(segments[start:])))
+            if candidates:
+                if len(candidates) == 1:
+                    return candidates[0]
+                closest = self._closest(category, segments, candidates)
+                if closest is not None:
+                    return closest
+                break
+        if not segments:
+            return None
+
+        # Misspelt leaf: "attribute/technical/volatilty" -> "attribute/technical/risk/volatility"
+        candidates = [
+            candidate
+            for leaf, paths in self._leaves[category].items()
+            if _segment_cost(segments[-1], leaf) <= MAX_SEGMENT_TYPO
+            for candidate in paths
+        ]
+        if candidates:
+            return self._closest(category, segments, candidates)
+
+        # Segment-level edit distance: typos and a missing or extra segment, but never only the
+        # ancestors of the path ("attribute/technical" for "attribute/technical/volatilty")
+        best_cost, best_path, tied = None, None, False
+        for candidate, candidate_segments in self.segments[category]:
+            if len(candidate_segments) < len(segments) and segments[:len(candidate_segments)] == candidate_segments:
+                continue
+            cost = _edit_distance(segments, candidate_segments, _segment_cost)
+            if best_cost is None or cost < best_cost:
+                best_cost, best_path, tied = cost, candidate, False
+            elif cost == best_cost:
+                tied = True
+        if best_cost is not None and best_cost <= MAX_REPAIR_COST and not tied:
+            return best_path
+        return None
+
+    def repair(self, category: str, path: str) -> Optional[str]:
+        """The valid path for `path`: itself, its nearest repair, or None if it cannot be repaired"""
+        if self.is_valid(category, path):
+            return path
+        repaired = self._find(category, path)
+        if repaired is not None:
+            self.repairs[(category, path, repaired)] += 1
+            logger.info(f"Repaired {category} node '{path}' -> '{repaired}'")
+        return repaired
+
+
+ontology_repairer = OntologyRepairer()
@@ -0,0 +1,177 @@
+# Parquet output for generated datasets (OUTPUT_FORMAT=parquet), with typed nested columns
+#
+# An output "file" such as datasets/parser_dataset_segment_0.parquet is a directory of part files,
+# readable as one table with pyarrow.parquet.read_table or pandas.read_parquet. Parquet files
+# cannot be appended to once closed, so rows fill full row groups of one part until it holds
+# PARQUET_PART_ROWS rows or its oldest row is PARQUET_PART_SECONDS old (checked at checkpoints), or
+# the writer closes; then the part is closed, synced and renamed from its .tmp name, so readers
+# never see a part without its footer. Checkpoints do not close parts: until its part closes a row
+# is durable only through the resume sidecar (see DatasetSink), which a resumed run rewrites it from.
+# The next run deletes the .tmp part an interrupted run left.
+
+import glob
+import os
+import time
+import typing
+from typing import Any, Dict, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from pydantic_models import ParsedOutput
+from utils.dataset_writer import AsyncDatasetWriter
+from utils.resume import ROW_FIELDNAMES
+
+PARQUET_ROW_GROUP_SIZE = int(os.getenv('PARQUET_ROW_GROUP_SIZE', '1000'))
+PARQUET_PART_ROWS = int(os.getenv('PARQUET_PART_ROWS', '50000'))
+PARQUET_PART_SECONDS = float(os.getenv('PARQUET_PART_SECONDS', '600'))
+PARQUET_COMPRESSION = os.getenv('PARQUET_COMPRESSION', 'zstd')
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet output needs pyarrow: pip install pyarrow")
+
+
+def _item_type(model) -> 'pa.DataType':
+    return pa.struct([pa.field(name, pa.string()) for name in model.model_fields])
+
+
+def parsed_output_type() -> 'pa.DataType':
+    """Arrow struct mirroring ParsedOutput: one list of node structs per category"""
+    return pa.struct([
+        pa.field(name, pa.list_(_item_type(typing.get_args(field.annotation)[0])))
+        for name, field in ParsedOutput.model_fields.items()
+    ])
+
+
+def column_type(name: str) -> 'pa.DataType':
+    if name == 'original_path':
+        return pa.struct([pa.field('category', pa.string()), pa.field('node', pa.string())])
+    if name == 'matched_paths':
+        return pa.struct([pa.field('combinations', pa.list_(parsed_output_type()))])
+    if name == 'parsed_output':
+        return parsed_output_type()
+    return pa.string()
+
+
+def dataset_schema(fieldnames: List[str] = ROW_FIELDNAMES) -> 'pa.Schema':
+    """Schema for a table with the given columns (the wide layout by default)"""
+    require_pyarrow()
+    return pa.schema([pa.field(name, column_type(name)) for name in fieldnames])
+
+
+def part_files(dataset_path: str) -> List[str]:
+    """Completed part files of a Parquet output, in write order"""
+    return sorted(glob.glob(os.path.join(dataset_path, 'part-*.parquet')))
+
+
+def read_parts(dataset_path: str, fieldnames: List[str], columns: Optional[List[str]] = None) -> 'pa.Table':
+    """The completed parts of a Parquet output as one table; the .tmp part an interrupted run left
+    open is not read. `fieldnames` gives the schema of an output with no parts yet"""
+    require_pyarrow()
+    tables = [pq.read_table(part, columns=columns) for part in part_files(dataset_path)]
+    if not tables:
+        schema = dataset_schema(fieldnames)
+        return schema.empty_table().select(columns) if columns else schema.empty_table()
+    return pa.concat_tables(tables)
+
+
+def read_row_keys(dataset_path: str) -> List[str]:
+    require_pyarrow()
+    keys = []
+    for part in part_files(dataset_path):
+        keys.extend(pq.read_table(part, columns=['row_key']).column('row_key').to_pylist())
+    return keys
+
+
+class AsyncParquetWriter(AsyncDatasetWriter):
+    def __init__(
+        self,
+        file_path: str,
+        fieldnames: List[str] = ROW_FIELDNAMES,
+        row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+        **kwargs
+    ):
+        require_pyarrow()
+        super().__init__(file_path, **kwargs)
+        self.schema = dataset_schema(fieldnames)
+        self.row_group_size = row_group_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._part_rows = 0
+        self._part_path: Optional[str] = None
+        self._writer = None
+        # When the oldest row not yet in a closed part arrived
+        self._oldest: Optional[float] = None
+
+    def _prepare(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(data)
+        if 'original_path' in row:
+            # {category: [node]} as written to CSV becomes a typed (category, node) struct
+            (category, nodes), = row['original_path'].items()
+            row['original_path'] = {'category': category, 'node': nodes[0]}
+        return row
+
+    def _open(self):
+        os.makedirs(self.file_path, exist_ok=True)
+        # Each output has a single writer, so a .tmp part here was left open by an interrupted run
+        for orphan in glob.glob(os.path.join(self.file_path, 'part-*.parquet.tmp')):
+            os.remove(orphan)
+
+    def _start_part(self):
+        existing = part_files(self.file_path)
+        number = int(os.path.basename(existing[-1])[5:10]) + 1 if existing else 0
+        self._part_path = os.path.join(self.file_path, f"part-{number:05d}.parquet")
+        self._writer = pq.ParquetWriter(f"{self._part_path}.tmp", self.schema, compression=PARQUET_COMPRESSION)
+        self._part_rows = 0
+
+    def _flush_row_group(self):
+        if not self._buffer:
+            return
+        if self._writer is None:
+            self._start_part()
+        self._writer.write_table(pa.Table.from_pylist(self._buffer, schema=self.schema))
+        self._part_rows += len(self._buffer)
+        self._buffer = []
+        if self._part_rows >= PARQUET_PART_ROWS:
+            self._finish_part()
+
+    def _finish_part(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        with open(f"{self._part_path}.tmp", 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(f"{self._part_path}.tmp", self._part_path)
+        self._writer = None
+        self._oldest = None
+        # Sync the directory too, or the rename may not survive a crash
+        directory = os.open(self.file_path, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def _write_rows(self, rows: List[Dict[str, Any]]):
+        if rows and self._oldest is None:
+            self._oldest = time.monotonic()
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.row_group_size:
+            self._flush_row_group()
+
+    def _sync(self):
+        # Closing the part at every checkpoint would leave a part per path; close it once it is old
+        if self._oldest is not None and time.monotonic() - self._oldest >= PARQUET_PART_SECONDS:
+            self._flush_row_group()
+            self._finish_part()
+
+    def _durable(self) -> bool:
+        return self._writer is None and not self._buffer
+
+    def _close(self):
+        self._flush_row_group()
+        self._finish_part()
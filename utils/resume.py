@@ -0,0 +1,160 @@
+# Crash-safe resuming: deterministic keys for every row, and a sidecar of intermediate stage outputs
+#
+# Each output CSV gets a `<file>.stages.jsonl` sidecar recording matched ontologies, queries and
+# reasonings as they are produced. On restart the finished rows (the row_key column) and the sidecar
+# are read back, and only the work that is missing is sent to the API again. Sidecar records are
+# buffered and appended in a thread, every RESUME_FLUSH_RECORDS records and at each checkpoint; a
+# crash loses at most the buffered stage outputs, which resuming pays for again.
+
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from prompt import PROMPT_VERSION
+from utils.dataset_writer import truncate_torn_row
+
+logger = logging.getLogger(__name__)
+
+RESUME_FLUSH_RECORDS = int(os.getenv('RESUME_FLUSH_RECORDS', '64'))
+# Stages holding written rows until their format makes them durable (see DatasetSink): only the
+# records of rows missing from the output are loaded back, and none are kept while running
+ROW_DATA_STAGES = ('row_data', 'row_path')
+
+# row_key goes last so positional readers of the older five columns are unaffected
+ROW_FIELDNAMES = ['original_path', 'matched_paths', 'query', 'reasoning', 'parsed_output', 'row_key']
+
+
+def path_key(category: str, path: str) -> str:
+    return f"{category}:{path}@v{PROMPT_VERSION}"
+
+
+def row_key(category: str, path: str, query_index: int) -> str:
+    """Idempotency key of the row for a path's query_index-th query under the current prompts"""
+    payload = json.dumps([category, path, query_index, PROMPT_VERSION])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:20]
+
+
+class ResumeState:
+    """Finished rows and saved stage outputs of one output file"""
+
+    def __init__(self, file_path: str, fieldnames: List[str] = ROW_FIELDNAMES):
+        self.file_path = file_path
+        self.sidecar_path = f"{file_path}.stages.jsonl"
+        self.fieldnames = fieldnames
+        self.done_rows: Set[str] = set()
+        self.stages: Dict[Tuple[str, str], Any] = {}
+        self._torn_tail = False
+        # Sidecar lines not yet appended; _lock serializes flushes from worker threads
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Future] = None
+        self._load()
+
+    def _load(self):
+        if self.file_path.endswith('.parquet'):
+            if os.path.isdir(self.file_path):
+                from utils.parquet_writer import read_row_keys
+                self.done_rows.update(read_row_keys(self.file_path))
+        elif os.path.isfile(self.file_path):
+            # A row torn by a crash is regenerated rather than read back with a garbled row_key
+            truncate_torn_row(self.file_path)
+            with open(self.file_path, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.DictReader(f)
+                if reader.fieldnames:
+                    # Files written before row keys existed keep their header; the sidecar tracks their rows
+                    self.fieldnames = list(reader.fieldnames)
+                if 'row_key' in self.fieldnames:
+                    self.done_rows.update(row['row_key'] for row in reader if row.get('row_key'))
+        if os.path.isfile(self.sidecar_path):
+            with open(self.sidecar_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._torn_tail = not line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave the last line half written
+                        continue
+                    if record['stage'] == 'row':
+                        self.done_rows.add(record['key'])
+                    elif record['stage'] == 'row_data' and record['key'] in self.done_rows:
+                        continue
+                    else:
+                        self.stages[(record['stage'], record['key'])] = record['value']
+        if self.done_rows or self.stages:
+            logger.info(
+                f"Resuming {self.file_path}: {len(self.done_rows)} rows done, "
+                f"{len(self.stages)} stage outputs saved"
+            )
+
+    def get(self, stage: str, key: str) -> Optional[Any]:
+        return self.stages.get((stage, key))
+
+    def record(self, stage: str, key: str, value: Any = None):
+        """Save a stage output (or, for stage 'row', mark a row written) in the sidecar"""
+        if stage == 'row':
+            self.done_rows.add(key)
+        elif stage not in ROW_DATA_STAGES:
+            self.stages[(stage, key)] = value
+        self._pending.append(json.dumps({'stage': stage, 'key': key, 'value': value}, ensure_ascii=False) + "\n")
+        if len(self._pending) >= RESUME_FLUSH_RECORDS:
+            self._flush_soon()
+
+    def _flush_soon(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(asyncio.to_thread(self.flush))
+            self._flush_task.add_done_callback(self._flush_failed)
+
+    def _flush_failed(self, task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to append to {self.sidecar_path}: {str(task.exception())}")
+
+    def flush(self):
+        """Append the buffered records to the sidecar; blocks, so async callers use checkpoint()"""
+        with self._lock:
+            lines, self._pending = self._pending, []
+            if not lines:
+                return
+            if os.path.dirname(self.sidecar_path):
+                os.makedirs(os.path.dirname(self.sidecar_path), exist_ok=True)
+            with open(self.sidecar_path, 'a', encoding='utf-8') as f:
+                if self._torn_tail:
+                    # Start a fresh line after the half-written record a crash left behind
+                    f.write("\n")
+                    self._torn_tail = False
+                f.writelines(lines)
+                # Row data records are the only copy of rows in an open Parquet part
+                f.flush()
+                os.fsync(f.fileno())
+
+    async def checkpoint(self):
+        await asyncio.to_thread(self.flush)
+
+    def row_done(self, key: str) -> bool:
+        return key in self.done_rows
+
+    def mark_row(self, key: str):
+        """Note a row synced to disk; files without a row_key column record it in the sidecar instead"""
+        if 'row_key' in self.fieldnames:
+            self.done_rows.add(key)
+        else:
+            self.record('row', key)
+
+
+_states: Dict[str, ResumeState] = {}
+
+def resume_state(file_path: str, fieldnames: List[str] = ROW_FIELDNAMES) -> ResumeState:
+    """The resume state of an output file holding row keys, loaded from disk on first use;
+    `fieldnames` is the header a new file gets"""
+    if file_path not in _states:
+        _states[file_path] = ResumeState(file_path, fieldnames)
+    return _states[file_path]
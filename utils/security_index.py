@@ -0,0 +1,103 @@
+# Fuzzy lookup over the securities universe, used to send only likely tickers in prompts
+
+import heapq
+import math
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+# Number of candidate securities put in a prompt (and offered at least by the ontology matching prompt); FULL_SECURITIES_UNIVERSE=1 sends all of them
+TICKER_CANDIDATES = int(os.getenv('TICKER_CANDIDATES', '25'))
+FULL_SECURITIES_UNIVERSE = os.getenv('FULL_SECURITIES_UNIVERSE', '0') == '1'
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens; ontology paths split on '/' and '_' as well"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SecurityIndex:
+    def __init__(self, names: Iterable[str], min_similarity: float = 0.5):
+        self.names = list(names)
+        self.min_similarity = min_similarity
+        # token -> ids of names containing it, and trigram -> tokens, so a query token is
+        # matched fuzzily against the vocabulary once instead of against every name
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for name_id, name in enumerate(self.names):
+            for token in set(tokenize(name)):
+                self._postings[token].append(name_id)
+        self._vocab_trigrams: Dict[str, Set[str]] = {token: trigrams(token) for token in self._postings}
+        self._trigram_tokens: Dict[str, List[str]] = defaultdict(list)
+        for token, grams in self._vocab_trigrams.items():
+            for gram in grams:
+                self._trigram_tokens[gram].append(token)
+        # Rare tokens ("pidilite") identify a security; common ones ("fund", "growth") barely count
+        self._idf = {
+            token: math.log(len(self.names) / len(ids)) for token, ids in self._postings.items()
+        }
+
+    def _similar_tokens(self, token: str) -> Dict[str, float]:
+        """Vocabulary tokens whose trigram Jaccard similarity with `token` is high enough"""
+        if token in self._postings:
+            return {token: 1.0}
+        query_grams = trigrams(token)
+        overlaps: Dict[str, int] = defaultdict(int)
+        for gram in query_grams:
+            for candidate in self._trigram_tokens.get(gram, ()):
+                overlaps[candidate] += 1
+        similar = {}
+        for candidate, shared in overlaps.items():
+            similarity = shared / (len(query_grams) + len(self._vocab_trigrams[candidate]) - shared)
+            if similarity >= self.min_similarity:
+                similar[candidate] = similarity
+        return similar
+
+    def search(self, text: str, k: int = TICKER_CANDIDATES) -> List[str]:
+        """Top-k security names for a query or ontology path, best match first"""
+        scores: Dict[int, float] = defaultdict(float)
+        for token in set(tokenize(text)):
+            if len(token) < 3 and not token.isdigit():
+                continue
+            best: Dict[int, float] = {}
+            for candidate, similarity in self._similar_tokens(token).items():
+                weight = similarity * self._idf[candidate]
+                for name_id in self._postings[candidate]:
+                    if weight > best.get(name_id, 0.0):
+                        best[name_id] = weight
+            for name_id, weight in best.items():
+                scores[name_id] += weight
+        top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.names[name_id] for name_id, _ in top]
+
+    def candidates(self, texts: Iterable[str], k: int = TICKER_CANDIDATES, minimum: int = 0) -> List[str]:
+        """Securities to offer in a prompt covering `texts`, or the full universe when opted in.
+
+        With `minimum`, too few matches are topped up with an even sample of the universe, for
+        prompts that must always offer some real securities to choose from.
+        """
+        if FULL_SECURITIES_UNIVERSE:
+            return self.names
+        selected: List[str] = []
+        seen: Set[str] = set()
+        for text in texts:
+            for name in self.search(text, k):
+                if name not in seen:
+                    seen.add(name)
+                    selected.append(name)
+        if len(selected) < minimum and self.names:
+            step = max(1, len(self.names) // minimum)
+            for name in self.names[::step]:
+                if len(selected) >= minimum:
+                    break
+                if name not in seen:
+                    seen.add(name)
+                    selected.append(name)
+        return selected
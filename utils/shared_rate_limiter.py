@@ -0,0 +1,130 @@
+# Rate limiter whose token buckets live in a memory-mapped file, so every process on the machine
+# draws from one RPM/TPM budget. Updates are serialised with flock on the same file.
+
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict
+
+from utils.utils import DEFAULT_LIMITS, MODEL_LIMITS, RateLimiter
+
+RATE_LIMITER_STATE = os.getenv(
+    'RATE_LIMITER_STATE', os.path.join(tempfile.gettempdir(), 'parser_dataset_rate_limiter.bin')
+)
+
+_MAGIC = b'RLIM'
+_VERSION = 1
+_HEADER = struct.Struct('<4sI')
+# model key, available requests, available tokens, last refill (time.monotonic, shared by all processes)
+_SLOT = struct.Struct('<Q3d')
+MAX_MODELS = 32
+
+
+class SharedState:
+    """Fixed table of per-model bucket slots in a memory-mapped file"""
+
+    def __init__(self, file_path: str = RATE_LIMITER_STATE):
+        size = _HEADER.size + MAX_MODELS * _SLOT.size
+        self.fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self.locked():
+            if os.fstat(self.fd).st_size < size:
+                os.ftruncate(self.fd, size)
+            self.map = mmap.mmap(self.fd, size)
+            magic, version = _HEADER.unpack_from(self.map, 0)
+            if magic != _MAGIC or version != _VERSION:
+                self.map[:] = bytes(size)
+                _HEADER.pack_into(self.map, 0, _MAGIC, _VERSION)
+
+    @contextmanager
+    def locked(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def slot(self, model_name: str, requests: float, tokens: float) -> int:
+        """Offset of the model's slot, claiming a full-bucket slot if no process has used the model yet"""
+        key = zlib.crc32(model_name.encode('utf-8')) | 1 << 32
+        with self.locked():
+            for index in range(MAX_MODELS):
+                offset = _HEADER.size + index * _SLOT.size
+                slot_key = _SLOT.unpack_from(self.map, offset)[0]
+                if slot_key == key:
+                    return offset
+                if slot_key == 0:
+                    _SLOT.pack_into(self.map, offset, key, requests, tokens, time.monotonic())
+                    return offset
+        raise RuntimeError(f"Shared rate limiter state {RATE_LIMITER_STATE} has no free slot for {model_name}")
+
+
+class SharedModelBudget:
+    """Same interface as ModelBudget, but each reservation is a locked read-modify-write of the shared slot"""
+
+    def __init__(self, state: SharedState, model_name: str, requests_per_minute: int, tokens_per_minute: int):
+        self.state = state
+        self.request_capacity = float(requests_per_minute)
+        self.token_capacity = float(tokens_per_minute)
+        self.request_rate = requests_per_minute / 60.0
+        self.token_rate = tokens_per_minute / 60.0
+        self.offset = state.slot(model_name, self.request_capacity, self.token_capacity)
+        # In-process FIFO, as in ModelBudget; across processes the order is whoever takes the lock first
+        self.waiters: Deque = deque()
+
+    def _refilled(self):
+        key, requests, tokens, updated = _SLOT.unpack_from(self.state.map, self.offset)
+        now = time.monotonic()
+        if now < updated:
+            # The state outlived a reboot (the monotonic clock restarted): start from full buckets
+            return key, self.request_capacity, self.token_capacity, now
+        elapsed = now - updated
+        requests = min(self.request_capacity, requests + elapsed * self.request_rate)
+        tokens = min(self.token_capacity, tokens + elapsed * self.token_rate)
+        return key, requests, tokens, now
+
+    def try_take(self, tokens: int) -> float:
+        """Reserve one request and `tokens` tokens if both are available now, else return the seconds to wait"""
+        with self.state.locked():
+            key, available_requests, available_tokens, now = self._refilled()
+            delay = max(
+                (1 - available_requests) / self.request_rate,
+                (min(tokens, self.token_capacity) - available_tokens) / self.token_rate,
+                0.0
+            )
+            if delay <= 0:
+                available_requests -= 1
+                available_tokens -= tokens
+            _SLOT.pack_into(self.state.map, self.offset, key, available_requests, available_tokens, now)
+        return delay
+
+    def settle(self, unused_tokens: int):
+        """Return over-reserved tokens, or take the shortfall when usage exceeded the estimate"""
+        with self.state.locked():
+            key, available_requests, available_tokens, now = self._refilled()
+            available_tokens = min(self.token_capacity, available_tokens + unused_tokens)
+            _SLOT.pack_into(self.state.map, self.offset, key, available_requests, available_tokens, now)
+
+
+class SharedRateLimiter(RateLimiter):
+    def __init__(
+        self,
+        max_requests_per_minute: int = DEFAULT_LIMITS[0],
+        max_tokens_per_minute: int = DEFAULT_LIMITS[1],
+        file_path: str = RATE_LIMITER_STATE
+    ):
+        super().__init__(max_requests_per_minute, max_tokens_per_minute)
+        self.state = SharedState(file_path)
+        self.budgets: Dict[str, SharedModelBudget] = {}
+
+    def _budget(self, model_name: str) -> SharedModelBudget:
+        if model_name not in self.budgets:
+            self.budgets[model_name] = SharedModelBudget(
+                self.state, model_name, *MODEL_LIMITS.get(model_name, self.default_limits)
+            )
+        return self.budgets[model_name]
@@ -1,26 +1,134 @@
 # To rate limit the requests to the API
 
 import asyncio
+import json
+import os
 import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Tuple
+
+# Per-model (requests per minute, tokens per minute) budgets, overridable with
+# OPENAI_MODEL_LIMITS='{"gpt-4o": [rpm, tpm]}'
+DEFAULT_LIMITS: Tuple[int, int] = (
+    int(os.getenv('OPENAI_RPM', '30000')),
+    int(os.getenv('OPENAI_TPM', '2000000'))
+)
+MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    model: tuple(limits) for model, limits in json.loads(os.getenv('OPENAI_MODEL_LIMITS', '{}')).items()
+}
+
+
+def estimate_tokens(messages: list, max_tokens: int = 0) -> int:
+    """Rough token count for a chat request (~4 characters per token plus per-message overhead).
+
+    OpenAI counts max_tokens against the TPM limit up front, so it is included.
+    """
+    chars = sum(len(str(message.get('content', ''))) for message in messages)
+    return chars // 4 + 4 * len(messages) + max_tokens
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (requests larger than the bucket only wait for a full bucket)"""
+        self._refill()
+        deficit = min(amount, self.capacity) - self.tokens
+        return max(0.0, deficit / self.rate)
+
+    def take(self, amount: float):
+        # May go negative for oversized requests; the debt is repaid by refill
+        self.tokens -= amount
+
+    def give_back(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+@dataclass
+class Reservation:
+    model_name: str
+    tokens: int
+
+
+class ModelBudget:
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    def wait_time(self, tokens: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def try_take(self, tokens: int) -> float:
+        """Reserve one request and `tokens` tokens if both are available now, else return the seconds to wait"""
+        delay = self.wait_time(tokens)
+        if delay <= 0:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        return delay
+
+    def settle(self, unused_tokens: int):
+        """Return over-reserved tokens, or take the shortfall when usage exceeded the estimate"""
+        if unused_tokens > 0:
+            self.tokens.give_back(unused_tokens)
+        elif unused_tokens < 0:
+            self.tokens.take(-unused_tokens)
+
 
 class RateLimiter:
-    def __init__(self, max_requests_per_minute: int = 30000):
-        self.max_requests_per_minute = max_requests_per_minute
-        self.requests = []
-        self.lock = asyncio.Lock()
-
-    async def acquire(self):
-        async with self.lock:
-            current_time = time.time()
-            # Remove requests older than 1 minute
-            self.requests = [req_time for req_time in self.requests 
-                           if current_time - req_time < 60]
-            
-            if len(self.requests) >= self.max_requests_per_minute:
-                # Wait until we can make another request
-                await asyncio.sleep(0.1)
-                return await self.acquire()
-            
-            self.requests.append(current_time)
-
-rate_limiter = RateLimiter()
\ No newline at end of file
+    def __init__(self, max_requests_per_minute: int = DEFAULT_LIMITS[0], max_tokens_per_minute: int = DEFAULT_LIMITS[1]):
+        self.default_limits = (max_requests_per_minute, max_tokens_per_minute)
+        self.budgets: Dict[str, ModelBudget] = {}
+
+    def _budget(self, model_name: str) -> ModelBudget:
+        if model_name not in self.budgets:
+            self.budgets[model_name] = ModelBudget(*MODEL_LIMITS.get(model_name, self.default_limits))
+        return self.budgets[model_name]
+
+    async def acquire(self, model_name: str = "gpt-4o", tokens: int = 0) -> Reservation:
+        """Wait in FIFO order until one request and `tokens` tokens are available, then reserve them"""
+        budget = self._budget(model_name)
+        waiter = asyncio.get_running_loop().create_future()
+        budget.waiters.append(waiter)
+        try:
+            # Only the head of the queue sleeps on the buckets; everyone else waits to be woken
+            if budget.waiters[0] is not waiter:
+                await waiter
+            delay = budget.try_take(tokens)
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = budget.try_take(tokens)
+        finally:
+            if budget.waiters[0] is waiter:
+                budget.waiters.popleft()
+            else:
+                budget.waiters.remove(waiter)
+            if budget.waiters and not budget.waiters[0].done():
+                budget.waiters[0].set_result(None)
+        return Reservation(model_name, tokens)
+
+    def reconcile(self, reservation: Reservation, used_tokens: int):
+        """Settle a reservation against the usage reported by the API"""
+        self._budget(reservation.model_name).settle(reservation.tokens - used_tokens)
+
+# 'local' budgets requests per process; 'shared' coordinates one budget across every process on
+# this machine (see utils/shared_rate_limiter.py)
+RATE_LIMITER_BACKEND = os.getenv('RATE_LIMITER_BACKEND', 'local')
+
+def create_rate_limiter() -> RateLimiter:
+    if RATE_LIMITER_BACKEND == 'shared':
+        from utils.shared_rate_limiter import SharedRateLimiter
+        return SharedRateLimiter()
+    return RateLimiter()
+
+rate_limiter = create_rate_limiter()
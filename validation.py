@@ -1,66 +1,59 @@
 import json
 import pandas as pd
 import ast
-from typing import List, Dict, Set, Tuple
-from pydantic import BaseModel
-from pydantic_models import ParsedOutput, Exposures, Vehicle, Attributes, Ticker, AssetType, Sebi, Objective
+from typing import List, Dict, Optional, Set, Tuple
 
-def parse_generated_response(response: str) -> ParsedOutput:
-    """Parse the generated response JSON and extract parsed_output"""
-    try:
-        response_dict = json.loads(response)
-        return ParsedOutput(**response_dict['parsed_output'])
-    except Exception as e:
-        print(f"Error parsing generated response: {e}")
-        return ParsedOutput()
+from utils.dataset_reader import ParsedDataset, read_dataset
 
-def parse_original_output(output: str) -> ParsedOutput:
-    """Convert original_parsed_output string to ParsedOutput"""
-    try:
-        # Remove class names from the string to make it valid Python literal
-        output = output.replace('Attributes(', 'dict(')
-        output = output.replace('Exposures(', 'dict(')
-        output = output.replace('Ticker(', 'dict(')
-        output = output.replace('Vehicle(', 'dict(')
-        output = output.replace('AssetType(', 'dict(')
-        output = output.replace('Sebi(', 'dict(')
-        output = output.replace('Objective(', 'dict(')
-        
-        # Convert string representation to tuple
-        parsed_tuple = ast.literal_eval(output)
-        
-        # Convert dictionaries back to proper objects
-        def convert_dicts(lst, cls):
-            return [cls(**item) if isinstance(item, dict) else item for item in lst]
-        
-        # Create ParsedOutput with the corresponding lists
-        return ParsedOutput(
-            attributes=convert_dicts(parsed_tuple[0], Attributes),
-            exposures=convert_dicts(parsed_tuple[1], Exposures),
-            tickers=convert_dicts(parsed_tuple[2], Ticker),
-            asset_types=convert_dicts(parsed_tuple[3], AssetType),
-            sebi=convert_dicts(parsed_tuple[4], Sebi),
-            vehicles=convert_dicts(parsed_tuple[5], Vehicle) if len(parsed_tuple) > 5 else [],
-            objectives=convert_dicts(parsed_tuple[6], Objective) if len(parsed_tuple) > 6 else []
-        )
-    except Exception as e:
-        print(f"Error parsing original output: {e}")
-        return ParsedOutput()
+def parse_generated_response(response: str) -> Dict:
+    """Extract parsed_output from the generated response JSON"""
+    return json.loads(response)['parsed_output']
 
-def extract_nodes(parsed_output: ParsedOutput) -> Dict[str, Set[str]]:
-    """Extract all nodes from a ParsedOutput object"""
+def parse_original_output(output: str) -> Dict:
+    """Convert an original_parsed_output string (a tuple of model reprs) to a ParsedOutput dict"""
+    # Remove class names from the string to make it valid Python literal
+    output = output.replace('Attributes(', 'dict(')
+    output = output.replace('Exposures(', 'dict(')
+    output = output.replace('Ticker(', 'dict(')
+    output = output.replace('Vehicle(', 'dict(')
+    output = output.replace('AssetType(', 'dict(')
+    output = output.replace('Sebi(', 'dict(')
+    output = output.replace('Objective(', 'dict(')
+    
+    # Convert string representation to tuple
+    parsed_tuple = ast.literal_eval(output)
+    
+    # The reader validates the lists against ParsedOutput
+    return {
+        'attributes': parsed_tuple[0],
+        'exposures': parsed_tuple[1],
+        'tickers': parsed_tuple[2],
+        'asset_types': parsed_tuple[3],
+        'sebi': parsed_tuple[4],
+        'vehicles': parsed_tuple[5] if len(parsed_tuple) > 5 else [],
+        'objectives': parsed_tuple[6] if len(parsed_tuple) > 6 else []
+    }
+
+VALIDATION_PARSERS = {
+    'generated_response': parse_generated_response,
+    'original_parsed_output': parse_original_output
+}
+
+def extract_nodes(parsed_output: Optional[Dict]) -> Dict[str, Set[str]]:
+    """Extract all nodes from a validated ParsedOutput dict (None, for a row that failed, has none)"""
+    parsed_output = parsed_output or {}
     nodes = {
-        'attributes': {attr.node for attr in parsed_output.attributes},
-        'exposures': {exp.node for exp in parsed_output.exposures if exp.node},
-        'tickers': {ticker.name for ticker in parsed_output.tickers},
-        'asset_types': {asset.node for asset in parsed_output.asset_types},
-        'sebi': {s.node for s in parsed_output.sebi},
-        'vehicles': {v.node for v in parsed_output.vehicles},
-        'objectives': {obj.node for obj in parsed_output.objectives}
+        'attributes': {attr['node'] for attr in parsed_output.get('attributes', [])},
+        'exposures': {exp['node'] for exp in parsed_output.get('exposures', []) if exp['node']},
+        'tickers': {ticker['name'] for ticker in parsed_output.get('tickers', [])},
+        'asset_types': {asset['node'] for asset in parsed_output.get('asset_types', [])},
+        'sebi': {s['node'] for s in parsed_output.get('sebi', [])},
+        'vehicles': {v['node'] for v in parsed_output.get('vehicles', [])},
+        'objectives': {obj['node'] for obj in parsed_output.get('objectives', [])}
     }
     return nodes
 
-def compare_outputs(generated: ParsedOutput, original: ParsedOutput) -> Tuple[bool, Dict[str, List[str]], Dict[str, List[str]]]:
+def compare_outputs(generated: Optional[Dict], original: Optional[Dict]) -> Tuple[bool, Dict[str, List[str]], Dict[str, List[str]]]:
     """Compare generated and original outputs"""
     generated_nodes = extract_nodes(generated)
     original_nodes = extract_nodes(original)
@@ -87,18 +80,19 @@ def compare_outputs(generated: ParsedOutput, original: ParsedOutput) -> Tuple[bo
     
     return all_matched, missing_nodes, wrong_nodes
 
-def evaluate_results(df: pd.DataFrame) -> pd.DataFrame:
+def evaluate_results(dataset: ParsedDataset) -> pd.DataFrame:
     """Evaluate the results and create output DataFrame"""
     results = []
     
-    for _, row in df.iterrows():
+    for index, row in enumerate(dataset.rows()):
+        # Outputs that failed to parse count as empty, as before
+        for column, error in dataset.errors.get(index, {}).items():
+            print(f"Error parsing {column} of row {index}: {error}")
         try:
-            # Parse outputs
-            generated = parse_generated_response(row['generated_response'])
-            original = parse_original_output(row['original_parsed_output'])
-            
             # Compare outputs
-            all_matched, missing_nodes, wrong_nodes = compare_outputs(generated, original)
+            all_matched, missing_nodes, wrong_nodes = compare_outputs(
+                row['generated_response'], row['original_parsed_output']
+            )
             
             results.append({
                 'query': row['query'],
@@ -118,11 +112,15 @@ def evaluate_results(df: pd.DataFrame) -> pd.DataFrame:
     return pd.DataFrame(results)
 
 def main():
-    # Read input CSV
-    df = pd.read_csv('val_results.csv')
+    # Read input CSV, with both outputs validated against ParsedOutput
+    dataset = read_dataset(
+        'val_results.csv',
+        parsers=VALIDATION_PARSERS,
+        validate=('generated_response', 'original_parsed_output')
+    )
     
     # Evaluate results
-    results_df = evaluate_results(df)
+    results_df = evaluate_results(dataset)
     
     # Save to CSV
     results_df.to_csv('evaluation_results.csv', index=False)